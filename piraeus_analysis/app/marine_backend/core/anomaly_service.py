@@ -0,0 +1,413 @@
+# marine_backend/core/anomaly_service.py
+"""
+Batched CPU inference for the BiLSTM anomaly models.
+
+A model variant is a state dict, a fitted StandardScaler and a config
+(feature_cols, sequence_length, threshold, lstm_units_1/2), all in
+ANOMALY_MODEL_DIR. Windows are built from vessel-sorted rows the same way
+preprocess.py builds them: ``sequence_length`` consecutive fixes of one
+vessel, speed clamped to [0, 100] and course to [0, 360], windows holding a
+NaN speed or course skipped. Every fix gets the model features:
+
+    lat, lon, speed, course     as stored (clamped)
+    hour, day_of_week           UTC, Monday = 0
+    velocity_x, velocity_y      speed * cos(course), speed * sin(course)
+    distance                    degrees moved since the vessel's previous fix
+
+Features are scaled once per fix and windows are gathered from them into
+large batches (the last one padded to a multiple of PAD_MULTIPLE so
+shapes repeat) and run under torch.inference_mode on all cores. The
+network runs eagerly, as a frozen TorchScript trace, or through an ONNX
+export in onnxruntime when it is installed.
+
+Score every window of the given files (or all) and write them under
+ANOMALY_DIR with (from the app directory):
+
+    python -m marine_backend.core.anomaly_service [file ...] [--runtime torchscript]
+"""
+import argparse
+import asyncio
+import functools
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from marine_backend.core.parquet_store import catalog
+from marine_backend.core.readers import iter_vessel_tables
+
+try:
+    import torch
+    from torch import nn
+except ImportError:
+    torch = nn = None
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# piraeus_analysis/models, seen from the app directory (MARINE_ANOMALY_MODEL_DIR)
+ANOMALY_MODEL_DIR = Path(os.environ.get("MARINE_ANOMALY_MODEL_DIR", "../models"))
+ANOMALY_DIR = Path("./marine_backend/anomaly")
+
+# variant -> (state dict, scaler, config)
+MODEL_VARIANTS = {
+    "v1": ("best_bilstm_model.pt", "feature_scaler.pkl", "model_config.pkl"),
+    "v2": ("bilstm_model_v2.pt", "feature_scaler_v2.pkl", "model_config_v2.pkl"),
+}
+DEFAULT_VARIANT = os.environ.get("MARINE_ANOMALY_MODEL", "v2")
+
+RUNTIMES = ("eager", "torchscript", "onnx")
+DEFAULT_RUNTIME = os.environ.get("MARINE_ANOMALY_RUNTIME", "torchscript")
+INFERENCE_THREADS = int(os.environ.get("MARINE_ANOMALY_THREADS", str(os.cpu_count() or 1)))
+BATCH_WINDOWS = 2048
+PAD_MULTIPLE = 64
+
+INPUT_COLUMNS = ["vessel_id", "t", "lat", "lon", "speed", "course"]
+SCORE_SCHEMA = pa.schema([
+    ("vessel_id", pa.string()),
+    ("t_start", pa.int64()),
+    ("t_end", pa.int64()),
+    ("score", pa.float32()),
+    ("anomaly", pa.bool_()),
+])
+
+
+class ModelUnavailable(RuntimeError):
+    """
+    An anomaly model cannot be loaded (torch or the model files missing).
+    """
+
+
+if torch is not None:
+    class BiLSTMDetector(nn.Module):
+        """
+        Two bidirectional LSTMs and a linear head on the last time step;
+        returns the anomaly probability of each window.
+        """
+
+        def __init__(self, input_size: int, lstm_units_1: int, lstm_units_2: int):
+            super().__init__()
+            self.bilstm1 = nn.LSTM(input_size, lstm_units_1, batch_first=True, bidirectional=True)
+            self.bilstm2 = nn.LSTM(2 * lstm_units_1, lstm_units_2, batch_first=True, bidirectional=True)
+            self.fc = nn.Linear(2 * lstm_units_2, 1)
+            self.sigmoid = nn.Sigmoid()
+
+        def forward(self, x: torch.Tensor) -> torch.Tensor:
+            x, _ = self.bilstm1(x)
+            x, _ = self.bilstm2(x)
+            return self.sigmoid(self.fc(x[:, -1, :])).squeeze(-1)
+
+
+def _clamp(x, lo, hi):
+    # same comparisons as preprocess._clamp
+    return np.where(x < lo, lo, np.where(x > hi, hi, x))
+
+
+def point_features(vessel_id: np.ndarray, t: np.ndarray, lat: np.ndarray, lon: np.ndarray,
+                   speed: np.ndarray, course: np.ndarray) -> dict:
+    """
+    Per-fix model features of vessel-sorted rows, by name.
+    """
+    speed = _clamp(speed, 0.0, 100.0)
+    course = _clamp(course, 0.0, 360.0)
+    first = np.r_[True, vessel_id[1:] != vessel_id[:-1]]
+    dlat = np.where(first, 0.0, np.diff(lat, prepend=lat[:1]))
+    dlon = np.where(first, 0.0, np.diff(lon, prepend=lon[:1]))
+    rad = np.radians(course)
+    return {
+        "lat": lat,
+        "lon": lon,
+        "speed": speed,
+        "course": course,
+        "hour": (t // 3_600_000) % 24,
+        "day_of_week": (t // 86_400_000 + 3) % 7,   # 1970-01-01 was a Thursday
+        "velocity_x": speed * np.cos(rad),
+        "velocity_y": speed * np.sin(rad),
+        "distance": np.hypot(dlat, dlon),
+    }
+
+
+def window_starts(vessel_id: np.ndarray, speed: np.ndarray, course: np.ndarray,
+                  window_size: int) -> np.ndarray:
+    """
+    Valid window starts, as in preprocess.compact_columns.
+    """
+    total = len(vessel_id) - window_size + 1
+    if total <= 0:
+        return np.zeros(0, dtype=np.int64)
+    nan = np.isnan(speed) | np.isnan(course)
+    nan_prefix = np.concatenate(([0], np.cumsum(nan, dtype=np.int64)))
+    valid = (
+        (vessel_id[:total] == vessel_id[window_size - 1:])
+        & (nan_prefix[window_size:] == nan_prefix[:total])
+    )
+    return np.flatnonzero(valid).astype(np.int64)
+
+
+class AnomalyModel:
+    """
+    One loaded model variant: network, scaler statistics and config.
+    """
+
+    def __init__(self, variant: str = DEFAULT_VARIANT, model_dir: Path = ANOMALY_MODEL_DIR,
+                 runtime: str = DEFAULT_RUNTIME, threads: int = INFERENCE_THREADS,
+                 batch_windows: int = BATCH_WINDOWS):
+        if variant not in MODEL_VARIANTS:
+            raise ValueError(f"unknown model variant {variant!r}")
+        if runtime not in RUNTIMES:
+            raise ValueError(f"runtime must be one of {RUNTIMES}")
+        if runtime == "onnx" and ort is None:
+            raise RuntimeError("onnx runtime requested but onnxruntime is not importable")
+        if torch is None:
+            raise ModelUnavailable("torch is not installed")
+
+        self.variant = variant
+        self.runtime = runtime
+        self.threads = threads
+        self.batch_windows = batch_windows
+        weights, scaler, config = (Path(model_dir) / name for name in MODEL_VARIANTS[variant])
+
+        with open(config, "rb") as f:
+            self.config = pickle.load(f)
+        with open(scaler, "rb") as f:
+            scaler = pickle.load(f)
+        self.features = list(self.config["feature_cols"])
+        names = list(getattr(scaler, "feature_names_in_", self.features))
+        if names != self.features:
+            raise ValueError(f"scaler features {names} do not match the model's {self.features}")
+        self.mean = np.asarray(scaler.mean_, dtype=np.float64)
+        self.std = np.asarray(scaler.scale_, dtype=np.float64)
+        self.window_size = int(self.config["sequence_length"])
+        self.threshold = float(self.config["threshold"])
+
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # already set, or parallel work has started in this process
+            pass
+
+        net = BiLSTMDetector(
+            len(self.features), int(self.config["lstm_units_1"]), int(self.config["lstm_units_2"])
+        )
+        net.load_state_dict(torch.load(weights, map_location="cpu", weights_only=True))
+        net.eval()
+
+        example = torch.zeros(PAD_MULTIPLE, self.window_size, len(self.features))
+        self._session = None
+        if runtime == "eager":
+            self._net = net
+        elif runtime == "torchscript":
+            with torch.no_grad():
+                traced = torch.jit.trace(net, example)
+            self._net = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        else:
+            self._net = None
+            self._session = self._onnx_session(net, example, weights)
+
+    def _onnx_session(self, net: "nn.Module", example: "torch.Tensor", weights: Path):
+        # exported once per variant, redone when the weights change
+        path = ANOMALY_DIR / f"{self.variant}.onnx"
+        if not path.exists() or path.stat().st_mtime_ns < weights.stat().st_mtime_ns:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            torch.onnx.export(
+                net, example, str(tmp), input_names=["x"], output_names=["score"],
+                dynamic_axes={"x": {0: "batch"}, "score": {0: "batch"}},
+            )
+            tmp.replace(path)
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = self.threads
+        opts.inter_op_num_threads = 1
+        return ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+
+    def _infer(self, x: np.ndarray) -> np.ndarray:
+        if self._session is not None:
+            return self._session.run(None, {"x": x})[0]
+        with torch.inference_mode():
+            return self._net(torch.from_numpy(x)).numpy()
+
+    def scale(self, feats: dict) -> np.ndarray:
+        """
+        [N, features] float32 scaled model input from point_features output.
+        """
+        out = np.empty((len(feats["lat"]), len(self.features)), dtype=np.float32)
+        for j, name in enumerate(self.features):
+            out[:, j] = (feats[name] - self.mean[j]) / self.std[j]
+        return out
+
+    def scaled_features(self, table: pa.Table) -> np.ndarray:
+        """
+        [N, features] float32 scaled features of vessel-sorted rows.
+        """
+        return self.scale(point_features(**{c: table[c].to_numpy(zero_copy_only=False) for c in INPUT_COLUMNS}))
+
+    def score_windows(self, windows: np.ndarray) -> np.ndarray:
+        """
+        Scores of ready-made [B, window_size, features] float32 windows, in
+        batches of ``batch_windows`` padded like score_table's.
+        """
+        scores = np.empty(len(windows), dtype=np.float32)
+        for lo in range(0, len(windows), self.batch_windows):
+            x = windows[lo:lo + self.batch_windows]
+            n = len(x)
+            padded = -(-n // PAD_MULTIPLE) * PAD_MULTIPLE
+            if padded > n:
+                x = np.concatenate([x, np.zeros((padded - n,) + x.shape[1:], dtype=np.float32)])
+            scores[lo:lo + n] = self._infer(np.ascontiguousarray(x, dtype=np.float32))[:n]
+        return scores
+
+    def score_table(self, table: pa.Table) -> tuple[pa.Table, dict]:
+        """
+        Score every valid window of vessel-sorted rows.
+
+        Returns (table of vessel_id, t_start, t_end, score, anomaly, stats
+        with windows, seconds and windows_per_sec of the inference).
+        """
+        w = self.window_size
+        vessel_id = table["vessel_id"].to_numpy(zero_copy_only=False)
+        t = table["t"].to_numpy()
+        starts = window_starts(
+            vessel_id, table["speed"].to_numpy(zero_copy_only=False),
+            table["course"].to_numpy(zero_copy_only=False), w,
+        )
+
+        scores = np.empty(len(starts), dtype=np.float32)
+        t0 = time.perf_counter()
+        if len(starts):
+            feats = self.scaled_features(table)
+            steps = np.arange(w)
+            batch = min(self.batch_windows, -(-len(starts) // PAD_MULTIPLE) * PAD_MULTIPLE)
+            buf = np.zeros((batch, w, len(self.features)), dtype=np.float32)
+            for lo in range(0, len(starts), batch):
+                idx = starts[lo:lo + batch]
+                n = len(idx)
+                np.take(feats, idx[:, None] + steps, axis=0, out=buf[:n])
+                padded = min(batch, -(-n // PAD_MULTIPLE) * PAD_MULTIPLE)
+                buf[n:padded] = 0.0
+                scores[lo:lo + n] = self._infer(buf[:padded])[:n]
+        seconds = time.perf_counter() - t0
+
+        result = pa.table({
+            "vessel_id": vessel_id[starts],
+            "t_start": t[starts],
+            "t_end": t[starts + w - 1],
+            "score": scores,
+            "anomaly": scores >= self.threshold,
+        }, schema=SCORE_SCHEMA)
+        stats = {
+            "windows": len(starts),
+            "seconds": seconds,
+            "windows_per_sec": len(starts) / seconds if seconds > 0 else 0.0,
+        }
+        return result, stats
+
+
+class AnomalyService:
+    """
+    Holds the anomaly models for the lifetime of the server, loaded on first
+    use, so a missing torch or model file fails only the anomaly routes.
+    Inference runs on one dedicated thread, since every call already uses
+    all cores.
+    """
+
+    def __init__(self, model_dir: Path = ANOMALY_MODEL_DIR, runtime: str = DEFAULT_RUNTIME):
+        self.model_dir = model_dir
+        self.runtime = runtime
+        self._models = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="anomaly")
+
+    def model(self, variant: str = DEFAULT_VARIANT) -> AnomalyModel:
+        """
+        Loaded model of a variant; raises ModelUnavailable when it cannot be
+        loaded (retried on the next call).
+        """
+        with self._lock:
+            if variant not in self._models:
+                try:
+                    self._models[variant] = AnomalyModel(variant, self.model_dir, self.runtime)
+                except OSError as e:
+                    raise ModelUnavailable(f"cannot load anomaly model {variant}: {e}") from e
+            return self._models[variant]
+
+    async def run(self, fn, *args):
+        """
+        Run a blocking call on the inference thread.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    async def score(self, table: pa.Table, variant: str = DEFAULT_VARIANT) -> tuple[pa.Table, dict]:
+        return await self.run(lambda: self.model(variant).score_table(table))
+
+
+anomaly_service = AnomalyService()
+
+
+def scores_path(file: str, variant: str) -> Path:
+    return ANOMALY_DIR / f"{file}.{variant}.scores.parquet"
+
+
+def score_file(file: str, model: AnomalyModel) -> tuple[Path, dict]:
+    """
+    Score every window of a file, vessel group by vessel group, and write
+    the scores; returns the path and the inference totals.
+    """
+    meta = catalog.meta(file)
+    parts = []
+    windows, seconds = 0, 0.0
+    for table in iter_vessel_tables(file, INPUT_COLUMNS):
+        scores, stats = model.score_table(table)
+        parts.append(scores)
+        windows += stats["windows"]
+        seconds += stats["seconds"]
+
+    out = pa.concat_tables(parts) if parts else SCORE_SCHEMA.empty_table()
+    out = out.replace_schema_metadata({
+        "source_mtime_ns": str(meta.mtime_ns),
+        "source_size": str(meta.size),
+        "variant": model.variant,
+        "threshold": str(model.threshold),
+    })
+
+    path = scores_path(file, model.variant)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    pq.write_table(out, tmp, use_dictionary=["vessel_id"], compression="zstd")
+    tmp.replace(path)
+    return path, {
+        "windows": windows,
+        "seconds": seconds,
+        "windows_per_sec": windows / seconds if seconds > 0 else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score AIS windows with a BiLSTM anomaly model.")
+    parser.add_argument("files", nargs="*", help="parquet files (default: all)")
+    parser.add_argument("--model", default=DEFAULT_VARIANT, choices=sorted(MODEL_VARIANTS))
+    parser.add_argument("--model-dir", default=str(ANOMALY_MODEL_DIR))
+    parser.add_argument("--runtime", default=DEFAULT_RUNTIME, choices=RUNTIMES)
+    parser.add_argument("--threads", type=int, default=INFERENCE_THREADS)
+    parser.add_argument("--batch-windows", type=int, default=BATCH_WINDOWS)
+    args = parser.parse_args()
+
+    model = AnomalyModel(args.model, Path(args.model_dir), args.runtime, args.threads, args.batch_windows)
+    total_windows, total_seconds = 0, 0.0
+    for name in args.files or catalog.files():
+        path, stats = score_file(name, model)
+        total_windows += stats["windows"]
+        total_seconds += stats["seconds"]
+        print(f"{name} -> {path} | windows={stats['windows']} {stats['windows_per_sec']:.0f} windows/s")
+    if total_seconds > 0:
+        print(f"total windows={total_windows} {total_windows / total_seconds:.0f} windows/s "
+              f"({args.runtime}, {args.threads} threads)")
@@ -0,0 +1,205 @@
+# marine_backend/core/cache.py
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+from marine_backend.core.executor import run_io
+from marine_backend.core.parquet_store import catalog
+
+# In-memory budget (MARINE_CACHE_MB) and optional on-disk tier
+# (MARINE_CACHE_DIR, off unless set, e.g. ./marine_backend/cache; MARINE_CACHE_DISK_MB).
+CACHE_MAX_BYTES = int(os.environ.get("MARINE_CACHE_MB", "256")) * 1024 * 1024
+CACHE_DIR = os.environ.get("MARINE_CACHE_DIR", "")
+CACHE_DISK_MAX_BYTES = int(os.environ.get("MARINE_CACHE_DISK_MB", "2048")) * 1024 * 1024
+
+# puts between rescans of the disk tier, to pick up other workers' writes
+DISK_RESCAN_PUTS = 256
+# over budget, the disk tier is trimmed to this fraction of it, so trims are rare
+DISK_TRIM_TO = 0.9
+
+_MISSING = object()
+
+
+class ResultCache:
+    """
+    LRU cache for route results, bounded by the pickled size of its entries.
+
+    Keys cover the route name, every query parameter and the mtime/size of
+    the parquet files the result was computed from, so a rewritten file
+    never serves stale results. With ``disk_dir`` set, entries are also
+    written there (shared by all workers and kept across restarts), with
+    the oldest files removed beyond ``disk_max_bytes``. Disk usage is
+    counted as entries are written and only rescanned every
+    DISK_RESCAN_PUTS puts or when over budget.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, tuple[object, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_bytes = None   # this worker's running estimate, None until scanned
+        self._disk_puts = 0
+
+    @staticmethod
+    def make_key(namespace: str, params: dict, files: list[str] = ()) -> str:
+        fingerprints = []
+        for file in files:
+            st = catalog.path(file).stat()
+            fingerprints.append([file, st.st_mtime_ns, st.st_size])
+        raw = json.dumps([namespace, params, fingerprints], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.pkl"
+
+    def get(self, key: str):
+        """
+        Return the cached value or the module-level _MISSING sentinel.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                data = path.read_bytes()
+                value = pickle.loads(data)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                data = None
+            if data is not None:
+                self._remember(key, value, len(data))
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return _MISSING
+
+    def _remember(self, key: str, value, size: int):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def put(self, key: str, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, value, len(data))
+
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+
+            with self._lock:
+                self._disk_puts += 1
+                rescan = self._disk_bytes is None or self._disk_puts >= DISK_RESCAN_PUTS
+                if not rescan:
+                    self._disk_bytes += len(data)
+                over = rescan or self._disk_bytes > self.disk_max_bytes
+            if over:
+                self._trim_disk()
+
+    def _disk_files(self) -> list:
+        files = []
+        for p in self.disk_dir.glob("*/*.pkl"):
+            try:
+                files.append((p.stat(), p))
+            except OSError:
+                # removed by another worker
+                continue
+        return files
+
+    def _trim_disk(self):
+        files = self._disk_files()
+        total = sum(st.st_size for st, _ in files)
+        if total > self.disk_max_bytes:
+            target = self.disk_max_bytes * DISK_TRIM_TO
+            for st, p in sorted(files, key=lambda f: f[0].st_mtime_ns):
+                try:
+                    p.unlink()
+                except OSError:
+                    continue
+                total -= st.st_size
+                if total <= target:
+                    break
+        with self._lock:
+            self._disk_bytes = total
+            self._disk_puts = 0
+
+    def get_or_compute(self, namespace: str, params: dict, files: list[str], compute: Callable):
+        """
+        Return the cached result for (namespace, params, files) or compute
+        and store it.
+        """
+        key = self.make_key(namespace, params, files)
+        value = self.get(key)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    async def get_or_compute_async(self, namespace: str, params: dict, files: list[str], compute: Callable):
+        """
+        Same as get_or_compute for a coroutine function ``compute``. The
+        lookup and the store (file stats, disk I/O, pickling) run in the
+        shared I/O pool.
+        """
+        key = await run_io(self.make_key, namespace, params, files)
+        value = await run_io(self.get, key)
+        if value is _MISSING:
+            value = await compute()
+            await run_io(self.put, key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            out = {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+        if self.disk_dir is not None:
+            files = self._disk_files()
+            out["disk_entries"] = len(files)
+            out["disk_bytes"] = sum(st.st_size for st, _ in files)
+            out["disk_max_bytes"] = self.disk_max_bytes
+        return out
+
+
+result_cache = ResultCache(disk_dir=CACHE_DIR or None)
@@ -0,0 +1,38 @@
+# marine_backend/core/executor.py
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator
+
+# Threads shared by all routes for blocking parquet I/O (MARINE_IO_WORKERS)
+IO_WORKERS = int(os.environ.get("MARINE_IO_WORKERS", str(min(16, 2 * (os.cpu_count() or 1)))))
+
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="parquet-io")
+
+_DONE = object()
+
+
+async def run_io(fn: Callable, *args, **kwargs):
+    """
+    Run a blocking call in the shared I/O pool without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def iterate_io(it: Iterator) -> AsyncIterator:
+    """
+    Drive a blocking iterator from the shared I/O pool, one item at a time.
+    The iterator is closed if the consumer stops early.
+    """
+    try:
+        while True:
+            item = await run_io(next, it, _DONE)
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        close = getattr(it, "close", None)
+        if close is not None:
+            await run_io(close)
@@ -0,0 +1,210 @@
+# marine_backend/core/heatmap_tiles.py
+"""
+Precomputed heatmap count cubes.
+
+For every parquet file and every cell size in TILE_CELL_SIZES, the build step
+stores the number of points per (time bucket, grid cell) of the grid over
+FIXED_BOUNDS as a sparse CSR matrix: one row per bucket, one column per
+cell. A query over any time window sums the fully covered buckets and bins
+only the raw points in the partial buckets at the window edges, read from
+the file's time-sorted copy (see csv_to_parquet.py). Without that copy the
+vessel-sorted file cannot be pruned by time, so the window is rounded to
+whole buckets instead of rescanning the file.
+
+Build with (from the app directory):
+
+    python -m marine_backend.core.heatmap_tiles [file ...]
+"""
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pyarrow.compute as pc
+
+from marine_backend.core.parquet_store import catalog
+from marine_backend.core.readers import read_time_window
+
+FIXED_BOUNDS = {
+    "min_lat": 37.45947, "max_lat": 38.03808166666671,
+    "min_lon": 23.0350833333333, "max_lon": 23.8806466666667
+}
+
+TILES_DIR = Path("./marine_backend/tiles")
+TILE_CELL_SIZES = (0.001, 0.005, 0.01)
+TILE_BUCKET_MS = 3_600_000  # hourly buckets
+
+
+def grid_edges(cell_size: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Latitude and longitude bin edges of the grid over FIXED_BOUNDS.
+    """
+    lat_bins = np.arange(FIXED_BOUNDS["min_lat"], FIXED_BOUNDS["max_lat"] + cell_size, cell_size)
+    lon_bins = np.arange(FIXED_BOUNDS["min_lon"], FIXED_BOUNDS["max_lon"] + cell_size, cell_size)
+    return lat_bins, lon_bins
+
+
+def bin_cells(lat: np.ndarray, lon: np.ndarray, lat_bins: np.ndarray, lon_bins: np.ndarray) -> np.ndarray:
+    """
+    Linear cell index (lat-major) of each point; -1 for points off the grid.
+    """
+    n_lat, n_lon = len(lat_bins) - 1, len(lon_bins) - 1
+    lat_idx = np.searchsorted(lat_bins, lat, side='right') - 1
+    lon_idx = np.searchsorted(lon_bins, lon, side='right') - 1
+    mask = (lat_idx >= 0) & (lat_idx < n_lat) & (lon_idx >= 0) & (lon_idx < n_lon)
+    return np.where(mask, lat_idx * n_lon + lon_idx, -1)
+
+
+def raw_counts(file: str, start_ts: int, end_ts: int, cell_size: float) -> np.ndarray:
+    """
+    Bin raw points of a time window into a flat count grid, reading the
+    time-sorted copy of the file when there is one.
+    """
+    lat_bins, lon_bins = grid_edges(cell_size)
+    n_cells = (len(lat_bins) - 1) * (len(lon_bins) - 1)
+    if start_ts > end_ts:
+        return np.zeros(n_cells, dtype=np.int64)
+
+    # the grid reaches up to one cell past FIXED_BOUNDS: prune on its edges,
+    # bin_cells drops what falls off it
+    table = read_time_window(
+        catalog.time_file(file) or file, start_ts, end_ts,
+        columns=["lat", "lon"],
+        lat_range=(lat_bins[0], lat_bins[-1]),
+        lon_range=(lon_bins[0], lon_bins[-1]),
+    )
+    cells = bin_cells(table["lat"].to_numpy(), table["lon"].to_numpy(), lat_bins, lon_bins)
+    return np.bincount(cells[cells >= 0], minlength=n_cells)
+
+
+def tiles_path(file: str) -> Path:
+    return TILES_DIR / f"{file}.tiles.npz"
+
+
+def build_tiles(file: str, cell_sizes=TILE_CELL_SIZES, bucket_ms: int = TILE_BUCKET_MS) -> Path:
+    """
+    Build the count cubes of one parquet file and write them next to the
+    other tiles. Row groups are processed one at a time.
+    """
+    meta = catalog.meta(file)
+    grids = [grid_edges(cs) for cs in cell_sizes]
+    parts = [([], []) for _ in cell_sizes]   # per cell size: (keys, counts)
+
+    pq_file = catalog.open(file)
+    for g in range(meta.num_row_groups):
+        table = pq_file.read_row_group(g, columns=["t", "lat", "lon"])
+        table = table.filter(pc.and_(pc.is_valid(table["lat"]), pc.is_valid(table["lon"])))
+        if table.num_rows == 0:
+            continue
+        t = table["t"].to_numpy()
+        lat = table["lat"].to_numpy()
+        lon = table["lon"].to_numpy()
+        bucket = t // bucket_ms
+
+        for (lat_bins, lon_bins), (keys, counts) in zip(grids, parts):
+            n_cells = (len(lat_bins) - 1) * (len(lon_bins) - 1)
+            cells = bin_cells(lat, lon, lat_bins, lon_bins)
+            ok = cells >= 0
+            k, c = np.unique(bucket[ok] * n_cells + cells[ok], return_counts=True)
+            keys.append(k)
+            counts.append(c)
+
+    out = {
+        "bucket_ms": np.int64(bucket_ms),
+        "cell_sizes": np.asarray(cell_sizes, dtype=np.float64),
+        "source_mtime_ns": np.int64(meta.mtime_ns),
+        "source_size": np.int64(meta.size),
+    }
+    for i, ((lat_bins, lon_bins), (keys, counts)) in enumerate(zip(grids, parts)):
+        n_cells = (len(lat_bins) - 1) * (len(lon_bins) - 1)
+        if keys:
+            k = np.concatenate(keys)
+            c = np.concatenate(counts)
+            k, inv = np.unique(k, return_inverse=True)
+            c = np.bincount(inv, weights=c).astype(np.int64)
+        else:
+            k = np.zeros(0, dtype=np.int64)
+            c = np.zeros(0, dtype=np.int64)
+
+        bucket, cell = np.divmod(k, n_cells)
+        buckets, starts = np.unique(bucket, return_index=True)
+        out[f"buckets_{i}"] = buckets
+        out[f"indptr_{i}"] = np.append(starts, len(k)).astype(np.int64)
+        out[f"cells_{i}"] = cell.astype(np.int32)
+        out[f"counts_{i}"] = c
+
+    path = tiles_path(file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(tmp, **out)
+    tmp.replace(path)
+    return path
+
+
+@lru_cache(maxsize=16)
+def _load_tiles(path: str, mtime_ns: int) -> dict:
+    with np.load(path) as npz:
+        return {k: npz[k] for k in npz.files}
+
+
+def tile_counts(file: str, start_ts: int, end_ts: int, cell_size: float) -> Optional[tuple[np.ndarray, int, int]]:
+    """
+    Flat count grid for a time window from the precomputed cubes, with the
+    window it covers: the requested one when the partial edge buckets can be
+    read from the time-sorted copy, else the window rounded to the nearest
+    bucket bounds (at least one bucket).
+
+    Returns None when no up-to-date tiles exist for this file and cell size.
+    """
+    path = tiles_path(file)
+    if not path.exists():
+        return None
+    tiles = _load_tiles(str(path), path.stat().st_mtime_ns)
+
+    meta = catalog.meta(file)
+    if tiles["source_mtime_ns"] != meta.mtime_ns or tiles["source_size"] != meta.size:
+        return None
+
+    match = np.flatnonzero(np.isclose(tiles["cell_sizes"], cell_size))
+    if len(match) == 0:
+        return None
+    i = int(match[0])
+
+    lat_bins, lon_bins = grid_edges(cell_size)
+    n_cells = (len(lat_bins) - 1) * (len(lon_bins) - 1)
+    bucket_ms = int(tiles["bucket_ms"])
+    buckets = tiles[f"buckets_{i}"]
+    exact = catalog.time_file(file) is not None
+
+    if exact:
+        # buckets lying entirely inside [start_ts, end_ts]
+        first = -(-start_ts // bucket_ms)
+        last = (end_ts + 1) // bucket_ms - 1
+    else:
+        first = (start_ts + bucket_ms // 2) // bucket_ms
+        last = (end_ts + 1 + bucket_ms // 2) // bucket_ms - 1
+        if first > last:
+            first = last = (start_ts // 2 + end_ts // 2) // bucket_ms
+        start_ts, end_ts = first * bucket_ms, (last + 1) * bucket_ms - 1
+
+    lo, hi = np.searchsorted(buckets, [first, last + 1]) if first <= last else (0, 0)
+    indptr = tiles[f"indptr_{i}"]
+    a, b = indptr[lo], indptr[hi]
+    grid = np.bincount(
+        tiles[f"cells_{i}"][a:b], weights=tiles[f"counts_{i}"][a:b], minlength=n_cells
+    ).astype(np.int64)
+
+    if exact:
+        # partial buckets at either edge come from the raw points
+        if first > last:
+            grid += raw_counts(file, start_ts, end_ts, cell_size)
+        else:
+            grid += raw_counts(file, start_ts, first * bucket_ms - 1, cell_size)
+            grid += raw_counts(file, (last + 1) * bucket_ms, end_ts, cell_size)
+    return grid, start_ts, end_ts
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or catalog.files():
+        print(f"{name} -> {build_tiles(name)}")
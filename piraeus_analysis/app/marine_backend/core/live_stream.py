@@ -0,0 +1,480 @@
+# marine_backend/core/live_stream.py
+"""
+Incremental anomaly scoring of live AIS messages.
+
+Messages (vessel_id, t, lat, lon, speed, course) are pushed in batches.
+VesselRings keeps, for every vessel, the scaled model features of its last
+``window_size`` fixes in one preallocated [vessels, window_size, features]
+float32 array used as a ring per vessel; a fix is featurized once, on
+arrival, with anomaly_service.point_features, so live windows are the
+windows the batch path builds. Fixes not newer than the vessel's newest are
+dropped as late.
+
+A vessel with a full ring and ``score_every`` new fixes is queued once,
+however many fixes arrive before it is scored. Every queued vessel costs
+one window_size-step BiLSTM window, so with score_every=1 sustaining N
+msgs/s from distinct vessels takes about N windows/s of inference; raise
+LIVE_SCORE_EVERY (MARINE_LIVE_SCORE_EVERY) when the model cannot. Every
+tick (LIVE_TICK_MS) LiveDetector scores up to LIVE_MAX_BATCH queued
+vessels, oldest first, in one batch, so a fix waits at most a tick plus
+the inference of one batch while ingest keeps up. Vessels idle for LIVE_IDLE_MS of data time give
+their ring back.
+
+Replay a Piraeus CSV at N x real time, into a running server (--url) or
+into an in-process detector that reports throughput and latency, with
+(from the app directory):
+
+    python -m marine_backend.core.live_stream CSV [--speedup 60] [--url http://localhost:8000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from marine_backend.core.anomaly_service import (
+    DEFAULT_VARIANT, SCORE_SCHEMA, AnomalyModel, anomaly_service, point_features,
+)
+from marine_backend.core.executor import run_io
+from marine_backend.utils.stream_format import ARROW_STREAM
+
+LIVE_TICK_MS = 50
+LIVE_MAX_BATCH = 1024
+LIVE_IDLE_MS = 3_600_000
+LIVE_SCORE_EVERY = int(os.environ.get("MARINE_LIVE_SCORE_EVERY", "1"))   # new fixes per rescore
+LIVE_SUBSCRIBER_QUEUE = 64   # score batches held per subscriber, oldest dropped
+
+MESSAGE_COLUMNS = ["vessel_id", "t", "lat", "lon", "speed", "course"]
+
+logger = logging.getLogger(__name__)
+
+
+class VesselRings:
+    """
+    Last ``window_size`` scaled fixes of every live vessel.
+    """
+
+    def __init__(self, window_size: int, num_features: int, capacity: int = 1024):
+        self.window_size = window_size
+        self.num_features = num_features
+        self.slots = {}       # vessel_id -> slot
+        self.vessels = []     # slot -> vessel_id, None when free
+        self.free = []
+        self.feats = np.zeros((0, window_size, num_features), dtype=np.float32)
+        self.t = np.zeros((0, window_size), dtype=np.int64)
+        self.head = np.zeros(0, dtype=np.int64)    # next write position
+        self.count = np.zeros(0, dtype=np.int64)   # fixes ever written
+        self.last_t = np.zeros(0, dtype=np.int64)
+        self.last_lat = np.zeros(0, dtype=np.float64)
+        self.last_lon = np.zeros(0, dtype=np.float64)
+        self._grow(capacity)
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _grow(self, capacity: int):
+        n = len(self.head)
+        if capacity <= n:
+            return
+
+        def grown(a, fill=0):
+            out = np.full((capacity,) + a.shape[1:], fill, dtype=a.dtype)
+            out[:n] = a
+            return out
+
+        self.feats = grown(self.feats)
+        self.t = grown(self.t)
+        self.head = grown(self.head)
+        self.count = grown(self.count)
+        self.last_t = grown(self.last_t, np.iinfo(np.int64).min)
+        self.last_lat = grown(self.last_lat)
+        self.last_lon = grown(self.last_lon)
+        self.vessels.extend([None] * (capacity - n))
+        self.free.extend(range(capacity - 1, n - 1, -1))
+
+    def slot_of(self, vessel_ids) -> np.ndarray:
+        """
+        Slot of every id, allocating slots for new vessels.
+        """
+        slots = self.slots
+        out = np.empty(len(vessel_ids), dtype=np.int64)
+        for i, v in enumerate(vessel_ids):
+            s = slots.get(v)
+            if s is None:
+                if not self.free:
+                    self._grow(2 * len(self.head))
+                s = self.free.pop()
+                slots[v] = s
+                self.vessels[s] = v
+            out[i] = s
+        return out
+
+    def append(self, vessel_id, t, lat, lon, speed, course, scale) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Append a batch of fixes (any order); ``scale`` maps point_features
+        output to model input. Returns (slots written, new fixes per slot).
+        """
+        slots = self.slot_of(vessel_id)
+        order = np.lexsort((t, slots))
+        slots, t, lat, lon, speed, course = (
+            a[order] for a in (slots, t, lat, lon, speed, course)
+        )
+
+        # newer than the vessel's newest fix; one fix per vessel and t
+        first = np.r_[True, slots[1:] != slots[:-1]]
+        ok = (t > self.last_t[slots]) & (first | (t > np.r_[0, t[:-1]]))
+        if not ok.all():
+            slots, t, lat, lon, speed, course = (a[ok] for a in (slots, t, lat, lon, speed, course))
+        n = len(slots)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+        group = slots[starts]
+
+        # featurize with each vessel's previous fix in front, for 'distance'
+        ins = starts[self.count[group] > 0]
+        prev = group[self.count[group] > 0]
+        feats = point_features(
+            np.insert(slots, ins, prev),
+            np.insert(t, ins, self.last_t[prev]),
+            np.insert(lat, ins, self.last_lat[prev]),
+            np.insert(lon, ins, self.last_lon[prev]),
+            np.insert(speed, ins, 0.0),
+            np.insert(course, ins, 0.0),
+        )
+        keep = np.ones(n + len(ins), dtype=bool)
+        keep[ins + np.arange(len(ins))] = False
+        x = scale({k: v[keep] for k, v in feats.items()})
+
+        # only the last window_size fixes of a vessel land in its ring
+        w = self.window_size
+        rank = np.arange(n) - np.repeat(starts, sizes)
+        last = rank >= np.repeat(sizes, sizes) - w
+        pos = (self.head[slots] + rank) % w
+        self.feats[slots[last], pos[last]] = x[last]
+        self.t[slots[last], pos[last]] = t[last]
+
+        ends = starts + sizes - 1
+        self.head[group] = (self.head[group] + sizes) % w
+        self.count[group] += sizes
+        self.last_t[group] = t[ends]
+        self.last_lat[group] = lat[ends]
+        self.last_lon[group] = lon[ends]
+        return group, sizes
+
+    def windows(self, slots: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (windows [B, window_size, features], t_start, t_end) of full rings,
+        oldest fix first.
+        """
+        w = self.window_size
+        head = self.head[slots]
+        idx = (head[:, None] + np.arange(w)) % w
+        return (
+            self.feats[slots[:, None], idx],
+            self.t[slots, head],
+            self.t[slots, (head - 1) % w],
+        )
+
+    def evict(self, before_t: int) -> list:
+        """
+        Free the rings of vessels whose newest fix is older than ``before_t``;
+        returns their slots.
+        """
+        live = np.array([v is not None for v in self.vessels])
+        idle = np.flatnonzero(live & (self.last_t < before_t))
+        for s in idle.tolist():
+            del self.slots[self.vessels[s]]
+            self.vessels[s] = None
+            self.free.append(s)
+        self.head[idle] = 0
+        self.count[idle] = 0
+        self.last_t[idle] = np.iinfo(np.int64).min
+        return idle.tolist()
+
+
+class LiveDetector:
+    """
+    Thread-safe ingest plus batched scoring of the vessels with new fixes.
+    """
+
+    def __init__(self, model: AnomalyModel, max_batch: int = LIVE_MAX_BATCH, score_every: int = LIVE_SCORE_EVERY,
+                 idle_ms: int = LIVE_IDLE_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.score_every = score_every
+        self.idle_ms = idle_ms
+        self.rings = VesselRings(model.window_size, len(model.features))
+        self._since = np.zeros(len(self.rings.head), dtype=np.int64)   # fixes since last score
+        self._pending = {}   # slot -> arrival time of its oldest unscored fix, oldest first
+        self._lock = threading.Lock()
+        self._newest_t = np.iinfo(np.int64).min
+        self.messages = 0
+        self.late = 0
+        self.windows = 0
+        self.infer_seconds = 0.0
+
+    def push(self, vessel_id, t, lat, lon, speed, course) -> int:
+        """
+        Ingest a batch of messages (equal-length arrays); returns how many
+        were accepted.
+        """
+        t = np.asarray(t, dtype=np.int64)
+        arrays = [np.asarray(a, dtype=np.float64) for a in (lat, lon, speed, course)]
+        now = time.perf_counter()
+        with self._lock:
+            slots, sizes = self.rings.append(list(vessel_id), t, *arrays, scale=self.model.scale)
+            if len(self._since) < len(self.rings.head):
+                self._since = np.concatenate(
+                    [self._since, np.zeros(len(self.rings.head) - len(self._since), dtype=np.int64)]
+                )
+            self._since[slots] += sizes
+            due = slots[
+                (self.rings.count[slots] >= self.rings.window_size) & (self._since[slots] >= self.score_every)
+            ]
+            for s in due.tolist():
+                self._pending.setdefault(s, now)
+
+            accepted = int(sizes.sum())
+            self.messages += len(t)
+            self.late += len(t) - accepted
+            if len(t):
+                self._newest_t = max(self._newest_t, int(t.max()))
+        return accepted
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            freed = self.rings.evict(self._newest_t - self.idle_ms)
+            for s in freed:
+                self._pending.pop(s, None)
+            self._since[freed] = 0
+        return len(freed)
+
+    def score_pending(self) -> tuple[pa.Table, dict]:
+        """
+        Score up to ``max_batch`` queued vessels, oldest first. Returns the
+        scores (SCORE_SCHEMA) and batch stats, latency from arrival to score.
+        """
+        with self._lock:
+            slots = []
+            arrived = []
+            for s, t0 in self._pending.items():
+                slots.append(s)
+                arrived.append(t0)
+                if len(slots) == self.max_batch:
+                    break
+            for s in slots:
+                del self._pending[s]
+            slots = np.asarray(slots, dtype=np.int64)
+            self._since[slots] = 0
+            windows, t_start, t_end = self.rings.windows(slots)
+            vessels = [self.rings.vessels[s] for s in slots.tolist()]
+
+        ok = ~np.isnan(windows).any(axis=(1, 2))
+        t0 = time.perf_counter()
+        scores = self.model.score_windows(windows[ok]) if ok.any() else np.zeros(0, np.float32)
+        done = time.perf_counter()
+        self.windows += len(scores)
+        self.infer_seconds += done - t0
+
+        latency = (done - np.asarray(arrived)[ok]) * 1000 if ok.any() else np.zeros(0)
+        table = pa.table({
+            "vessel_id": np.asarray(vessels, dtype=object)[ok],
+            "t_start": t_start[ok],
+            "t_end": t_end[ok],
+            "score": scores,
+            "anomaly": scores >= self.model.threshold,
+        }, schema=SCORE_SCHEMA)
+        return table, {
+            "windows": len(scores),
+            "latency_ms_max": float(latency.max()) if len(latency) else 0.0,
+            "latency_ms_p50": float(np.median(latency)) if len(latency) else 0.0,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "messages": self.messages,
+            "late": self.late,
+            "vessels": len(self.rings),
+            "pending": self.pending,
+            "windows": self.windows,
+            "windows_per_sec": self.windows / self.infer_seconds if self.infer_seconds > 0 else 0.0,
+        }
+
+
+class LiveService:
+    """
+    Server-side LiveDetector: scores on the anomaly inference thread every
+    tick and fans score batches out to subscribers through bounded queues.
+    """
+
+    def __init__(self, variant: str = DEFAULT_VARIANT, tick_ms: int = LIVE_TICK_MS,
+                 score_every: int = LIVE_SCORE_EVERY):
+        self.variant = variant
+        self.tick_ms = tick_ms
+        self.score_every = score_every
+        self.detector = None
+        self._subscribers = set()
+        self._worker = None
+
+    async def start(self):
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def push(self, columns: dict) -> int:
+        """
+        Ingest a batch of message columns; raises ModelUnavailable while the
+        model cannot be loaded.
+        """
+        if self.detector is None:
+            model = await anomaly_service.run(anomaly_service.model, self.variant)
+            if self.detector is None:
+                self.detector = LiveDetector(model, score_every=self.score_every)
+        return await run_io(self.detector.push, *(columns[c] for c in MESSAGE_COLUMNS))
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=LIVE_SUBSCRIBER_QUEUE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _publish(self, message: dict):
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def _run(self):
+        last_evict = time.monotonic()
+        while True:
+            detector = self.detector
+            if detector is None or detector.pending == 0:
+                await asyncio.sleep(self.tick_ms / 1000)
+                continue
+
+            # a failing tick is logged and skipped; cancellation still ends the loop
+            try:
+                table, stats = await anomaly_service.run(detector.score_pending)
+                if table.num_rows and self._subscribers:
+                    self._publish({"type": "scores", **stats, "scores": table.to_pylist()})
+                if time.monotonic() - last_evict > 60:
+                    last_evict = time.monotonic()
+                    await anomaly_service.run(detector.evict_idle)
+            except Exception:
+                logger.exception("live scoring tick failed")
+                await asyncio.sleep(self.tick_ms / 1000)
+                continue
+            if detector.pending < detector.max_batch:
+                await asyncio.sleep(self.tick_ms / 1000)
+
+    def stats(self) -> dict:
+        out = self.detector.stats() if self.detector is not None else {}
+        out["subscribers"] = len(self._subscribers)
+        return out
+
+
+live_service = LiveService()
+
+
+def _csv_chunks(path: str, chunk_rows: int):
+    # time-ordered CSVs; each chunk is sorted, fixes arriving later than
+    # their vessel's newest are dropped as late by the detector
+    for df in pd.read_csv(path, usecols=MESSAGE_COLUMNS, dtype={"vessel_id": str}, chunksize=chunk_rows):
+        yield df.sort_values("t", kind="stable")
+
+
+def _post(url: str, df: pd.DataFrame):
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    req = urllib.request.Request(
+        f"{url}/live/messages", data=sink.getvalue().to_pybytes(),
+        headers={"Content-Type": ARROW_STREAM}, method="POST",
+    )
+    with urllib.request.urlopen(req) as resp:
+        resp.read()
+
+
+def replay_csv(path: str, speedup: float, url: str = None, detector: LiveDetector = None,
+               tick_ms: int = LIVE_TICK_MS, chunk_rows: int = 200_000) -> dict:
+    """
+    Send the messages of a CSV in data-time order, ``speedup`` x real time
+    (0: as fast as possible), every ``tick_ms`` to a server or a detector.
+    """
+    wall0 = time.perf_counter()
+    data0 = None
+    sent = 0
+    latencies = []
+    for df in _csv_chunks(path, chunk_rows):
+        t = df["t"].to_numpy()
+        if data0 is None:
+            data0 = int(t[0])
+        lo = 0
+        while lo < len(df):
+            if speedup > 0:
+                now_data = data0 + (time.perf_counter() - wall0) * 1000 * speedup
+                hi = int(np.searchsorted(t, now_data, side="right"))
+                if hi == lo:
+                    time.sleep(tick_ms / 1000)
+                    continue
+            else:
+                hi = min(len(df), lo + LIVE_MAX_BATCH * 8)
+            part = df.iloc[lo:hi]
+            if url is not None:
+                _post(url, part)
+            else:
+                detector.push(*(part[c].to_numpy() for c in MESSAGE_COLUMNS))
+                while detector.pending:
+                    _, stats = detector.score_pending()
+                    latencies.append(stats["latency_ms_max"])
+            sent += hi - lo
+            lo = hi
+
+    seconds = time.perf_counter() - wall0
+    out = {"messages": sent, "seconds": seconds, "messages_per_sec": sent / seconds if seconds > 0 else 0.0}
+    if detector is not None:
+        out.update(detector.stats())
+        out["latency_ms_max"] = max(latencies, default=0.0)
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a Piraeus AIS CSV into the live detector.")
+    parser.add_argument("csv")
+    parser.add_argument("--speedup", type=float, default=60.0, help="x real time, 0 for as fast as possible")
+    parser.add_argument("--url", default=None, help="server to push to (default: score in-process)")
+    parser.add_argument("--model", default=DEFAULT_VARIANT)
+    parser.add_argument("--runtime", default=None)
+    parser.add_argument("--tick-ms", type=int, default=LIVE_TICK_MS)
+    parser.add_argument("--score-every", type=int, default=LIVE_SCORE_EVERY,
+                        help="new fixes of a vessel before it is scored again")
+    args = parser.parse_args()
+
+    detector = None
+    if args.url is None:
+        kwargs = {"runtime": args.runtime} if args.runtime else {}
+        detector = LiveDetector(AnomalyModel(args.model, **kwargs), score_every=args.score_every)
+    print(replay_csv(args.csv, args.speedup, args.url, detector, args.tick_ms))
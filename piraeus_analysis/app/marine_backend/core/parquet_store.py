@@ -1,11 +1,258 @@
 # marine_backend/core/parquet_store.py
-import pyarrow.parquet as pq
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
 
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
 PARQUET_DIR = Path("./marine_backend/parquet")
 
-parquet_files = list(PARQUET_DIR.glob("*.parquet"))
+# Dataset-level metadata written by piraeus_analysis/csv_to_parquet.py:
+# per-file rows, time range, bounds and vessel counts.
+DATASET_META_NAME = "_dataset.json"
+
+# Cell-clustered copies of the files (same relative names), for area queries.
+# Like every path starting with "_", not listed as data files.
+SPATIAL_DIR = "_spatial"
+
+# Time-sorted copies, whose row-group 't' statistics form a time index.
+TIME_DIR = "_time"
+
+# Upper bound on resident parquet metadata (footers + row-group stats).
+# Override with MARINE_CATALOG_BUDGET_MB.
+CATALOG_MEMORY_BUDGET = int(os.environ.get("MARINE_CATALOG_BUDGET_MB", "64")) * 1024 * 1024
+
+
+@dataclass
+class FileMeta:
+    """
+    Resident metadata of a single parquet file.
+
+    Only the footer is kept in memory: schema, per row-group row counts,
+    cumulative row offsets and min/max statistics per column.
+    """
+    name: str
+    path: Path
+    mtime_ns: int
+    size: int
+    metadata: pq.FileMetaData
+    schema: pa.Schema
+    num_rows: int
+    row_group_rows: np.ndarray   # rows per row group
+    row_offsets: np.ndarray      # cumulative offsets, len = num_row_groups + 1
+    stats: dict                  # column -> list of (min, max) or None per row group
+    nbytes: int
+
+    @property
+    def num_row_groups(self) -> int:
+        return len(self.row_group_rows)
+
+    def column_range(self, column: str):
+        """
+        Return (min, max) of a column over the whole file from row-group
+        statistics, or None if any row group lacks statistics.
+        """
+        ranges = self.stats.get(column)
+        if not ranges or any(r is None for r in ranges):
+            return None
+        return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+
+def _load_meta(name: str, path: Path, st: os.stat_result) -> FileMeta:
+    metadata = pq.read_metadata(path)
+    schema = metadata.schema.to_arrow_schema()
+    n_groups = metadata.num_row_groups
+
+    row_group_rows = np.array(
+        [metadata.row_group(g).num_rows for g in range(n_groups)], dtype=np.int64
+    )
+    row_offsets = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(row_group_rows, out=row_offsets[1:])
+
+    stats = {c: [] for c in schema.names}
+    for g in range(n_groups):
+        rg = metadata.row_group(g)
+        seen = set()
+        for c in range(rg.num_columns):
+            col = rg.column(c)
+            top = col.path_in_schema.split(".")[0]
+            if top not in stats or top in seen:
+                continue
+            seen.add(top)
+            s = col.statistics
+            if s is not None and s.has_min_max:
+                stats[top].append((s.min, s.max))
+            else:
+                stats[top].append(None)
+        for top in stats:
+            if top not in seen:
+                stats[top].append(None)
+
+    nbytes = (
+        metadata.serialized_size
+        + row_group_rows.nbytes
+        + row_offsets.nbytes
+        + 64 * n_groups * len(stats)
+    )
+
+    return FileMeta(
+        name=name,
+        path=path,
+        mtime_ns=st.st_mtime_ns,
+        size=st.st_size,
+        metadata=metadata,
+        schema=schema,
+        num_rows=metadata.num_rows,
+        row_group_rows=row_group_rows,
+        row_offsets=row_offsets,
+        stats=stats,
+        nbytes=nbytes,
+    )
+
+
+class ParquetCatalog:
+    """
+    Lazy catalog over the parquet files in a directory.
+
+    Nothing is read at construction. A file's footer is parsed the first time
+    it is used and kept in an LRU bounded by ``memory_budget`` bytes; entries
+    are reloaded when the file's mtime or size changes.
+    """
+
+    def __init__(self, root: Path = PARQUET_DIR, memory_budget: int = CATALOG_MEMORY_BUDGET):
+        self.root = Path(root)
+        self.memory_budget = memory_budget
+        self._entries: "OrderedDict[str, FileMeta]" = OrderedDict()
+        self._resident = 0
+        self._lock = threading.Lock()
+        self._dataset = (None, {})
+
+    def dataset(self) -> dict:
+        """
+        Parsed dataset metadata file, reloaded when it changes; empty when
+        the directory has none.
+        """
+        path = self.root / DATASET_META_NAME
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except OSError:
+            return {}
+        cached_mtime, data = self._dataset
+        if cached_mtime != mtime_ns:
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                data = {}
+            self._dataset = (mtime_ns, data)
+        return data
+
+    def file_info(self, file: str) -> dict:
+        """
+        Dataset metadata entry of a file, or None when there is none or it
+        was recorded for a different version of the file.
+        """
+        info = self.dataset().get("files", {}).get(file)
+        if info is None:
+            return None
+        try:
+            st = self.path(file).stat()
+        except OSError:
+            return None
+        if info.get("size") != st.st_size or info.get("mtime_ns") != st.st_mtime_ns:
+            return None
+        return info
+
+    def files(self) -> list[str]:
+        """
+        Relative names of all parquet files under the root, sorted.
+        """
+        names = (p.relative_to(self.root) for p in sorted(self.root.rglob("*.parquet")))
+        return [str(p) for p in names if not any(part.startswith("_") for part in p.parts)]
+
+    def _copy(self, copy_dir: str, file: str):
+        name = f"{copy_dir}/{file}"
+        try:
+            if self.path(name).stat().st_mtime_ns >= self.path(file).stat().st_mtime_ns:
+                return name
+        except OSError:
+            pass
+        return None
+
+    def spatial_file(self, file: str):
+        """
+        Name of the cell-clustered copy of a file, or None when there is
+        none or it is older than the file.
+        """
+        return self._copy(SPATIAL_DIR, file)
+
+    def time_file(self, file: str):
+        """
+        Name of the time-sorted copy of a file, or None when there is none
+        or it is older than the file.
+        """
+        return self._copy(TIME_DIR, file)
+
+    def path(self, file: str) -> Path:
+        return self.root / file
+
+    def meta(self, file: str) -> FileMeta:
+        """
+        Return metadata for a file, loading it on first use.
+        """
+        path = self.path(file)
+        st = path.stat()
+
+        with self._lock:
+            entry = self._entries.get(file)
+            if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                self._entries.move_to_end(file)
+                return entry
+
+        entry = _load_meta(file, path, st)
+
+        with self._lock:
+            old = self._entries.pop(file, None)
+            if old is not None:
+                self._resident -= old.nbytes
+            self._entries[file] = entry
+            self._resident += entry.nbytes
+            # keep at least the entry just loaded, even if it alone exceeds the budget
+            while self._resident > self.memory_budget and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._resident -= evicted.nbytes
+
+        return entry
+
+    def open(self, file: str) -> pq.ParquetFile:
+        """
+        Open a file for reading, reusing the cached footer.
+        """
+        meta = self.meta(file)
+        return pq.ParquetFile(meta.path, metadata=meta.metadata)
+
+    def invalidate(self, file: str = None):
+        with self._lock:
+            if file is None:
+                self._entries.clear()
+                self._resident = 0
+            else:
+                old = self._entries.pop(file, None)
+                if old is not None:
+                    self._resident -= old.nbytes
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._resident
+
+
+catalog = ParquetCatalog()
+
 
-for f in parquet_files:
-    pq_file = pq.ParquetFile(f)
-    print(f"{f.name}: {pq_file.metadata.num_rows} rows")
+if __name__ == "__main__":
+    for name in catalog.files():
+        print(f"{name}: {catalog.meta(name).num_rows} rows")
@@ -0,0 +1,153 @@
+# marine_backend/core/predictor_service.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    from autogluon.timeseries import TimeSeriesPredictor, TimeSeriesDataFrame
+except ImportError:
+    TimeSeriesPredictor = TimeSeriesDataFrame = None
+
+MODEL_DIR = Path("./marine_backend/models")
+
+# Requests arriving within this window are merged into one predict call
+BATCH_WINDOW_S = 0.02
+MAX_BATCH_REQUESTS = 64
+
+# separates request number from item id in merged batches
+_KEY_SEP = "\x1f"
+
+
+class PredictorUnavailable(RuntimeError):
+    """
+    The predictors cannot be loaded (autogluon or the model files missing).
+    """
+
+
+def load_predictors(model_dir: Path):
+    """
+    Load pretrained Chronos-2 predictors.
+    """
+    if TimeSeriesPredictor is None:
+        raise PredictorUnavailable("autogluon is not installed")
+    try:
+        return (
+            TimeSeriesPredictor.load(model_dir / "lat"),
+            TimeSeriesPredictor.load(model_dir / "lon"),
+        )
+    except Exception as e:
+        raise PredictorUnavailable(f"cannot load the predictors in {model_dir}: {e}") from e
+
+
+def predict(ts_df, lat_model, lon_model) -> pd.DataFrame:
+    """
+    Predict latitude and longitude.
+    """
+    lat = lat_model.predict(ts_df)["mean"]
+    lon = lon_model.predict(ts_df)["mean"]
+
+    out = lat.to_frame("lat")
+    out["lon"] = lon
+    return out
+
+
+class PredictorService:
+    """
+    Holds the lat/lon predictors for the lifetime of the server and
+    micro-batches concurrent requests. The predictors load with the first
+    batch, so a missing model fails only the predictions
+    (PredictorUnavailable), and a failed load is retried on the next one.
+
+    Each request is a plain DataFrame with columns item_id, timestamp, lat,
+    lon. Requests queued within ``batch_window`` seconds are concatenated
+    (item ids prefixed with their request number) into a single
+    TimeSeriesDataFrame, predicted in one call on a dedicated thread, and
+    split back per request.
+    """
+
+    def __init__(self, model_dir: Path = MODEL_DIR, batch_window: float = BATCH_WINDOW_S,
+                 max_batch: int = MAX_BATCH_REQUESTS):
+        self.model_dir = Path(model_dir)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.lat_model = None
+        self.lon_model = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predictor")
+        self._queue = None
+        self._worker = None
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=False)
+
+    async def predict(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Forecast lat/lon for the items in ``frame``. Returns a DataFrame with
+        columns item_id, timestamp, lat, lon.
+        """
+        if self._queue is None:
+            raise RuntimeError("PredictorService.start() has not been called")
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((frame, fut))
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            frames = [frame for frame, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self._predict_batch, frames)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+    def _predict_batch(self, frames: list[pd.DataFrame]) -> list[pd.DataFrame]:
+        if self.lat_model is None:
+            self.lat_model, self.lon_model = load_predictors(self.model_dir)
+
+        merged = pd.concat(
+            [f.assign(item_id=f"{k}{_KEY_SEP}" + f["item_id"].astype(str)) for k, f in enumerate(frames)],
+            ignore_index=True,
+        )
+        ts_df = TimeSeriesDataFrame.from_data_frame(
+            merged, id_column="item_id", timestamp_column="timestamp"
+        )
+        pred = pd.DataFrame(predict(ts_df, self.lat_model, self.lon_model))
+        pred.index.names = ["item_id", "timestamp"]
+        pred = pred.reset_index()
+
+        parts = pred["item_id"].astype(str).str.split(_KEY_SEP, n=1, expand=True)
+        request_no = parts[0].astype(int)
+        pred["item_id"] = parts[1]
+        return [pred[request_no == k].reset_index(drop=True) for k in range(len(frames))]
+
+
+predictor_service = PredictorService()
@@ -1,28 +1,85 @@
 # marine_backend/core/readers.py
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import numpy as np
 import pandas as pd
-from marine_backend.core.parquet_store import PARQUET_DIR
+from marine_backend.core.parquet_store import FileMeta, catalog
 from marine_backend.utils.data_process import sanitize_row
 import pyarrow.parquet as pq 
 import pyarrow.compute as pc
 import pyarrow as pa
 
-# Load all Parquet files
-parquet_files = list(PARQUET_DIR.glob("*.parquet"))
+# Threads used to decode row groups of multi-file reads, shared by all
+# requests; separate from the I/O pool, whose threads run the iterators
+# that wait on them (iterate_io)
+READ_WORKERS = min(8, os.cpu_count() or 1)
+decode_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="row-group-decode")
+
 
-# Preload all rows into memory (optional, only if dataset fits in RAM)
-_all_rows: list[dict] = []
+def _overlaps(rng, lo, hi) -> bool:
+    """
+    True if a row-group (min, max) range may contain values in [lo, hi].
+    Missing statistics are treated as "may overlap".
+    """
+    if rng is None:
+        return True
+    if lo is not None and rng[1] < lo:
+        return False
+    if hi is not None and rng[0] > hi:
+        return False
+    return True
 
-for f in parquet_files:
-    pq_file = pq.ParquetFile(f)
-    for g in range(pq_file.num_row_groups):
-        table = pq_file.read_row_group(g)
-        df = table.to_pandas()
-        _all_rows.extend(df.to_dict(orient="records"))
 
-def read_time_window(file_path: str, start_ts: int, end_ts: int) -> pa.Table:
+def prune_row_groups(
+    meta: FileMeta,
+    start_ts: int = None,
+    end_ts: int = None,
+    lat_range: tuple = None,
+    lon_range: tuple = None,
+    vessel_ids: list = None,
+) -> list[int]:
+    """
+    Return the row groups whose min/max statistics can match the predicates.
+    """
+    ranges = {"t": (start_ts, end_ts)}
+    if lat_range is not None:
+        ranges["lat"] = lat_range
+    if lon_range is not None:
+        ranges["lon"] = lon_range
+
+    groups = []
+    for g in range(meta.num_row_groups):
+        keep = all(
+            _overlaps(meta.stats[c][g], lo, hi)
+            for c, (lo, hi) in ranges.items()
+            if c in meta.stats
+        )
+        if keep and vessel_ids is not None and "vessel_id" in meta.stats:
+            rng = meta.stats["vessel_id"][g]
+            keep = rng is None or any(rng[0] <= v <= rng[1] for v in vessel_ids)
+        if keep:
+            groups.append(g)
+    return groups
+
+
+def read_time_window(
+    file_path: str,
+    start_ts: int,
+    end_ts: int,
+    columns: list[str] = None,
+    lat_range: tuple = None,
+    lon_range: tuple = None,
+    vessel_ids: list = None,
+) -> pa.Table:
     """
     Read a parquet file and filter rows within a time window.
 
+    Row groups whose statistics fall outside the predicates are skipped
+    without being decoded, and only the requested columns are read.
+
     Parameters
     ----------
     file_path : str
@@ -31,28 +88,146 @@ def read_time_window(file_path: str, start_ts: int, end_ts: int) -> pa.Table:
         Start timestamp (inclusive).
     end_ts : int
         End timestamp (inclusive).
+    columns : list[str], optional
+        Columns to return. Defaults to all columns.
+    lat_range, lon_range : tuple, optional
+        Inclusive (min, max) bounds on 'lat' / 'lon'.
+    vessel_ids : list, optional
+        Keep only rows of these vessels.
 
     Returns
     -------
     filtered_table : pyarrow.Table
         Table filtered to rows where 't' is in [start_ts, end_ts].
     """
-    # Load parquet file as table
-    table = pq.read_table(PARQUET_DIR / file_path)
+    meta = catalog.meta(file_path)
+    groups = prune_row_groups(meta, start_ts, end_ts, lat_range, lon_range, vessel_ids)
+
+    if columns is None:
+        columns = meta.schema.names
 
-    # Combine chunks for the 't' column to avoid ChunkedArray errors
-    col = table["t"].combine_chunks()
+    predicates = {"t": (start_ts, end_ts)}
+    if lat_range is not None:
+        predicates["lat"] = lat_range
+    if lon_range is not None:
+        predicates["lon"] = lon_range
+
+    # the time predicate is redundant when every kept row group lies inside the window
+    if all(
+        r is not None and (start_ts is None or start_ts <= r[0]) and (end_ts is None or r[1] <= end_ts)
+        for r in (meta.stats["t"][g] for g in groups)
+    ):
+        del predicates["t"]
+
+    read_cols = list(columns)
+    for c in list(predicates) + (["vessel_id"] if vessel_ids is not None else []):
+        if c not in read_cols:
+            read_cols.append(c)
+
+    if not groups:
+        return meta.schema.empty_table().select(columns)
+
+    table = catalog.open(file_path).read_row_groups(groups, columns=read_cols)
 
     # Create mask using pyarrow.compute functions
-    mask = pc.and_(
-        pc.greater_equal(col, start_ts),
-        pc.less_equal(col, end_ts)
-    )
+    mask = None
+    for c, (lo, hi) in predicates.items():
+        col = table[c]
+        for m in (pc.greater_equal(col, lo) if lo is not None else None,
+                  pc.less_equal(col, hi) if hi is not None else None):
+            if m is not None:
+                mask = m if mask is None else pc.and_(mask, m)
+    if vessel_ids is not None:
+        vid_type = table.schema.field("vessel_id").type
+        if pa.types.is_dictionary(vid_type):
+            vid_type = vid_type.value_type
+        m = pc.is_in(table["vessel_id"], value_set=pa.array(vessel_ids, type=vid_type))
+        mask = m if mask is None else pc.and_(mask, m)
 
     # Filter table by mask
-    filtered_table = table.filter(mask)
+    if mask is not None:
+        table = table.filter(mask)
+
+    return table.select(columns)
+
+
+def estimate_rows(
+    files: list[str],
+    start_ts: int = None,
+    end_ts: int = None,
+    lat_range: tuple = None,
+    lon_range: tuple = None,
+) -> int:
+    """
+    Upper bound on the rows in [start_ts, end_ts] (and the lat/lon box)
+    across files, from metadata only: the row counts of the row groups that
+    survive pruning.
+    """
+    total = 0
+    for file in files:
+        meta = catalog.meta(file)
+        for g in prune_row_groups(meta, start_ts, end_ts, lat_range, lon_range):
+            total += int(meta.row_group_rows[g])
+    return total
+
+
+def _read_row_group_window(file, g, start_ts, end_ts, columns, lat_range=None, lon_range=None) -> pa.Table:
+    read_cols = columns
+    if columns is not None:
+        extra = [c for c, r in (("lat", lat_range), ("lon", lon_range)) if r is not None and c not in columns]
+        read_cols = list(columns) + extra
+    table = catalog.open(file).read_row_group(g, columns=read_cols)
+    if start_ts is not None:
+        table = table.filter(pc.greater_equal(table["t"], start_ts))
+    if end_ts is not None:
+        table = table.filter(pc.less_equal(table["t"], end_ts))
+    for c, r in (("lat", lat_range), ("lon", lon_range)):
+        if r is not None:
+            table = table.filter(pc.and_(pc.greater_equal(table[c], r[0]), pc.less_equal(table[c], r[1])))
+    return table if read_cols is columns else table.select(columns)
 
-    return filtered_table
+
+def iter_time_window(
+    files: list[str],
+    start_ts: int = None,
+    end_ts: int = None,
+    columns: list[str] = None,
+    max_workers: int = READ_WORKERS,
+    lat_range: tuple = None,
+    lon_range: tuple = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Yield rows of several files within [start_ts, end_ts] in a single pass,
+    optionally restricted to inclusive lat/lon ranges.
+
+    Row groups are pruned by their 't' (and 'lat' / 'lon') statistics and
+    decoded in the shared decode_executor, at most ``max_workers`` of this
+    call's in flight at a time. Batches are yielded in file order, then
+    row-group order, regardless of which decode finishes first.
+    """
+    if columns is not None and "t" not in columns:
+        raise ValueError("columns must include 't'")
+
+    tasks = [
+        (file, g)
+        for file in files
+        for g in prune_row_groups(catalog.meta(file), start_ts, end_ts, lat_range, lon_range)
+    ]
+
+    pending = deque()
+    try:
+        for file, g in tasks:
+            pending.append(decode_executor.submit(
+                _read_row_group_window, file, g, start_ts, end_ts, columns, lat_range, lon_range
+            ))
+            # bound this request's decoded-but-unsent row groups
+            if len(pending) >= max_workers:
+                yield from pending.popleft().result().to_batches()
+        while pending:
+            yield from pending.popleft().result().to_batches()
+    finally:
+        for fut in pending:
+            fut.cancel()
 
 
 # def read_time_window(file: str, start_ts: int, end_ts: int) -> pd.DataFrame:
@@ -95,23 +270,81 @@ def read_time_window(file_path: str, start_ts: int, end_ts: int) -> pa.Table:
 #     return frames
 
 
-def read_row(file: str, idx: int) -> dict:
+def read_row_range(file: str, start: int, end: int, columns: list[str] = None) -> Iterator[pa.RecordBatch]:
     """
-    Read a single row by index from a parquet file.
+    Yield rows [start, end) of a parquet file as Arrow record batches.
+
+    The row group holding each position is found with a binary search over the
+    catalog's cumulative row offsets, and every touched row group is decoded
+    once. The range is clipped to the file's row count.
+    """
+    meta = catalog.meta(file)
+    start = max(start, 0)
+    end = min(end, meta.num_rows)
+    if start >= end:
+        return
+
+    offsets = meta.row_offsets
+    first = int(np.searchsorted(offsets, start, side="right")) - 1
+    last = int(np.searchsorted(offsets, end - 1, side="right")) - 1
+
+    pq_file = catalog.open(file)
+    for g in range(first, last + 1):
+        base = int(offsets[g])
+        lo = max(start - base, 0)
+        hi = min(end - base, int(meta.row_group_rows[g]))
+
+        table = pq_file.read_row_group(g, columns=columns)
+        yield from table.slice(lo, hi - lo).to_batches()
+
+
+def iter_vessel_tables(file: str, columns: list[str], start_ts: int = None,
+                       end_ts: int = None) -> Iterator[pa.Table]:
+    """
+    Yield a vessel-sorted file as tables of complete vessels, in file order,
+    with vessel_id decoded to strings.
+
+    Row groups are read one at a time (pruned on 't' when a window is
+    given); the last vessel of each is held back until its rows are all in.
     """
-    pq_file = pq.ParquetFile(PARQUET_DIR / file)
+    if "vessel_id" not in columns:
+        raise ValueError("columns must include 'vessel_id'")
+    read_cols = list(dict.fromkeys(list(columns) + ["t"]))
 
-    offset = 0
-    for g in range(pq_file.num_row_groups):
-        rg = pq_file.metadata.row_group(g)
-        n = rg.num_rows
+    pq_file = catalog.open(file)
+    carry = None
+    for g in prune_row_groups(catalog.meta(file), start_ts, end_ts):
+        table = pq_file.read_row_group(g, columns=read_cols)
+        if pa.types.is_dictionary(table["vessel_id"].type):
+            table = table.set_column(
+                table.schema.get_field_index("vessel_id"), "vessel_id", table["vessel_id"].cast(pa.string())
+            )
+        if start_ts is not None:
+            table = table.filter(pc.greater_equal(table["t"], start_ts))
+        if end_ts is not None:
+            table = table.filter(pc.less_equal(table["t"], end_ts))
+        if carry is not None:
+            table = pa.concat_tables([carry, table])
+        if table.num_rows == 0:
+            continue
 
-        if offset + n > idx:
-            table = pq_file.read_row_group(g)
-            df = table.to_pandas()
-            return df.iloc[idx - offset].to_dict()
+        held = pc.equal(table["vessel_id"], table["vessel_id"][-1])
+        carry = table.filter(held)
+        done = table.filter(pc.invert(held))
+        if done.num_rows:
+            yield done.select(columns)
 
-        offset += n
+    if carry is not None and carry.num_rows:
+        yield carry.select(columns)
 
-    raise IndexError("Row index out of range")
 
+def read_row(file: str, idx: int) -> dict:
+    """
+    Read a single row by index from a parquet file.
+    """
+    if idx < 0 or idx >= catalog.meta(file).num_rows:
+        raise IndexError("Row index out of range")
+
+    for batch in read_row_range(file, idx, idx + 1):
+        if batch.num_rows:
+            return batch.to_pylist()[0]
@@ -0,0 +1,210 @@
+# marine_backend/core/replay.py
+"""
+Server-side cursor for time-lapse replays.
+
+A ReplayCursor walks one file forward in time and turns every step into a
+frame: the latest fix of each vessel heard since the previous step, plus
+the vessels not heard for ``stale_ms`` (to drop from the map). Seeking
+returns a snapshot of every vessel heard in the ``stale_ms`` before the
+target time.
+
+Rows come from the time-sorted copy of the file when there is one (see
+csv_to_parquet.py): its row-group 't' ranges are increasing, so a seek is a
+binary search over them and the cursor holds one small row group at a
+time. Without it, spans of about REPLAY_SPAN_ROWS rows are read from the
+file itself with row-group pruning, which is correct but decodes every
+row group of a vessel-sorted file on each read.
+"""
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from marine_backend.core.parquet_store import catalog
+from marine_backend.core.readers import iter_time_window
+from marine_backend.utils.data_process import sanitize_batch
+
+REPLAY_COLUMNS = ["t", "vessel_id", "lat", "lon", "speed", "course", "heading"]
+REPLAY_SPAN_ROWS = 65_536
+DEFAULT_STALE_MS = 600_000
+
+
+class TimeIndex:
+    """
+    Row-group time ranges of a time-sorted file.
+    """
+
+    def __init__(self, t_min: np.ndarray, t_max: np.ndarray):
+        self.t_min = t_min
+        self.t_max = t_max
+
+    @classmethod
+    def of(cls, file: str) -> Optional["TimeIndex"]:
+        """
+        Index of a file, or None when its row groups lack 't' statistics or
+        are not in time order.
+        """
+        ranges = catalog.meta(file).stats.get("t")
+        if not ranges or any(r is None for r in ranges):
+            return None
+        t_min = np.array([r[0] for r in ranges], dtype=np.int64)
+        t_max = np.array([r[1] for r in ranges], dtype=np.int64)
+        if np.any(t_max[:-1] > t_min[1:]):
+            return None
+        return cls(t_min, t_max)
+
+    def groups(self, lo: int, hi: int) -> range:
+        """
+        Row groups that may hold rows with lo <= t <= hi.
+        """
+        first = int(np.searchsorted(self.t_max, lo, side="left"))
+        last = int(np.searchsorted(self.t_min, hi, side="right"))
+        return range(first, last)
+
+
+def _decode_vessels(table: pa.Table) -> pa.Table:
+    i = table.schema.get_field_index("vessel_id")
+    if pa.types.is_dictionary(table.schema.field(i).type):
+        table = table.set_column(i, "vessel_id", table["vessel_id"].cast(pa.string()))
+    return table
+
+
+def _latest(table: pa.Table) -> pa.Table:
+    """
+    Last row of every vessel of a t-sorted table, in time order.
+    """
+    if table.num_rows == 0:
+        return table
+    vessel = table["vessel_id"].to_numpy(zero_copy_only=False)
+    _, first_rev = np.unique(vessel[::-1], return_index=True)
+    return table.take(pa.array(np.sort(table.num_rows - 1 - first_rev)))
+
+
+def _rows(table: pa.Table) -> list[dict]:
+    return [row for b in table.to_batches() for row in sanitize_batch(b).to_pylist()]
+
+
+class ReplayCursor:
+    """
+    Position of one replay session in a file, between ``start`` and ``end``.
+
+    Memory is bounded by one read span plus the last fix time of every
+    vessel currently on the map.
+    """
+
+    def __init__(self, file: str, start_ts: int = None, end_ts: int = None,
+                 stale_ms: int = DEFAULT_STALE_MS):
+        source = catalog.time_file(file)
+        self.index = TimeIndex.of(source) if source is not None else None
+        self.source = source if self.index is not None else file
+
+        meta = catalog.meta(self.source)
+        self.columns = [c for c in REPLAY_COLUMNS if c in meta.schema.names]
+        self._empty = _decode_vessels(meta.schema.empty_table().select(self.columns))
+        t_range = meta.column_range("t") or self._scan_t_range()
+        self.start = t_range[0] if start_ts is None else max(start_ts, t_range[0])
+        self.end = t_range[1] if end_ts is None else min(end_ts, t_range[1])
+        self.stale_ms = stale_ms
+
+        # read-ahead span (ms) when there is no time index
+        duration = max(1, t_range[1] - t_range[0])
+        self._span_ms = max(1, int(REPLAY_SPAN_ROWS * duration / max(1, meta.num_rows)))
+
+        self.t = self.start
+        self.active = {}   # vessel -> t of its last fix
+        self._buf = None
+        self._buf_t = None
+        self._buf_lo = self._buf_hi = None   # buffer holds lo < t <= hi
+
+    def _scan_t_range(self) -> tuple:
+        pq_file = catalog.open(self.source)
+        lo, hi = None, None
+        for g in range(catalog.meta(self.source).num_row_groups):
+            t = pq_file.read_row_group(g, columns=["t"])["t"]
+            if len(t):
+                mm = pc.min_max(t).as_py()
+                lo = mm["min"] if lo is None else min(lo, mm["min"])
+                hi = mm["max"] if hi is None else max(hi, mm["max"])
+        return (lo, hi) if lo is not None else (0, 0)
+
+    def _read(self, lo: int, hi: int) -> pa.Table:
+        """
+        Rows with lo < t <= hi, sorted by t.
+        """
+        if self.index is not None:
+            pq_file = catalog.open(self.source)
+            parts = [pq_file.read_row_group(g, columns=self.columns)
+                     for g in self.index.groups(lo + 1, hi)]
+        else:
+            parts = [pa.Table.from_batches([b]) for b in
+                     iter_time_window([self.source], lo + 1, hi, columns=self.columns)]
+        if not parts:
+            return self._empty
+        table = pa.concat_tables([_decode_vessels(p) for p in parts])
+        table = table.filter(pc.and_(pc.greater(table["t"], lo), pc.less_equal(table["t"], hi)))
+        if self.index is None:
+            table = table.sort_by("t")
+        return table
+
+    def _fill(self, lo: int):
+        if self.index is not None:
+            # up to the end of the row group holding the next row
+            g = int(np.searchsorted(self.index.t_max, lo + 1, side="left"))
+            hi = int(self.index.t_max[g]) if g < len(self.index.t_max) else self.end
+        else:
+            hi = lo + self._span_ms
+        hi = max(lo + 1, min(hi, self.end))
+        self._buf = self._read(lo, hi)
+        self._buf_t = self._buf["t"].to_numpy()
+        self._buf_lo, self._buf_hi = lo, hi
+
+    def _latest_between(self, lo: int, hi: int) -> pa.Table:
+        """
+        Latest fix per vessel with lo < t <= hi, read span by span.
+        """
+        parts = []
+        while lo < hi:
+            if self._buf is None or not (self._buf_lo <= lo < self._buf_hi):
+                self._fill(lo)
+            top = min(hi, self._buf_hi)
+            a, b = np.searchsorted(self._buf_t, [lo, top], side="right")
+            parts.append(_latest(self._buf.slice(a, b - a)))
+            lo = top
+        if not parts:
+            return self._empty
+        return _latest(pa.concat_tables(parts))
+
+    def _state(self, kind: str, table: pa.Table, expired: list) -> dict:
+        return {
+            "type": kind,
+            "t": self.t,
+            "positions": _rows(table),
+            "expired": expired,
+            "done": self.t >= self.end,
+        }
+
+    def seek(self, t: int) -> dict:
+        """
+        Move to ``t`` and return a snapshot of every vessel on the map.
+        """
+        self.t = int(min(max(t, self.start), self.end))
+        table = self._latest_between(max(self.t - self.stale_ms, self.start - 1), self.t)
+        self.active = dict(zip(table["vessel_id"].to_pylist(), table["t"].to_pylist()))
+        return self._state("snapshot", table, [])
+
+    def advance(self, t: int) -> dict:
+        """
+        Move forward to ``t`` and return the frame: latest fix of every
+        vessel heard since the previous position, and the vessels gone stale.
+        """
+        t = int(min(t, self.end))
+        table = self._latest_between(self.t, t)
+        self.active.update(zip(table["vessel_id"].to_pylist(), table["t"].to_pylist()))
+        self.t = max(self.t, t)
+
+        horizon = self.t - self.stale_ms
+        expired = [v for v, tv in self.active.items() if tv < horizon]
+        for v in expired:
+            del self.active[v]
+        return self._state("frame", table, expired)
@@ -0,0 +1,284 @@
+# marine_backend/core/track_lod.py
+"""
+Level-of-detail trajectories for map rendering.
+
+Every fix of a parquet file gets a detail level: the first zoom in
+LOD_ZOOMS at which Douglas-Peucker keeps it, with a tolerance of
+LOD_TOLERANCE_PX screen pixels at that zoom (measured in Web Mercator, so
+the same tolerance holds along latitude and longitude). Fixes needed at no
+listed zoom get level len(LOD_ZOOMS) and are only drawn beyond the finest
+one. Filtering on ``level <= k`` yields exactly the Douglas-Peucker
+simplification at tolerance k, so one pass serves every zoom.
+
+Douglas-Peucker runs vectorized over all vessels at once: each iteration
+splits every open segment of every track at its farthest point. A point's
+significance is capped by the one of the split that created its segment,
+which keeps the levels nested.
+
+Levels are built on first use and rebuilt when the parquet file changes.
+The fixes of each coarse level are held in the shared result cache, so
+they count against its byte budget; the full-detail level, which holds
+every fix, is read from disk per request and kept only for the window.
+Build all missing ones with (from the app directory):
+
+    python -m marine_backend.core.track_lod [file ...]
+"""
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from marine_backend.core.cache import result_cache
+from marine_backend.core.parquet_store import catalog
+from marine_backend.core.readers import iter_vessel_tables
+
+LOD_DIR = Path("./marine_backend/lod")
+LOD_ZOOMS = (8, 10, 12, 14)
+LOD_TOLERANCE_PX = 0.5
+TILE_PX = 256
+
+_build_lock = threading.Lock()
+
+# file -> (mtime_ns, size) of the source when its levels were last confirmed current
+_confirmed = {}
+
+
+def lod_path(file: str) -> Path:
+    return LOD_DIR / f"{file}.lod.parquet"
+
+
+def zoom_tolerance(zoom: float) -> float:
+    """
+    Simplification tolerance (Mercator degrees) of LOD_TOLERANCE_PX at a zoom.
+    """
+    return LOD_TOLERANCE_PX * 360.0 / (TILE_PX * 2.0 ** zoom)
+
+
+LOD_TOLERANCES = np.array([zoom_tolerance(z) for z in LOD_ZOOMS])
+
+
+def lod_level(tolerance: float) -> int:
+    """
+    Coarsest level whose tolerance does not exceed ``tolerance``, so the
+    served track never deviates by more than requested.
+    """
+    return int(np.count_nonzero(LOD_TOLERANCES > tolerance))
+
+
+def mercator_y(lat: np.ndarray) -> np.ndarray:
+    """
+    Web Mercator y in degrees (same scale as longitude).
+    """
+    return np.degrees(np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)))
+
+
+def dp_significance(x: np.ndarray, y: np.ndarray, starts: np.ndarray, min_tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker significance of every point of a set of tracks.
+
+    ``starts`` are the first indices of the tracks, stored back to back.
+    A point is kept by Douglas-Peucker at tolerance ``tol`` iff its
+    significance exceeds ``tol``; track ends are infinite and points below
+    ``min_tolerance`` stay 0. Distances are to the segment, not the line,
+    so tracks that double back are handled.
+    """
+    n = len(x)
+    sig = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return sig
+    ends = np.append(starts[1:], n) - 1
+    sig[starts] = np.inf
+    sig[ends] = np.inf
+
+    a, b = starts, ends
+    cap = np.full(len(a), np.inf)
+    while True:
+        open_ = b - a > 1
+        a, b, cap = a[open_], b[open_], cap[open_]
+        if len(a) == 0:
+            break
+
+        # interior points of every open segment, back to back
+        lengths = b - a - 1
+        seg = np.repeat(np.arange(len(a)), lengths)
+        offsets = np.cumsum(lengths) - lengths
+        idx = np.arange(len(seg)) - offsets[seg] + a[seg] + 1
+
+        ax, ay = x[a][seg], y[a][seg]
+        dx, dy = x[b][seg] - ax, y[b][seg] - ay
+        px, py = x[idx] - ax, y[idx] - ay
+        den = dx * dx + dy * dy
+        u = np.clip(np.divide(px * dx + py * dy, den, out=np.zeros_like(den), where=den > 0), 0.0, 1.0)
+        d = np.hypot(px - u * dx, py - u * dy)
+
+        dmax = np.maximum.reduceat(d, offsets)
+        hit = np.flatnonzero(d == dmax[seg])
+        first = hit[np.unique(seg[hit], return_index=True)[1]]
+        k = idx[first]
+
+        split = dmax > min_tolerance
+        k, s = k[split], np.minimum(dmax[split], cap[split])
+        sig[k] = s
+        a, b = np.concatenate([a[split], k]), np.concatenate([k, b[split]])
+        cap = np.concatenate([s, s])
+    return sig
+
+
+def _levels(table: pa.Table) -> pa.Table:
+    """
+    Sort complete vessel tracks by (vessel_id, t) and attach their level.
+    """
+    vessel = table["vessel_id"].to_numpy(zero_copy_only=False).astype(str)
+    t = table["t"].to_numpy()
+    order = np.lexsort((t, vessel))
+    table = table.take(pa.array(order))
+    vessel = vessel[order]
+
+    lat = table["lat"].to_numpy()
+    lon = table["lon"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, vessel[1:] != vessel[:-1]])
+    sig = dp_significance(lon, mercator_y(lat), starts, LOD_TOLERANCES[-1])
+
+    # tolerances decrease with zoom: count those the point does not exceed
+    level = np.count_nonzero(sig[:, None] <= LOD_TOLERANCES[None, :], axis=1)
+    return table.append_column("level", pa.array(level.astype(np.int8)))
+
+
+def build_lod(file: str) -> Path:
+    """
+    Compute the detail level of every valid fix of a file and write them.
+
+    The file is read one row group at a time (readers.iter_vessel_tables);
+    it must be sorted by vessel, as written by csv_to_parquet.
+    """
+    meta = catalog.meta(file)
+    parts = []
+    for table in iter_vessel_tables(file, ["vessel_id", "t", "lat", "lon"]):
+        table = table.filter(pc.and_(pc.is_finite(table["lat"]), pc.is_finite(table["lon"])))
+        if table.num_rows:
+            parts.append(_levels(table))
+
+    if parts:
+        lod = pa.concat_tables(parts)
+    else:
+        lod = pa.table({
+            "vessel_id": pa.array([], pa.string()),
+            "t": pa.array([], pa.int64()),
+            "lat": pa.array([], pa.float64()),
+            "lon": pa.array([], pa.float64()),
+            "level": pa.array([], pa.int8()),
+        })
+    lod = lod.replace_schema_metadata({
+        "source_mtime_ns": str(meta.mtime_ns),
+        "source_size": str(meta.size),
+        "zooms": ",".join(map(str, LOD_ZOOMS)),
+        "tolerance_px": str(LOD_TOLERANCE_PX),
+    })
+
+    path = lod_path(file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    pq.write_table(lod, tmp, use_dictionary=["vessel_id"], compression="zstd")
+    tmp.replace(path)
+    return path
+
+
+def _is_current(file: str) -> bool:
+    path = lod_path(file)
+    if not path.exists():
+        return False
+    md = pq.read_schema(path).metadata or {}
+    meta = catalog.meta(file)
+    return (
+        md.get(b"source_mtime_ns") == str(meta.mtime_ns).encode()
+        and md.get(b"source_size") == str(meta.size).encode()
+        and md.get(b"zooms") == ",".join(map(str, LOD_ZOOMS)).encode()
+        and md.get(b"tolerance_px") == str(LOD_TOLERANCE_PX).encode()
+    )
+
+
+def ensure_lod(file: str) -> Path:
+    """
+    Return the levels of a file, building them first if missing or stale.
+    """
+    meta = catalog.meta(file)
+    if _confirmed.get(file) != (meta.mtime_ns, meta.size):
+        with _build_lock:
+            if not _is_current(file):
+                build_lod(file)
+            _confirmed[file] = (meta.mtime_ns, meta.size)
+    return lod_path(file)
+
+
+def build_missing(files: list[str] = None) -> list[str]:
+    """
+    Build levels for files that have none or stale ones; returns them.
+    """
+    built = []
+    for file in files if files is not None else catalog.files():
+        with _build_lock:
+            if _is_current(file):
+                continue
+            build_lod(file)
+        built.append(file)
+    return built
+
+
+def _read(path: Path, filters: list) -> dict:
+    table = pq.read_table(path, filters=filters)
+    vessel = table["vessel_id"].combine_chunks().dictionary_encode()
+    return {
+        "vessels": vessel.dictionary.to_pylist(),
+        "codes": vessel.indices.to_numpy(),
+        "t": table["t"].to_numpy(),
+        "lat": table["lat"].to_numpy(),
+        "lon": table["lon"].to_numpy(),
+        "level": table["level"].to_numpy(),
+    }
+
+
+def simplified_tracks(file: str, level: int, start_ts: int = -10**18, end_ts: int = 10**18,
+                      decimals: int = 6) -> list[dict]:
+    """
+    Per-vessel polylines of a file/time window at a detail level, as
+    columnar ``{"vessel_id", "t", "lat", "lon"}`` dicts.
+    """
+    path = ensure_lod(file)
+    if level < len(LOD_ZOOMS):
+        lod = result_cache.get_or_compute(
+            "track_lod",
+            {"level": level, "lod_mtime_ns": path.stat().st_mtime_ns},
+            [file],
+            lambda: _read(path, [("level", "<=", level)]),
+        )
+    else:
+        lod = _read(path, [("t", ">=", start_ts), ("t", "<=", end_ts)])
+
+    keep = (lod["level"] <= level) & (lod["t"] >= start_ts) & (lod["t"] <= end_ts)
+    idx = np.flatnonzero(keep)
+    if len(idx) == 0:
+        return []
+    codes = lod["codes"][idx]
+    t = lod["t"][idx]
+    lat = np.round(lod["lat"][idx], decimals)
+    lon = np.round(lod["lon"][idx], decimals)
+
+    bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True])
+    return [
+        {
+            "vessel_id": lod["vessels"][codes[s]],
+            "t": t[s:e].tolist(),
+            "lat": lat[s:e].tolist(),
+            "lon": lon[s:e].tolist(),
+        }
+        for s, e in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+if __name__ == "__main__":
+    for name in build_missing(sys.argv[1:] or None):
+        print(f"{name} -> {lod_path(name)}")
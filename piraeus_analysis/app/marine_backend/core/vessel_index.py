@@ -0,0 +1,240 @@
+# marine_backend/core/vessel_index.py
+"""
+Per-vessel sidecar index over the parquet store.
+
+For every parquet file the index holds one segment per (vessel, row group):
+the first and last row of the vessel in that row group, its row count, its
+min/max 't' and its bounding box. A segment whose row count equals its row
+span is contiguous and can be read as an exact slice.
+
+Indexes are built on first use and rebuilt when the parquet file changes.
+Build all missing ones with (from the app directory):
+
+    python -m marine_backend.core.vessel_index [file ...]
+"""
+import sys
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from marine_backend.core.parquet_store import catalog
+from marine_backend.core.readers import read_row_range
+
+INDEX_DIR = Path("./marine_backend/index")
+
+_build_lock = threading.Lock()
+
+# file -> (mtime_ns, size) of the source when its index was last confirmed current
+_confirmed = {}
+
+
+def index_path(file: str) -> Path:
+    return INDEX_DIR / f"{file}.vessels.parquet"
+
+
+def _decode(col):
+    if pa.types.is_dictionary(col.type):
+        return col.cast(col.type.value_type)
+    return col
+
+
+def build_index(file: str) -> Path:
+    """
+    Scan a parquet file one row group at a time and write its vessel index.
+    """
+    meta = catalog.meta(file)
+    pq_file = catalog.open(file)
+    segments = []
+
+    for g in range(meta.num_row_groups):
+        table = pq_file.read_row_group(g, columns=["vessel_id", "t", "lat", "lon"])
+        base = int(meta.row_offsets[g])
+        table = table.append_column(
+            "row", pa.array(np.arange(base, base + table.num_rows, dtype=np.int64))
+        )
+        table = table.set_column(0, "vessel_id", _decode(table["vessel_id"]))
+
+        seg = table.group_by("vessel_id").aggregate([
+            ("row", "min"), ("row", "max"), ("row", "count"),
+            ("t", "min"), ("t", "max"),
+            ("lat", "min"), ("lat", "max"),
+            ("lon", "min"), ("lon", "max"),
+        ])
+        seg = seg.append_column("row_group", pa.array(np.full(seg.num_rows, g, dtype=np.int32)))
+        segments.append(seg)
+
+    if segments:
+        index = pa.concat_tables(segments)
+    else:
+        index = pa.table({
+            "vessel_id": pa.array([], pa.string()),
+            **{c: pa.array([], pa.int64()) for c in ("row_min", "row_max", "row_count", "t_min", "t_max")},
+            **{c: pa.array([], pa.float64()) for c in ("lat_min", "lat_max", "lon_min", "lon_max")},
+            "row_group": pa.array([], pa.int32()),
+        })
+
+    index = index.sort_by([("vessel_id", "ascending"), ("row_group", "ascending")])
+    index = index.replace_schema_metadata({
+        "source_mtime_ns": str(meta.mtime_ns),
+        "source_size": str(meta.size),
+    })
+
+    path = index_path(file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    pq.write_table(index, tmp)
+    tmp.replace(path)
+    return path
+
+
+def _is_current(file: str) -> bool:
+    path = index_path(file)
+    if not path.exists():
+        return False
+    md = pq.read_schema(path).metadata or {}
+    meta = catalog.meta(file)
+    return (
+        md.get(b"source_mtime_ns") == str(meta.mtime_ns).encode()
+        and md.get(b"source_size") == str(meta.size).encode()
+    )
+
+
+def ensure_index(file: str) -> Path:
+    """
+    Return the index of a file, building it first if missing or stale.
+    """
+    meta = catalog.meta(file)
+    if _confirmed.get(file) != (meta.mtime_ns, meta.size):
+        with _build_lock:
+            if not _is_current(file):
+                build_index(file)
+            _confirmed[file] = (meta.mtime_ns, meta.size)
+    return index_path(file)
+
+
+def build_missing(files: list[str] = None) -> list[str]:
+    """
+    Build indexes for files that have none or a stale one; returns them.
+    """
+    built = []
+    for file in files if files is not None else catalog.files():
+        with _build_lock:
+            if _is_current(file):
+                continue
+            build_index(file)
+        built.append(file)
+    return built
+
+
+@lru_cache(maxsize=64)
+def _load(path: str, mtime_ns: int) -> pa.Table:
+    return pq.read_table(path)
+
+
+def load_index(file: str) -> pa.Table:
+    """
+    Segment table of a file: one row per (vessel, row group).
+    """
+    path = ensure_index(file)
+    return _load(str(path), path.stat().st_mtime_ns)
+
+
+def vessel_summary(file: str) -> pa.Table:
+    """
+    One row per vessel: row count, time range and bounding box.
+    """
+    return load_index(file).group_by("vessel_id").aggregate([
+        ("row_count", "sum"),
+        ("t_min", "min"), ("t_max", "max"),
+        ("lat_min", "min"), ("lat_max", "max"),
+        ("lon_min", "min"), ("lon_max", "max"),
+    ]).rename_columns([
+        "vessel_id", "rows", "t_min", "t_max", "lat_min", "lat_max", "lon_min", "lon_max",
+    ]).sort_by("vessel_id")
+
+
+def count_vessels(file: str) -> int:
+    return pc.count_distinct(load_index(file)["vessel_id"]).as_py()
+
+
+def unique_vessels(file: str, start_ts: int, end_ts: int) -> list[str]:
+    """
+    Vessels with at least one fix in [start_ts, end_ts].
+
+    Segments entirely inside the window decide from the index alone; only
+    row groups holding segments that straddle a window edge are read, and
+    then only their vessel_id and t columns.
+    """
+    index = load_index(file)
+    t_min = index["t_min"]
+    t_max = index["t_max"]
+
+    inside = pc.and_(pc.greater_equal(t_min, start_ts), pc.less_equal(t_max, end_ts))
+    overlaps = pc.and_(pc.less_equal(t_min, end_ts), pc.greater_equal(t_max, start_ts))
+
+    vessels = set(index.filter(inside)["vessel_id"].to_pylist())
+
+    partial = index.filter(pc.and_(overlaps, pc.invert(inside)))
+    if partial.num_rows:
+        partial = partial.filter(
+            pc.invert(pc.is_in(partial["vessel_id"], value_set=pa.array(sorted(vessels), pa.string())))
+        )
+    if partial.num_rows:
+        pq_file = catalog.open(file)
+        for g in pc.unique(partial["row_group"]).to_pylist():
+            table = pq_file.read_row_group(g, columns=["vessel_id", "t"])
+            table = table.filter(pc.and_(
+                pc.greater_equal(table["t"], start_ts), pc.less_equal(table["t"], end_ts)
+            ))
+            vessels.update(pc.unique(table["vessel_id"]).to_pylist())
+
+    return sorted(vessels)
+
+
+def vessel_track(file: str, vessel_id: str, start_ts: int = -10**18, end_ts: int = 10**18,
+                 columns: list[str] = None) -> pa.Table:
+    """
+    All fixes of one vessel in [start_ts, end_ts], in file order.
+
+    Contiguous segments are read as exact row slices; the others decode only
+    the row groups that contain the vessel.
+    """
+    meta = catalog.meta(file)
+    if columns is None:
+        columns = meta.schema.names
+    read_cols = list(dict.fromkeys(list(columns) + ["vessel_id", "t"]))
+
+    index = load_index(file)
+    seg = index.filter(pc.and_(
+        pc.equal(index["vessel_id"], vessel_id),
+        pc.and_(pc.less_equal(index["t_min"], end_ts), pc.greater_equal(index["t_max"], start_ts)),
+    )).sort_by("row_min")
+
+    parts = []
+    pq_file = None
+    for s in seg.to_pylist():
+        if s["row_count"] == s["row_max"] - s["row_min"] + 1:
+            batches = list(read_row_range(file, s["row_min"], s["row_max"] + 1, columns=read_cols))
+            table = pa.Table.from_batches(batches, schema=meta.schema.empty_table().select(read_cols).schema)
+        else:
+            if pq_file is None:
+                pq_file = catalog.open(file)
+            table = pq_file.read_row_group(s["row_group"], columns=read_cols)
+            table = table.filter(pc.equal(_decode(table["vessel_id"]), vessel_id))
+        parts.append(table.filter(pc.and_(
+            pc.greater_equal(table["t"], start_ts), pc.less_equal(table["t"], end_ts)
+        )))
+
+    if not parts:
+        return meta.schema.empty_table().select(columns)
+    return pa.concat_tables(parts).select(columns)
+
+
+if __name__ == "__main__":
+    for name in build_missing(sys.argv[1:] or None):
+        print(f"{name} -> {index_path(name)}")
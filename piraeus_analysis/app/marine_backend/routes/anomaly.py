@@ -0,0 +1,85 @@
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from fastapi import APIRouter, HTTPException, Query
+from marine_backend.core import vessel_index
+from marine_backend.core.anomaly_service import (
+    DEFAULT_VARIANT, INPUT_COLUMNS, MODEL_VARIANTS, ModelUnavailable, anomaly_service,
+)
+from marine_backend.core.cache import result_cache
+from marine_backend.core.executor import run_io
+from marine_backend.core.parquet_store import catalog
+from marine_backend.core.readers import iter_vessel_tables
+
+router = APIRouter()
+
+# without a vessel_id, the window must be bounded and at most this long
+ANOMALY_MAX_SPAN_MS = 86_400_000
+ANOMALY_MAX_ROWS = 10_000
+
+@router.get("/anomaly/score")
+async def anomaly_score(
+    file: str,
+    vessel_id: Optional[str] = Query(None),
+    start_ts: Optional[int] = Query(None),
+    end_ts: Optional[int] = Query(None),
+    model: str = Query(DEFAULT_VARIANT),
+    min_score: Optional[float] = Query(None),
+    limit: int = Query(1_000, ge=1, le=ANOMALY_MAX_ROWS),
+):
+    """
+    BiLSTM anomaly score of every window of one vessel, or of every vessel
+    over at most ANOMALY_MAX_SPAN_MS, in a file/time window. Only windows
+    scoring at least ``min_score`` (default: the model threshold) are
+    listed, the first ``limit`` in (vessel, time) order; ``total`` counts
+    them all. ``windows_per_sec`` is the inference rate of the computing
+    call.
+    """
+    if model not in MODEL_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"model must be one of {sorted(MODEL_VARIANTS)}")
+    if vessel_id is None and (
+        start_ts is None or end_ts is None or end_ts - start_ts > ANOMALY_MAX_SPAN_MS
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail=f"give a vessel_id, or start_ts and end_ts at most {ANOMALY_MAX_SPAN_MS} ms apart",
+        )
+    start_ts = -10**18 if start_ts is None else start_ts
+    end_ts = 10**18 if end_ts is None else end_ts
+
+    async def compute():
+        try:
+            detector = await anomaly_service.run(anomaly_service.model, model)
+        except ModelUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        table = await run_io(_read_rows, file, vessel_id, start_ts, end_ts)
+        scores, stats = await anomaly_service.score(table, model)
+        threshold = detector.threshold if min_score is None else min_score
+        scores = scores.filter(pc.greater_equal(scores["score"], threshold))
+        return {
+            "model": model,
+            "threshold": detector.threshold,
+            **stats,
+            "total": scores.num_rows,
+            "truncated": scores.num_rows > limit,
+            "scores": scores.slice(0, limit).to_pylist(),
+        }
+
+    return await result_cache.get_or_compute_async(
+        "anomaly_score",
+        {"vessel_id": vessel_id, "start_ts": start_ts, "end_ts": end_ts, "model": model,
+         "min_score": min_score, "limit": limit},
+        [file],
+        compute,
+    )
+
+
+def _read_rows(file: str, vessel_id: Optional[str], start_ts: int, end_ts: int) -> pa.Table:
+    # vessel-sorted rows with plain string vessel ids
+    if vessel_id is not None:
+        table = vessel_index.vessel_track(file, vessel_id, start_ts, end_ts, columns=INPUT_COLUMNS)
+    else:
+        parts = list(iter_vessel_tables(file, INPUT_COLUMNS, start_ts, end_ts))
+        table = pa.concat_tables(parts) if parts else catalog.meta(file).schema.empty_table().select(INPUT_COLUMNS)
+    return table.set_column(0, "vessel_id", table["vessel_id"].cast(pa.string()))
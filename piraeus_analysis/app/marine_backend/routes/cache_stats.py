@@ -0,0 +1,13 @@
+# marine_backend/routes/cache_stats.py
+from fastapi import APIRouter
+from marine_backend.core.cache import result_cache
+from marine_backend.core.executor import run_io
+
+router = APIRouter()
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit ratio and size of the shared route-result cache.
+    """
+    return await run_io(result_cache.stats)
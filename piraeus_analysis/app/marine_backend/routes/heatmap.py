@@ -1,46 +1,94 @@
+import json
+from typing import Optional
+
 import numpy as np
 from fastapi import APIRouter, Query
-from marine_backend.core.readers import read_time_window
+from fastapi.responses import Response
+from marine_backend.core.cache import result_cache
+from marine_backend.core.executor import run_io
+from marine_backend.core.heatmap_tiles import FIXED_BOUNDS, grid_edges, raw_counts, tile_counts, tiles_path
+from marine_backend.core.parquet_store import catalog
 
 router = APIRouter()
 
-# simple in-memory cache
-heatmap_cache = {}
+@router.get("/heatmap")
+async def heatmap(file: str, start_ts: int = Query(-10**18), end_ts: int = Query(10**18), cell_size: float = Query(0.001)):
+    """
+    Normalized counts per grid cell; the X-Heatmap-Start/End headers give the
+    time window actually counted (see heatmap_tiles.tile_counts).
+    """
+    body, start, end = await run_io(_cached, file, start_ts, end_ts, cell_size)
+    return Response(
+        body, media_type="application/json",
+        headers={"X-Heatmap-Start": str(start), "X-Heatmap-End": str(end)},
+    )
+
 
-FIXED_BOUNDS = {
-    "min_lat": 37.45947, "max_lat": 38.03808166666671,
-    "min_lon": 23.0350833333333, "max_lon": 23.8806466666667
-}
+def _cached(file: str, start_ts: int, end_ts: int, cell_size: float) -> tuple[bytes, int, int]:
+    # cache the encoded body so hits skip JSON serialization entirely; the
+    # tiles and the time-sorted copy decide whether the window is rounded
+    time_file = catalog.time_file(file)
+    try:
+        st = tiles_path(file).stat()
+        tiles = [st.st_mtime_ns, st.st_size]
+    except OSError:
+        tiles = None
+    return result_cache.get_or_compute(
+        "heatmap_window",
+        {"start_ts": start_ts, "end_ts": end_ts, "cell_size": cell_size, "tiles": tiles},
+        [file] + ([time_file] if time_file is not None else []),
+        lambda: _encoded(file, start_ts, end_ts, cell_size),
+    )
 
-@router.get("/heatmap")
-def heatmap(file: str, start_ts: int = Query(-10**18), end_ts: int = Query(10**18), cell_size: float = Query(0.001)):
-    cache_key = f"{file}_{cell_size}"
-    
-    # check cache
-    if cache_key in heatmap_cache:
-        return heatmap_cache[cache_key]
-
-    df = read_time_window(file, start_ts, end_ts)
-    if df.empty:
-        return []
-
-    lat_bins = np.arange(FIXED_BOUNDS["min_lat"], FIXED_BOUNDS["max_lat"] + cell_size, cell_size)
-    lon_bins = np.arange(FIXED_BOUNDS["min_lon"], FIXED_BOUNDS["max_lon"] + cell_size, cell_size)
-    heatmap_grid = np.zeros((len(lat_bins)-1, len(lon_bins)-1), dtype=int)
-
-    lat_idx = np.searchsorted(lat_bins, df['lat'].values, side='right') - 1
-    lon_idx = np.searchsorted(lon_bins, df['lon'].values, side='right') - 1
-    mask = (lat_idx >= 0) & (lat_idx < heatmap_grid.shape[0]) & (lon_idx >= 0) & (lon_idx < heatmap_grid.shape[1])
-    np.add.at(heatmap_grid, (lat_idx[mask], lon_idx[mask]), 1)
-
-    max_count = heatmap_grid.max()
-    points = [
-        [(lat_bins[i]+lat_bins[i+1])/2, (lon_bins[j]+lon_bins[j+1])/2, heatmap_grid[i,j]/max_count]
-        for i in range(heatmap_grid.shape[0]) 
-        for j in range(heatmap_grid.shape[1]) 
-        if heatmap_grid[i,j] > 0
-    ]
-
-    # store in cache
-    heatmap_cache[cache_key] = points
-    return points
+
+def _encoded(file: str, start_ts: int, end_ts: int, cell_size: float) -> tuple[bytes, int, int]:
+    points, start, end = heatmap_points(file, start_ts, end_ts, cell_size)
+    return json.dumps(points).encode(), start, end
+
+
+def heatmap_points(file: str, start_ts: int, end_ts: int, cell_size: float) -> tuple[list, int, int]:
+    # precomputed cubes when available, raw points otherwise
+    tiled = tile_counts(file, start_ts, end_ts, cell_size)
+    if tiled is None:
+        counts = raw_counts(file, start_ts, end_ts, cell_size)
+    else:
+        counts, start_ts, end_ts = tiled
+
+    lat_bins, lon_bins = grid_edges(cell_size)
+    heatmap_grid = counts.reshape(len(lat_bins) - 1, len(lon_bins) - 1)
+
+    max_count = heatmap_grid.max() if heatmap_grid.size else 0
+    if max_count == 0:
+        return [], start_ts, end_ts
+
+    i, j = np.nonzero(heatmap_grid)
+    lat_centers = (lat_bins[:-1] + lat_bins[1:]) / 2
+    lon_centers = (lon_bins[:-1] + lon_bins[1:]) / 2
+    points = np.column_stack(
+        (lat_centers[i], lon_centers[j], heatmap_grid[i, j] / max_count)
+    ).tolist()
+    return points, start_ts, end_ts
+
+
+@router.get("/bounds")
+async def bounds(file: Optional[str] = None):
+    """
+    Heatmap grid bounds plus the data extent of a file (or of the whole
+    dataset), answered from metadata without reading rows.
+    """
+    return {"heatmap": FIXED_BOUNDS, "data": await run_io(data_bounds, file)}
+
+
+def data_bounds(file: Optional[str]) -> Optional[dict]:
+    if file is None:
+        return catalog.dataset().get("bounds")
+
+    info = catalog.file_info(file)
+    if info is not None:
+        return info["bounds"]
+
+    meta = catalog.meta(file)
+    lat, lon = meta.column_range("lat"), meta.column_range("lon")
+    if lat is None or lon is None:
+        return None
+    return {"min_lat": lat[0], "max_lat": lat[1], "min_lon": lon[0], "max_lon": lon[1]}
@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import pyarrow as pa
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from marine_backend.core.anomaly_service import ModelUnavailable
+from marine_backend.core.live_stream import MESSAGE_COLUMNS, live_service
+from marine_backend.utils.stream_format import ARROW_STREAM
+
+router = APIRouter()
+
+
+def _columns(table: pa.Table) -> dict:
+    # vessel_id and integer t are required on every message; a missing
+    # position, speed or course becomes NaN and only keeps windows unscored
+    missing = [c for c in MESSAGE_COLUMNS if c not in table.column_names]
+    if missing:
+        raise ValueError(f"missing columns {missing}")
+    for c in ("vessel_id", "t"):
+        if table[c].null_count:
+            raise ValueError(f"{c} must not be null")
+
+    vessel = table["vessel_id"]
+    if pa.types.is_dictionary(vessel.type):
+        vessel = vessel.cast(vessel.type.value_type)
+    if not (pa.types.is_string(vessel.type) or pa.types.is_large_string(vessel.type)
+            or pa.types.is_integer(vessel.type)):
+        raise ValueError(f"vessel_id must be a string, not {vessel.type}")
+    if not pa.types.is_integer(table["t"].type):
+        raise ValueError(f"t must be an integer (epoch ms), not {table['t'].type}")
+
+    out = {"vessel_id": vessel.cast(pa.string()).to_pylist(), "t": table["t"].to_numpy()}
+    for c in MESSAGE_COLUMNS[2:]:
+        col = table[c]
+        if not (pa.types.is_integer(col.type) or pa.types.is_floating(col.type) or pa.types.is_null(col.type)):
+            raise ValueError(f"{c} must be a number, not {col.type}")
+        out[c] = col.cast(pa.float64()).to_numpy(zero_copy_only=False)
+    return out
+
+
+def _json_table(messages) -> pa.Table:
+    if isinstance(messages, dict):
+        messages = [messages]
+    return pa.Table.from_pylist(messages)
+
+
+@router.post("/live/messages")
+async def live_messages(request: Request):
+    """
+    Push AIS messages (vessel_id, t, lat, lon, speed, course) to the live
+    detector, as an Arrow IPC stream (Content-Type ARROW_STREAM) or a JSON
+    object or list. Late messages are counted but not scored.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith(ARROW_STREAM):
+            table = pa.ipc.open_stream(body).read_all()
+        else:
+            table = _json_table(json.loads(body))
+        if table.num_rows == 0:
+            return {"received": 0, "accepted": 0}
+        accepted = await live_service.push(_columns(table))
+    except ModelUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (ValueError, TypeError, pa.ArrowException) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"received": table.num_rows, "accepted": accepted}
+
+
+@router.get("/live/stats")
+async def live_stats():
+    return live_service.stats()
+
+
+@router.websocket("/live/ws")
+async def live_ws(websocket: WebSocket):
+    """
+    Live scores, as {"type": "scores", "scores": [...], ...} messages.
+    Text messages from the client are pushed like POST /live/messages
+    bodies; a client too slow to keep up loses the oldest score batches.
+    While the model cannot be loaded, a push is answered with an error
+    (status 503) and the socket is closed with code 1013 (try again later).
+    """
+    await websocket.accept()
+    queue = live_service.subscribe()
+
+    async def receive():
+        while True:
+            text = await websocket.receive_text()
+            try:
+                table = _json_table(json.loads(text))
+                await live_service.push(_columns(table))
+            except ModelUnavailable as e:
+                await websocket.send_json({"type": "error", "status": 503, "detail": str(e)})
+                await websocket.close(code=1013)
+                return
+            except (ValueError, TypeError, pa.ArrowException) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+
+    receiver = asyncio.create_task(receive())
+    sender = None
+    try:
+        while True:
+            sender = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                receiver.result()
+                return
+            await websocket.send_json(sender.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        live_service.unsubscribe(queue)
+        receiver.cancel()
+        if sender is not None:
+            sender.cancel()
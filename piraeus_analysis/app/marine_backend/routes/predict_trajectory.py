@@ -1,27 +1,24 @@
 # marine_backend/routes/predict_trajectory.py
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
 
-from marine_backend.core.readers import read_time_window
+from marine_backend.core.vessel_index import vessel_track
+from marine_backend.core.cache import result_cache
+from marine_backend.core.executor import run_io
+from marine_backend.core.predictor_service import PredictorUnavailable, predictor_service
 
 router = APIRouter()
 
 
 from pathlib import Path
 import pandas as pd
-from autogluon.timeseries import TimeSeriesPredictor, TimeSeriesDataFrame
 
+try:
+    from autogluon.timeseries import TimeSeriesDataFrame
+except ImportError:
+    TimeSeriesDataFrame = None
 
-def load_predictors(model_dir: Path):
-    """
-    Load pretrained Chronos-2 predictors.
-    """
-    return (
-        TimeSeriesPredictor.load(model_dir / "lat"),
-        TimeSeriesPredictor.load(model_dir / "lon"),
-    )
 
-
-def load_jan_2018(csv_dir: Path) -> TimeSeriesDataFrame:
+def load_jan_2018(csv_dir: Path) -> "TimeSeriesDataFrame":
     """
     Load January 2018 AIS data into TimeSeriesDataFrame.
     """
@@ -37,35 +34,42 @@ def load_jan_2018(csv_dir: Path) -> TimeSeriesDataFrame:
     )
 
 
-def predict(ts_df, lat_model, lon_model) -> pd.DataFrame:
+def _vessel_frame(file: str, start_ts: int, end_ts: int, vessel_id: str) -> pd.DataFrame:
     """
-    Predict latitude and longitude.
+    The requested vessel's fixes in the window, shaped for PredictorService.
     """
-    lat = lat_model.predict(ts_df)["mean"]
-    lon = lon_model.predict(ts_df)["mean"]
-
-    out = lat.to_frame("lat")
-    out["lon"] = lon
-    return out
+    table = vessel_track(file, vessel_id, start_ts, end_ts, columns=["t", "lat", "lon"])
+    df = table.to_pandas().dropna(subset=["lat", "lon"])
+    df["timestamp"] = pd.to_datetime(df["t"], unit="ms")
+    df["item_id"] = vessel_id
+    return df.drop_duplicates("timestamp")[["item_id", "timestamp", "t", "lat", "lon"]]
 
 
-t = {"actual" : None,"predicted" : None}
 @router.get("/predict_trajectory")
-def predict_trajectory(file: str, start_ts: int = Query(-10**18), end_ts: int = Query(10**18), vessel_id: str = Query(...)):
+async def predict_trajectory(file: str, start_ts: int = Query(-10**18), end_ts: int = Query(10**18), vessel_id: str = Query(...)):
     """
-    End-to-end evaluation.
+    Forecast the next positions of one vessel from its fixes in the window.
     """
-    MODEL_DIR = Path("../models")
-
-    lat_model, lon_model = load_predictors(MODEL_DIR)
-    df = read_time_window(file, start_ts, end_ts)
-
-    pred = predict(df, lat_model, lon_model)
-    
-    if vessel_id is None:
-        vessel_id = df.index.get_level_values(0)[0]
-
-    t["actual"] = df.loc[vessel_id][["lat", "lon"]]
-    t["predicted"] = pred.loc[vessel_id]
-
-    return (t["actual"], t["predicted"], vessel_id)
+    async def compute():
+        df = await run_io(_vessel_frame, file, start_ts, end_ts, vessel_id)
+        if df.empty:
+            raise HTTPException(404, f"no fixes for vessel {vessel_id} in window")
+
+        try:
+            pred = await predictor_service.predict(df[["item_id", "timestamp", "lat", "lon"]])
+        except PredictorUnavailable as e:
+            raise HTTPException(503, str(e))
+        pred["t"] = pred["timestamp"].astype("datetime64[ms]").astype("int64")
+
+        return {
+            "vessel_id": vessel_id,
+            "actual": df[["t", "lat", "lon"]].to_dict(orient="records"),
+            "predicted": pred[["t", "lat", "lon"]].to_dict(orient="records"),
+        }
+
+    return await result_cache.get_or_compute_async(
+        "predict_trajectory",
+        {"start_ts": start_ts, "end_ts": end_ts, "vessel_id": vessel_id},
+        [file],
+        compute,
+    )
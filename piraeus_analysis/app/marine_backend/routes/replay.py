@@ -0,0 +1,124 @@
+import asyncio
+import json
+import math
+from typing import Optional
+
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+from marine_backend.core.executor import run_io
+from marine_backend.core.replay import DEFAULT_STALE_MS, ReplayCursor
+
+router = APIRouter()
+
+DEFAULT_INTERVAL_MS = 100
+MAX_SPEED = 1e6   # data ms per wall ms: a month in about 3 s
+_CLOSED = object()
+
+
+@router.websocket("/replay")
+async def replay(
+    websocket: WebSocket,
+    file: str = Query(...),
+    start_ts: Optional[int] = Query(None),
+    end_ts: Optional[int] = Query(None),
+    speed: float = Query(60.0, gt=0, le=MAX_SPEED),
+    interval_ms: int = Query(DEFAULT_INTERVAL_MS, ge=20, le=60_000),
+    stale_ms: int = Query(DEFAULT_STALE_MS, ge=0),
+):
+    """
+    Time-lapse replay of a file, stepped on the server.
+
+    Every ``interval_ms`` of wall time while playing, the replay advances by
+    ``speed * interval_ms`` of data time and sends a frame (see
+    core.replay). The client controls it with JSON messages:
+
+        {"action": "play"} / {"action": "pause"}
+        {"action": "seek", "t": <ms>}        -> snapshot
+        {"action": "speed", "speed": <data ms per wall ms, up to MAX_SPEED>}
+
+    and gets a {"type": "state", ...} message after each. A slow client
+    slows the replay down instead of queueing frames.
+    """
+    await websocket.accept()
+    try:
+        cursor = await run_io(ReplayCursor, file, start_ts, end_ts, stale_ms)
+    except OSError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1008)
+        return
+
+    inbox = asyncio.Queue(maxsize=16)
+
+    async def receive():
+        try:
+            while True:
+                await inbox.put(await websocket.receive_text())
+        except WebSocketDisconnect:
+            await inbox.put(_CLOSED)
+
+    receiver = asyncio.create_task(receive())
+    try:
+        await _play(websocket, cursor, inbox, speed, interval_ms)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+
+async def _play(websocket: WebSocket, cursor: ReplayCursor, inbox: asyncio.Queue,
+                speed: float, interval_ms: int):
+    loop = asyncio.get_running_loop()
+    playing = False
+    next_tick = 0.0
+
+    def state() -> dict:
+        return {
+            "type": "state", "t": cursor.t, "playing": playing, "speed": speed,
+            "interval_ms": interval_ms, "start": cursor.start, "end": cursor.end,
+        }
+
+    await websocket.send_json(await run_io(cursor.seek, cursor.start))
+    await websocket.send_json(state())
+
+    while True:
+        try:
+            timeout = max(0.0, next_tick - loop.time()) if playing else None
+            text = await asyncio.wait_for(inbox.get(), timeout)
+        except asyncio.TimeoutError:
+            frame = await run_io(cursor.advance, cursor.t + round(speed * interval_ms))
+            await websocket.send_json(frame)
+            if frame["done"]:
+                playing = False
+                await websocket.send_json(state())
+            # no catching up after a slow send: the next frame is one interval away
+            next_tick = max(next_tick + interval_ms / 1000, loop.time())
+            continue
+
+        if text is _CLOSED:
+            return
+        try:
+            msg = json.loads(text)
+            action = msg["action"]
+            if action == "play":
+                if cursor.t >= cursor.end:
+                    await websocket.send_json(await run_io(cursor.seek, cursor.start))
+                playing = True
+                next_tick = loop.time()
+            elif action == "pause":
+                playing = False
+            elif action == "seek":
+                t = msg["t"]
+                if isinstance(t, float) and not math.isfinite(t):
+                    raise ValueError("t must be finite")
+                await websocket.send_json(await run_io(cursor.seek, int(t)))
+                next_tick = loop.time()
+            elif action == "speed":
+                value = float(msg["speed"])
+                if not 0 < value <= MAX_SPEED:
+                    raise ValueError(f"speed must be in (0, {MAX_SPEED:g}]")
+                speed = value
+            else:
+                raise ValueError(f"unknown action {action!r}")
+        except (ValueError, KeyError, TypeError, OverflowError) as e:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            continue
+        await websocket.send_json(state())
@@ -1,72 +1,44 @@
 # marine_backend/routes/stream_rows.py
-from fastapi import APIRouter, Query
-from marine_backend.core.readers import read_row
-import json
-from fastapi.responses import StreamingResponse
-from marine_backend.utils.data_process import sanitize_row
+from fastapi import APIRouter, Query, Request
+from marine_backend.core.readers import estimate_rows, iter_time_window, read_row_range
+from marine_backend.utils.stream_format import DEFAULT_BATCH_ROWS, negotiate_format, stream_batches
 from typing import Optional
-from marine_backend.core.parquet_store import PARQUET_DIR
-import pyarrow.parquet as pq
+from marine_backend.core.parquet_store import catalog
+from marine_backend.core.executor import run_io
 
 router = APIRouter()
 
 @router.get("/rows/stream")
-def stream_rows(
+async def stream_rows(
+    request: Request,
     file: str,
     start: int = Query(0),
     end: int = Query(100),
+    format: Optional[str] = Query(None),
+    batch_rows: int = Query(DEFAULT_BATCH_ROWS),
 ):
     """
     Stream AIS rows by index range from a parquet file.
     """
-    def generator():
-        for idx in range(start, end):
-            try:
-                row = read_row(file, idx)
-                row = sanitize_row(row)
-            except IndexError:
-                break
+    fmt = negotiate_format(request, format)
+    meta = await run_io(catalog.meta, file)
+    total = max(min(end, meta.num_rows) - max(start, 0), 0)
 
-            yield json.dumps({
-                "progress": int((idx - start + 1) * 100 / max(end - start, 1)),
-                "row": row,
-            }) + "\n"
-
-    return StreamingResponse(generator(), media_type="text/plain")
+    return stream_batches(
+        read_row_range(file, start, end), fmt, total, batch_rows, schema=meta.schema
+    )
 
 @router.get("/analysis-multi/stream")
-def analysis_multi_stream(
+async def analysis_multi_stream(
+    request: Request,
     files: list[str] = Query(...),
     start_ts: Optional[int] = None,
-    end_ts: Optional[int] = None
+    end_ts: Optional[int] = None,
+    format: Optional[str] = Query(None),
+    batch_rows: int = Query(DEFAULT_BATCH_ROWS),
 ):
-    def generator():
-        total_rows = 0
-        # count total rows (optional, for progress)
-        for file in files:
-            pq_file = pq.ParquetFile(PARQUET_DIR / file)
-            for g in range(pq_file.num_row_groups):
-                df = pq_file.read_row_group(g).to_pandas()
-                if start_ts is not None:
-                    df = df[df["t"] >= start_ts]
-                if end_ts is not None:
-                    df = df[df["t"] <= end_ts]
-                total_rows += len(df)
-        sent = 0
-        # yield rows one by one
-        for file in files:
-            pq_file = pq.ParquetFile(PARQUET_DIR / file)
-            for g in range(pq_file.num_row_groups):
-                df = pq_file.read_row_group(g).to_pandas()
-                if start_ts is not None:
-                    df = df[df["t"] >= start_ts]
-                if end_ts is not None:
-                    df = df[df["t"] <= end_ts]
-                for r in df.to_dict(orient="records"):
-                    sent += 1
-                    yield json.dumps({
-                        "progress": int(sent * 100 / max(total_rows, 1)),
-                        "row": sanitize_row(r),
-                    }) + "\n"
-    return StreamingResponse(generator(), media_type="text/plain")
+    fmt = negotiate_format(request, format)
 
+    # one decode pass; progress is measured against a metadata-only estimate
+    total = await run_io(estimate_rows, files, start_ts, end_ts)
+    return stream_batches(iter_time_window(files, start_ts, end_ts), fmt, total, batch_rows)
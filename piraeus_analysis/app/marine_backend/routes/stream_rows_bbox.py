@@ -0,0 +1,46 @@
+# marine_backend/routes/stream_rows_bbox.py
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import Optional
+
+from marine_backend.core.readers import estimate_rows, iter_time_window
+from marine_backend.core.parquet_store import catalog
+from marine_backend.core.executor import run_io
+from marine_backend.utils.stream_format import DEFAULT_BATCH_ROWS, negotiate_format, stream_batches
+
+router = APIRouter()
+
+@router.get("/rows/bbox")
+async def stream_rows_bbox(
+    request: Request,
+    file: str = Query(...),
+    min_lat: float = Query(...),
+    max_lat: float = Query(...),
+    min_lon: float = Query(...),
+    max_lon: float = Query(...),
+    start_ts: Optional[int] = Query(None),
+    end_ts: Optional[int] = Query(None),
+    format: Optional[str] = Query(None),
+    batch_rows: int = Query(DEFAULT_BATCH_ROWS),
+):
+    """
+    Stream AIS rows inside a lat/lon box (bounds inclusive), optionally
+    within a time window.
+
+    Reads the cell-clustered copy of the file when csv_to_parquet.py wrote
+    one, so only the few row groups whose lat/lon statistics meet the box
+    are decoded; rows then come in cell order. Without it the file itself
+    is pruned the same way.
+    """
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(400, "min_lat/min_lon must not exceed max_lat/max_lon")
+
+    fmt = negotiate_format(request, format)
+    meta = await run_io(catalog.meta, file)
+    source = await run_io(catalog.spatial_file, file) or file
+    lat_range, lon_range = (min_lat, max_lat), (min_lon, max_lon)
+
+    total = await run_io(estimate_rows, [source], start_ts, end_ts, lat_range, lon_range)
+    batches = iter_time_window(
+        [source], start_ts, end_ts, columns=meta.schema.names, lat_range=lat_range, lon_range=lon_range
+    )
+    return stream_batches(batches, fmt, total, batch_rows, schema=meta.schema)
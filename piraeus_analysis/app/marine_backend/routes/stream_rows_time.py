@@ -1,58 +1,58 @@
 # marine_backend/routes/stream_rows_time.py
-from fastapi import APIRouter, Query
-from fastapi.responses import StreamingResponse
-import json
+from fastapi import APIRouter, Query, Request
+from typing import Optional
 
 from marine_backend.core.readers import read_time_window
-from marine_backend.utils.data_process import sanitize_row
+from marine_backend.core.parquet_store import catalog
+from marine_backend.core.cache import result_cache
+from marine_backend.core.executor import run_io
+from marine_backend.utils.stream_format import DEFAULT_BATCH_ROWS, negotiate_format, stream_batches
 import pyarrow.compute as pc
 
 router = APIRouter()
 
 @router.get("/rows/stream_time")
-def stream_rows_time(
+async def stream_rows_time(
+    request: Request,
     file: str = Query(...),
     start_ts: int = Query(...),
     end_ts: int = Query(...),
+    format: Optional[str] = Query(None),
+    batch_rows: int = Query(DEFAULT_BATCH_ROWS),
 ):
     """
     Stream AIS rows filtered by timestamp window using PyArrow directly.
     """
-    def generator():
-        table: pa.Table = read_time_window(file, start_ts, end_ts)
-        columns = table.column_names
-        col_values = [table.column(c).to_pylist() for c in columns]
-        total = table.num_rows
-
-        for i in range(total):
-            row = {col: col_values[j][i] for j, col in enumerate(columns)}
-            d = sanitize_row(row)
-            yield json.dumps(
-                {
-                    "progress": int((i + 1) * 100 / max(total, 1)),
-                    "row": d,
-                },
-                allow_nan=False,
-            ) + "\n"
-
-    return StreamingResponse(generator(), media_type="text/plain")
+    fmt = negotiate_format(request, format)
+    table = await run_io(read_time_window, file, start_ts, end_ts)
+
+    return stream_batches(
+        table.to_batches(), fmt, table.num_rows, batch_rows, schema=table.schema
+    )
 
 @router.get("/rows/time_bounds")
-def time_bounds(file: str):
-    table = read_time_window(file, -10**18, 10**18)
+async def time_bounds(file: str):
+    return await run_io(
+        result_cache.get_or_compute, "time_bounds", {}, [file], lambda: file_time_bounds(file)
+    )
+
 
-    # pick first column (or 't'/'timestamp' if you prefer)
-    col_name = table.schema.names[0]
+def file_time_bounds(file: str) -> dict:
+    # dataset metadata first, then row-group statistics when every row
+    # group has them
+    info = catalog.file_info(file)
+    if info is not None:
+        return {"min": int(info["t_min"]), "max": int(info["t_max"])}
 
-    # get the column as a single ChunkedArray
-    arr = table.column(col_name).combine_chunks()
+    bounds = catalog.meta(file).column_range("t")
 
-    # compute min and max using pyarrow.compute
-    min_val = pc.min(arr).as_py()
-    max_val = pc.max(arr).as_py()
+    if bounds is None:
+        table = read_time_window(file, -10**18, 10**18, columns=["t"])
+        arr = table.column("t").combine_chunks()
+        bounds = (pc.min(arr).as_py(), pc.max(arr).as_py())
 
+    min_val, max_val = bounds
     return {
         "min": int(min_val),
         "max": int(max_val)
     }
-
@@ -0,0 +1,45 @@
+import json
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
+from marine_backend.core.cache import result_cache
+from marine_backend.core.executor import run_io
+from marine_backend.core.track_lod import LOD_ZOOMS, lod_level, simplified_tracks, zoom_tolerance
+
+router = APIRouter()
+
+MAX_ZOOM = 30
+
+@router.get("/tracks")
+async def tracks(
+    file: str,
+    zoom: Optional[float] = Query(None, ge=0, le=MAX_ZOOM),
+    tolerance: Optional[float] = Query(None, gt=0),
+    start_ts: int = Query(-10**18),
+    end_ts: int = Query(10**18),
+):
+    """
+    Per-vessel polylines simplified for a map zoom (or a tolerance in
+    Mercator degrees). The track is served at the nearest precomputed level
+    at least as detailed as asked; beyond the finest one every fix is sent.
+    """
+    if zoom is None and tolerance is None:
+        raise HTTPException(status_code=400, detail="zoom or tolerance is required")
+    if tolerance is None:
+        tolerance = zoom_tolerance(zoom)
+    level = lod_level(tolerance)
+
+    # keyed by level, so all zooms sharing one reuse the encoded body
+    body = await run_io(
+        result_cache.get_or_compute,
+        "tracks",
+        {"level": level, "start_ts": start_ts, "end_ts": end_ts},
+        [file],
+        lambda: json.dumps({
+            "level": level,
+            "zoom": LOD_ZOOMS[level] if level < len(LOD_ZOOMS) else None,
+            "tracks": simplified_tracks(file, level, start_ts, end_ts),
+        }).encode(),
+    )
+    return Response(body, media_type="application/json")
@@ -1,14 +1,36 @@
 # marine_backend/routes/unique_vessel_info.py
 from fastapi import APIRouter, Query
-from marine_backend.core.readers import read_time_window
+from fastapi.responses import JSONResponse
+from marine_backend.core import vessel_index
+from marine_backend.core.cache import result_cache
+from marine_backend.core.executor import run_io
+from marine_backend.utils.data_process import sanitize_batch
 
 router = APIRouter()
 
 @router.get("/unique-vessels")
-def unique_vessels(file: str, start_ts: int = -10**18, end_ts: int = 10**18):
+async def unique_vessels(file: str, start_ts: int = -10**18, end_ts: int = 10**18):
     """
     Return list of unique vessel IDs in a file/time window.
     """
-    df = read_time_window(file, start_ts, end_ts)
-    vessels = df.index.get_level_values(0).unique().tolist()
-    return vessels
+    return await run_io(
+        result_cache.get_or_compute,
+        "unique_vessels",
+        {"start_ts": start_ts, "end_ts": end_ts},
+        [file],
+        lambda: vessel_index.unique_vessels(file, start_ts, end_ts),
+    )
+
+@router.get("/vessel-track")
+async def vessel_track(file: str, vessel_id: str = Query(...), start_ts: int = -10**18, end_ts: int = 10**18):
+    """
+    Return every fix of one vessel in a file/time window, read through the
+    vessel index.
+    """
+    rows = await run_io(_track_rows, file, vessel_id, start_ts, end_ts)
+    return JSONResponse({"vessel_id": vessel_id, "rows": rows})
+
+
+def _track_rows(file: str, vessel_id: str, start_ts: int, end_ts: int) -> list[dict]:
+    table = vessel_index.vessel_track(file, vessel_id, start_ts, end_ts)
+    return [row for b in table.to_batches() for row in sanitize_batch(b).to_pylist()]
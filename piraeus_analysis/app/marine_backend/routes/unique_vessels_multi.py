@@ -1,8 +1,9 @@
 # marine_backend/routes/unique_vessels_multi.py
 from fastapi import APIRouter, Request
-from marine_backend.core.readers import read_time_window
+from marine_backend.core import vessel_index
+from marine_backend.core.executor import run_io
+import asyncio
 import json
-import time
 from fastapi.responses import StreamingResponse
 
 router = APIRouter()
@@ -15,13 +16,19 @@ async def unique_vessels_multi(request: Request):
     data = await request.json()
     files = data.get("files", [])
 
+    async def count(file):
+        return file, await run_io(vessel_index.count_vessels, file)
+
     async def streamer():
-        total_files = len(files)
-        for i, file in enumerate(files):
-            df = read_time_window(file, -10**18, 10**18)
-            unique_count = int(df["vessel_id"].nunique()) if not df.empty else 0
-            progress = int(((i + 1) / total_files) * 100)
-            yield json.dumps({"file": file, "unique_vessels": unique_count, "progress": progress}) + "\n"
-            time.sleep(0.1)  # optional: simulate delay / allow frontend to see progress
+        # files are counted in parallel on the I/O pool; each result is sent as it completes
+        tasks = [asyncio.ensure_future(count(file)) for file in files]
+        try:
+            for i, done in enumerate(asyncio.as_completed(tasks)):
+                file, unique_count = await done
+                progress = int(((i + 1) / len(tasks)) * 100)
+                yield json.dumps({"file": file, "unique_vessels": unique_count, "progress": progress}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
 
     return StreamingResponse(streamer(), media_type="text/plain")
@@ -1,14 +1,35 @@
 # marine_backend/server.py
-from pathlib import Path
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from marine_backend.routes.stream_rows import router as stream_router
 from marine_backend.routes.stream_rows_time import router as stream_router_time
+from marine_backend.routes.stream_rows_bbox import router as stream_router_bbox
 from marine_backend.routes.heatmap import router as heatmap_router
 from marine_backend.routes.unique_vessels_multi import router as unique_vessels_multi
+from marine_backend.routes.unique_vessel_info import router as unique_vessel_info_router
 from marine_backend.routes.predict_trajectory import router as predict_trajectory_router
+from marine_backend.routes.cache_stats import router as cache_stats_router
+from marine_backend.routes.tracks import router as tracks_router
+from marine_backend.routes.replay import router as replay_router
+from marine_backend.routes.anomaly import router as anomaly_router
+from marine_backend.routes.live import router as live_router
+from marine_backend.core.parquet_store import catalog
+from marine_backend.core.predictor_service import predictor_service
+from marine_backend.core.live_stream import live_service
+from marine_backend.core.executor import run_io
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # batching loop of the Chronos predictors, which load on first use
+    await predictor_service.start()
+    # live anomaly scoring tick; its model loads with the first message
+    await live_service.start()
+    yield
+    await live_service.stop()
+    await predictor_service.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,27 +37,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Rows", "X-Heatmap-Start", "X-Heatmap-End"],
 )
 
 app.include_router(stream_router)
 app.include_router(stream_router_time)
+app.include_router(stream_router_bbox)
 app.include_router(heatmap_router)
 app.include_router(unique_vessels_multi)
+app.include_router(unique_vessel_info_router)
 app.include_router(predict_trajectory_router)
-
-PARQUET_DIR = Path("./marine_backend/parquet")  
+app.include_router(cache_stats_router)
+app.include_router(tracks_router)
+app.include_router(replay_router)
+app.include_router(anomaly_router)
+app.include_router(live_router)
 
 @app.get("/files")
-def get_files():
-    files = []
-    for pq_file in sorted(PARQUET_DIR.rglob("*.parquet")):
-        # optional: include relative path so frontend can identify year
-        files.append({"name": str(pq_file.relative_to(PARQUET_DIR))})
-    return files
+async def get_files():
+    # relative path so frontend can identify year
+    return await run_io(list_files)
+
+
+def list_files() -> list[dict]:
+    # rows / time range / vessel count come from the dataset metadata when present
+    out = []
+    for name in catalog.files():
+        entry = {"name": name}
+        info = catalog.file_info(name)
+        if info is not None:
+            entry.update({k: info[k] for k in ("num_rows", "t_min", "t_max", "unique_vessels")})
+        out.append(entry)
+    return out
 
 if __name__ == "__main__":
-    files = []
-    for pq_file in sorted(PARQUET_DIR.rglob("*.parquet")):
-        # optional: include relative path so frontend can identify year
-        files.append({"name": str(pq_file.relative_to(PARQUET_DIR))})
-    print(files)
\ No newline at end of file
+    print([{"name": name} for name in catalog.files()])
\ No newline at end of file
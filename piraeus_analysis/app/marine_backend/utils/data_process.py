@@ -2,6 +2,9 @@
 import math
 import numbers
 
+import pyarrow as pa
+import pyarrow.compute as pc
+
 
 def sanitize_row(d: dict) -> dict:
     """
@@ -18,3 +21,14 @@ def sanitize_row(d: dict) -> dict:
     return out
 
 
+def sanitize_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """
+    Column-level counterpart of sanitize_row.
+    Replaces NaN / inf in floating point columns with null.
+    """
+    columns = []
+    for col in batch.columns:
+        if pa.types.is_floating(col.type):
+            col = pc.if_else(pc.is_finite(col), col, pa.scalar(None, col.type))
+        columns.append(col)
+    return pa.RecordBatch.from_arrays(columns, schema=batch.schema)
@@ -0,0 +1,144 @@
+# marine_backend/utils/stream_format.py
+import io
+import json
+from typing import Iterable, Iterator, Optional
+
+import pyarrow as pa
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from marine_backend.core.executor import iterate_io
+from marine_backend.utils.data_process import sanitize_batch
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+NDJSON = "application/x-ndjson"
+
+# rows   : legacy, one {"progress", "row"} JSON object per line
+# ndjson : one {"progress", "rows": [...]} JSON object per batch of rows
+# arrow  : Arrow IPC stream, one record batch per batch of rows
+STREAM_FORMATS = ("rows", "ndjson", "arrow")
+
+DEFAULT_BATCH_ROWS = 5000
+
+
+def negotiate_format(request: Request, fmt: Optional[str] = None) -> str:
+    """
+    Pick the stream format from an explicit ``format`` query parameter,
+    falling back to the Accept header and then to the legacy row format.
+    """
+    if fmt is not None:
+        if fmt not in STREAM_FORMATS:
+            raise HTTPException(400, f"format must be one of {STREAM_FORMATS}")
+        return fmt
+
+    accept = request.headers.get("accept", "")
+    if ARROW_STREAM in accept:
+        return "arrow"
+    if NDJSON in accept:
+        return "ndjson"
+    return "rows"
+
+
+def rebatch(batches: Iterable[pa.RecordBatch], batch_rows: int) -> Iterator[pa.RecordBatch]:
+    """
+    Regroup record batches into batches of exactly ``batch_rows`` rows
+    (the last one may be shorter).
+    """
+    pending = []
+    n = 0
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        pending.append(batch)
+        n += batch.num_rows
+        if n < batch_rows:
+            continue
+
+        table = pa.Table.from_batches(pending).combine_chunks()
+        full = (n // batch_rows) * batch_rows
+        for off in range(0, full, batch_rows):
+            yield from table.slice(off, batch_rows).to_batches()
+        rest = table.slice(full)
+        pending = rest.to_batches()
+        n = rest.num_rows
+
+    if n:
+        yield from pa.Table.from_batches(pending).combine_chunks().to_batches()
+
+
+def _progress(sent: int, total: Optional[int]) -> int:
+    if not total:
+        return 100
+    return min(int(sent * 100 / total), 100)
+
+
+def _encode_rows(batches, total):
+    sent = 0
+    for batch in batches:
+        sent += batch.num_rows
+        prefix = '{"progress": %d, "row": ' % _progress(sent, total)
+        yield "".join(prefix + json.dumps(row) + "}\n" for row in batch.to_pylist())
+
+
+def _encode_ndjson(batches, total):
+    sent = 0
+    for batch in batches:
+        sent += batch.num_rows
+        yield json.dumps({
+            "progress": _progress(sent, total),
+            "rows": batch.to_pylist(),
+        }) + "\n"
+
+
+def _encode_arrow(batches, total, schema):
+    sink = io.BytesIO()
+    writer = None
+    sent = 0
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    for batch in batches:
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        sent += batch.num_rows
+        writer.write_batch(batch, custom_metadata={"progress": str(_progress(sent, total))})
+        yield drain()
+
+    if writer is None:
+        if schema is None:
+            return
+        writer = pa.ipc.new_stream(sink, schema)
+    writer.close()
+    yield drain()
+
+
+def stream_batches(
+    batches: Iterable[pa.RecordBatch],
+    fmt: str,
+    total: Optional[int] = None,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+    schema: Optional[pa.Schema] = None,
+) -> StreamingResponse:
+    """
+    Build a StreamingResponse for record batches in the negotiated format.
+
+    NaN / inf become null column-wise and progress is computed once per batch
+    against ``total`` (a row count or an upper bound on it). For Arrow streams
+    the progress is attached to each batch's custom metadata and the total is
+    also sent in the ``X-Total-Rows`` header. Reading and encoding run on the
+    shared I/O pool.
+    """
+    batches = (sanitize_batch(b) for b in rebatch(batches, max(batch_rows, 1)))
+    headers = {"X-Total-Rows": str(total)} if total is not None else None
+
+    if fmt == "arrow":
+        body, media_type = _encode_arrow(batches, total, schema), ARROW_STREAM
+    elif fmt == "ndjson":
+        body, media_type = _encode_ndjson(batches, total), NDJSON
+    else:
+        body, media_type = _encode_rows(batches, total), "text/plain"
+    return StreamingResponse(iterate_io(body), media_type=media_type, headers=headers)
@@ -80,7 +80,7 @@ function App() {
     const controller = new AbortController();
     controllerRef.current = controller;
 
-    const res = await fetch(`http://localhost:8000/rows/stream?file=${encodeURIComponent(selectedFile)}&start=${startIdx}&end=${endIdx}`, {
+    const res = await fetch(`http://localhost:8000/rows/stream?file=${encodeURIComponent(selectedFile)}&start=${startIdx}&end=${endIdx}&format=ndjson`, {
       signal: controller.signal,
     });
 
@@ -98,27 +98,10 @@ function App() {
         buffer = lines.pop()!;
 
         for (const line of lines) {
-          // console.log(line)
+          // one line per batch of rows (format=ndjson)
           const msg = JSON.parse(line);
           setProgress(msg.progress);
-          // setAisData((prev) => [...prev, msg.row]);
-          const chunkSize = 500; // adjust for your memory/UX
-          let tempRows: AISRow[] = [];
-
-          for (const line of lines) {
-            const msg = JSON.parse(line);
-            setProgress(msg.progress);
-            tempRows.push(msg.row);
-
-            if (tempRows.length >= chunkSize) {
-              setAisData((prev) => [...prev, ...tempRows]);
-              tempRows = [];
-            }
-          }
-
-          // flush remaining
-          if (tempRows.length > 0) setAisData((prev) => [...prev, ...tempRows]);
-
+          setAisData((prev) => [...prev, ...msg.rows]);
         }
       }
     } catch (e) {
@@ -147,7 +130,7 @@ function App() {
     const [start_ts, end_ts] = timeRange;
 
     const res = await fetch(
-      `http://localhost:8000/rows/stream_time?file=${encodeURIComponent(selectedFile)}&start_ts=${start_ts}&end_ts=${end_ts}`,
+      `http://localhost:8000/rows/stream_time?file=${encodeURIComponent(selectedFile)}&start_ts=${start_ts}&end_ts=${end_ts}&format=ndjson`,
       { signal: controller.signal }
     );
 
@@ -167,7 +150,7 @@ function App() {
         for (const line of lines) {
           const msg = JSON.parse(line);
           setProgress(msg.progress);
-          setAisData((prev) => [...prev, msg.row]);
+          setAisData((prev) => [...prev, ...msg.rows]);
         }
       }
     } catch (e) {
@@ -0,0 +1,138 @@
+"""
+Throughput comparison of the CPU and GPU windowing backends of preprocess.py.
+
+Runs both backends over the same (synthetic or real) month, checks that
+windows and vids are bit-identical and prints windows/sec for each. The GPU
+backend is skipped when cudf/cupy/numba are not available.
+
+    python bench_windowing.py --points 2000000
+    python bench_windowing.py --csv /path/to/unipi_ais_dynamic_jan2018.csv
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from preprocess import (
+    HAS_GPU,
+    CPUWindower,
+    fused_mask_clamp_window_kernel,
+    init_gpu,
+    prepare_month,
+)
+from window_store import report_gaps
+
+if HAS_GPU:
+    import cupy as cp
+    from numba import cuda
+
+
+def synthetic_month(points, vessels, nan_ratio, seed=0):
+    rng = np.random.default_rng(seed)
+    speed = rng.uniform(-5, 120, points)
+    course = rng.uniform(-10, 400, points)
+    speed[rng.random(points) < nan_ratio] = np.nan
+    course[rng.random(points) < nan_ratio] = np.nan
+    return pd.DataFrame({
+        "t": rng.integers(1_500_000_000_000, 1_580_000_000_000, points),
+        "vessel_id": rng.integers(0, vessels, points).astype(str),
+        "lat": rng.uniform(37.5, 38.1, points),
+        "lon": rng.uniform(23.0, 24.0, points),
+        "speed": speed,
+        "course": course,
+    })
+
+
+def run_cpu(gathered, window_size, chunk_size, threads):
+    windower = CPUWindower(
+        gathered["vessel_id"].to_numpy(),
+        gathered["lat"].to_numpy(),
+        gathered["lon"].to_numpy(),
+        gathered["speed"].to_numpy(),
+        gathered["course"].to_numpy(),
+        report_gaps(gathered["vessel_id"].to_numpy(), gathered["t"].to_numpy()),
+        window_size,
+        threads=threads,
+    )
+    total = windower.total_windows
+    windows = np.empty((total, window_size, 5), dtype=np.float32)
+    vids = np.empty(total, dtype=np.int32)
+
+    t0 = time.perf_counter()
+    for start in range(0, total, chunk_size):
+        batch = min(chunk_size, total - start)
+        _, vids[start:start + batch] = windower(start, batch, out=windows[start:start + batch])
+    elapsed = time.perf_counter() - t0
+    windower.close()
+    return windows, vids, elapsed
+
+
+def run_gpu(gathered, window_size, chunk_size):
+    init_gpu()
+    cols = [
+        cp.asarray(gathered[c].to_numpy())
+        for c in ("vessel_id", "lat", "lon", "speed", "course")
+    ]
+    cols.append(cp.asarray(report_gaps(gathered["vessel_id"].to_numpy(), gathered["t"].to_numpy())))
+    N = len(gathered)
+    total = N - window_size + 1
+    windows = np.empty((total, window_size, 5), dtype=np.float32)
+    vids = np.empty(total, dtype=np.int32)
+    threads = 256
+
+    t0 = time.perf_counter()
+    for start in range(0, total, chunk_size):
+        batch = min(chunk_size, total - start)
+        win_dev = cp.empty(batch * window_size * 5, dtype=cp.float32)
+        vid_dev = cp.empty(batch, dtype=cp.int32)
+        fused_mask_clamp_window_kernel[(batch + threads - 1) // threads, threads](
+            *cols, start, N, window_size, win_dev, vid_dev
+        )
+        cuda.synchronize()
+        windows[start:start + batch] = cp.asnumpy(win_dev.reshape(batch, window_size, 5))
+        vids[start:start + batch] = cp.asnumpy(vid_dev)
+    elapsed = time.perf_counter() - t0
+    return windows, vids, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--csv", help="month CSV to window (default: synthetic data)")
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--vessels", type=int, default=500)
+    parser.add_argument("--nan-ratio", type=float, default=0.001)
+    parser.add_argument("--window-size", type=int, default=128)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.csv:
+        df = pd.read_csv(args.csv, usecols=["t", "vessel_id", "lat", "lon", "speed", "course"])
+    else:
+        df = synthetic_month(args.points, args.vessels, args.nan_ratio)
+    gathered = prepare_month(df)
+    del df
+
+    cpu_windows, cpu_vids, cpu_s = run_cpu(gathered, args.window_size, args.chunk_size, args.threads)
+    total = len(cpu_vids)
+    print(f"windows={total} valid={(cpu_vids >= 0).sum()}")
+    print(f"cpu ({args.threads} threads): {cpu_s:.2f}s  {total / cpu_s:,.0f} windows/s")
+
+    if not HAS_GPU:
+        print("gpu: skipped (cudf/cupy/numba not available)")
+        return
+
+    gpu_windows, gpu_vids, gpu_s = run_gpu(gathered, args.window_size, args.chunk_size)
+    print(f"gpu: {gpu_s:.2f}s  {total / gpu_s:,.0f} windows/s")
+
+    identical = (
+        np.array_equal(cpu_vids, gpu_vids)
+        and cpu_windows.view(np.uint32).tobytes() == gpu_windows.view(np.uint32).tobytes()
+    )
+    print(f"bit-identical: {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+"""
+Convert monthly AIS CSVs into the Parquet dataset read by the backend.
+
+Each ``unipi_ais_dynamic_{mon}{year}.csv`` under ``--root`` becomes
+``{out}/year=YYYY/month=MM/ais.parquet``:
+
+- rows sorted by vessel, then by 't' (out-of-core, see ingest.py)
+- ``--row-group-rows`` rows per row group
+- dictionary-encoded vessel_id, ZSTD compression
+- column statistics and the page index written for every column
+
+``{out}/_dataset.json`` records per file its row count, time range, lat/lon
+bounds and unique-vessel count, plus totals for the dataset, so the backend
+answers /files, /rows/time_bounds and /bounds without reading rows. Months
+whose CSV and output are unchanged since the last run are skipped.
+
+Unless ``--no-spatial`` is given, every month also gets a spatially
+clustered copy, ``{out}/_spatial/year=YYYY/month=MM/ais.parquet``: the same
+rows plus a ``cell`` column (Z-order / geohash-style id on a 2**16 x 2**16
+lat/lon grid), sorted by (cell, t) in row groups of
+``SPATIAL_ROW_GROUP_ROWS`` rows. Each row group then covers a small area,
+so its lat/lon statistics let /rows/bbox skip everything outside a
+viewport. The copy is sorted out of core: cells are cut into ranges of at
+most ``--chunk-rows`` rows (one cell is never split), spilled, and each
+range sorted on its own.
+
+Unless ``--no-time`` is given, every month also gets a time-sorted copy,
+``{out}/_time/year=YYYY/month=MM/ais.parquet``, sorted by (t, vessel_id) in
+row groups of ``TIME_ROW_GROUP_ROWS`` rows and built the same way (ranges
+cut on whole minutes). Its row-group 't' statistics are increasing, which
+makes them a time index: the /replay WebSocket seeks with a binary search
+and then reads one small row group at a time.
+
+    python csv_to_parquet.py --root /data/piraeus --out app/marine_backend/parquet
+"""
+import argparse
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingest import IngestConfig, csv_columns, merge_runs, spill_sorted_runs
+
+MONTH_ABBR = {
+    1: "jan", 2: "feb", 3: "mar", 4: "apr", 5: "may", 6: "jun",
+    7: "jul", 8: "aug", 9: "sep", 10: "oct", 11: "nov", 12: "dec"
+}
+
+DATASET_META_NAME = "_dataset.json"
+DATASET_META_VERSION = 1
+
+# paths starting with "_" are skipped by the backend catalog
+SPATIAL_DIR = "_spatial"
+SPATIAL_ROW_GROUP_ROWS = 16_384
+CELL_BITS = 16   # per axis: ~0.0055 deg of lon by ~0.0027 deg of lat
+TIME_DIR = "_time"
+TIME_ROW_GROUP_ROWS = 16_384
+TIME_RANGE_MS = 60_000   # sort ranges are cut on whole minutes
+
+# ~6 MB of column data per row group: enough rows for ZSTD and dictionary
+# pages to pay off, small enough that vessel_id statistics let a per-vessel
+# read skip most of a month
+ROW_GROUP_ROWS = 131_072
+DATA_PAGE_SIZE = 1024 * 1024
+ZSTD_LEVEL = 6
+
+_CSV_NAME = re.compile(r"unipi_ais_dynamic_([a-z]{3})(\d{4})\.csv$")
+
+
+def find_month_csvs(root) -> list:
+    """
+    (year, month, path) of every monthly CSV under ``root``, sorted.
+    """
+    abbr_to_month = {v: k for k, v in MONTH_ABBR.items()}
+    found = []
+    for path in Path(root).glob("unipi_ais_dynamic_*/unipi_ais_dynamic_*.csv"):
+        m = _CSV_NAME.search(path.name)
+        if m and m.group(1) in abbr_to_month:
+            found.append((int(m.group(2)), abbr_to_month[m.group(1)], path))
+    return sorted(found)
+
+
+def partition_name(year, month) -> str:
+    return f"year={year}/month={month:02d}/ais.parquet"
+
+
+def load_dataset_meta(out_dir) -> dict:
+    path = Path(out_dir) / DATASET_META_NAME
+    if path.exists():
+        data = json.loads(path.read_text())
+        if data.get("version") == DATASET_META_VERSION:
+            return data
+    return {"version": DATASET_META_VERSION, "files": {}}
+
+
+def save_dataset_meta(out_dir, data):
+    """
+    Recompute the dataset totals and write the metadata file atomically.
+    """
+    files = [f for f in data["files"].values() if f["num_rows"]]
+    data["num_rows"] = sum(f["num_rows"] for f in data["files"].values())
+    if files:
+        data["t_min"] = min(f["t_min"] for f in files)
+        data["t_max"] = max(f["t_max"] for f in files)
+        data["bounds"] = {
+            "min_lat": min(f["bounds"]["min_lat"] for f in files),
+            "max_lat": max(f["bounds"]["max_lat"] for f in files),
+            "min_lon": min(f["bounds"]["min_lon"] for f in files),
+            "max_lon": max(f["bounds"]["max_lon"] for f in files),
+        }
+
+    path = Path(out_dir) / DATASET_META_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2, sort_keys=True))
+    tmp.replace(path)
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    # 16-bit ints -> their bits at even positions of a 32-bit int
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    return (v | (v << 1)) & 0x55555555
+
+
+def cell_ids(lat, lon) -> np.ndarray:
+    """
+    Z-order cell id of each point: lon and lat grid indices on a
+    2**CELL_BITS grid over the globe, bits interleaved as in a geohash.
+    Nearby cells mostly have nearby ids. Missing coordinates map to cell 0.
+    """
+    n = 1 << CELL_BITS
+    x = np.nan_to_num((np.asarray(lon, dtype=np.float64) + 180.0) / 360.0 * n, nan=0.0)
+    y = np.nan_to_num((np.asarray(lat, dtype=np.float64) + 90.0) / 180.0 * n, nan=0.0)
+    x = np.clip(x, 0, n - 1).astype(np.int64)
+    y = np.clip(y, 0, n - 1).astype(np.int64)
+    return _spread_bits(x) | (_spread_bits(y) << 1)
+
+
+def arrow_schema(columns) -> pa.Schema:
+    fields = []
+    for c in columns:
+        if c == "t":
+            fields.append(pa.field(c, pa.int64()))
+        elif c == "vessel_id":
+            fields.append(pa.field(c, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(c, pa.float64()))
+    return pa.schema(fields)
+
+
+def convert_month(csv_path, out_path, cfg: IngestConfig, row_group_rows=ROW_GROUP_ROWS) -> dict:
+    """
+    Write one month as sorted Parquet; returns its metadata entry.
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+
+    columns = csv_columns(csv_path)
+    schema = arrow_schema(columns)
+    lat_min = lon_min = np.inf
+    lat_max = lon_max = -np.inf
+    rows = 0
+
+    with tempfile.TemporaryDirectory(prefix="ais_runs_", dir=cfg.spill_dir) as run_dir:
+        runs, vocab, t_min, t_max = spill_sorted_runs(csv_path, run_dir, cfg)
+
+        with pq.ParquetWriter(
+            tmp,
+            schema,
+            compression="zstd",
+            compression_level=ZSTD_LEVEL,
+            use_dictionary=["vessel_id"],
+            write_statistics=True,
+            write_page_index=True,
+            data_page_size=DATA_PAGE_SIZE,
+        ) as writer:
+            pending = []
+            n = 0
+
+            def flush(frames, final=False):
+                frame = pd.concat(frames, ignore_index=True)
+                full = len(frame) if final else (len(frame) // row_group_rows) * row_group_rows
+                if full:
+                    head = frame.iloc[:full]
+                    # codes index the month's sorted vessel list: one shared dictionary
+                    head = head.assign(vessel_id=pd.Categorical.from_codes(head["vessel_id"], vocab))
+                    writer.write_table(
+                        pa.Table.from_pandas(head, schema=schema, preserve_index=False),
+                        row_group_size=row_group_rows,
+                    )
+                return frame.iloc[full:]
+
+            for frame in merge_runs(runs, vocab, t_min, t_max, cfg):
+                rows += len(frame)
+                lat_min = min(lat_min, frame["lat"].min())
+                lat_max = max(lat_max, frame["lat"].max())
+                lon_min = min(lon_min, frame["lon"].min())
+                lon_max = max(lon_max, frame["lon"].max())
+
+                pending.append(frame)
+                n += len(frame)
+                if n >= row_group_rows:
+                    rest = flush(pending)
+                    pending, n = [rest], len(rest)
+
+            if n:
+                flush(pending, final=True)
+
+    tmp.replace(out_path)
+    st = out_path.stat()
+    src = os.stat(csv_path)
+    return {
+        "num_rows": rows,
+        "num_row_groups": pq.read_metadata(out_path).num_row_groups,
+        "t_min": int(t_min) if rows else None,
+        "t_max": int(t_max) if rows else None,
+        "bounds": {
+            "min_lat": float(lat_min), "max_lat": float(lat_max),
+            "min_lon": float(lon_min), "max_lon": float(lon_max),
+        } if rows else None,
+        "unique_vessels": int(len(vocab)),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "source": {"path": str(csv_path), "size": src.st_size, "mtime_ns": src.st_mtime_ns},
+    }
+
+
+def _key_ranges(pf: pq.ParquetFile, key_fn, columns, max_rows: int) -> np.ndarray:
+    """
+    Sort keys where a new range starts, so that each range holds at most
+    ``max_rows`` rows (or a single key).
+    """
+    keys = np.zeros(0, dtype=np.int64)
+    counts = np.zeros(0, dtype=np.int64)
+    for batch in pf.iter_batches(batch_size=max_rows, columns=columns):
+        u, c = np.unique(key_fn(pa.Table.from_batches([batch])), return_counts=True)
+        keys, inverse = np.unique(np.concatenate([keys, u]), return_inverse=True)
+        counts = np.bincount(inverse, np.concatenate([counts, c])).astype(np.int64)
+
+    starts = []
+    size = 0
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        if size and size + count > max_rows:
+            starts.append(key)
+            size = 0
+        size += count
+    return np.asarray(starts, dtype=np.int64)
+
+
+def _write_clustered(src_path, out_path, cfg: IngestConfig, key_fn, key_columns, sort_keys,
+                     row_group_rows, key_field=None) -> dict:
+    """
+    Write a copy of a month file re-sorted by ``sort_keys``; returns its
+    metadata. ``key_fn`` maps a table to an int64 key that orders rows like
+    ``sort_keys`` does; its ranges are spilled and sorted one at a time.
+    With ``key_field`` the key is also stored as that column.
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+
+    pf = pq.ParquetFile(src_path)
+    schema = pf.schema_arrow
+    if key_field is not None:
+        schema = schema.append(pa.field(key_field, pa.int64()))
+    starts = _key_ranges(pf, key_fn, key_columns, cfg.chunk_rows)
+
+    with tempfile.TemporaryDirectory(prefix="ais_sort_", dir=cfg.spill_dir) as run_dir:
+        # spill every row to the run of its key range (vessel ids decoded:
+        # IPC files cannot change dictionaries between batches)
+        spill_schema = pa.schema([
+            pa.field(f.name, f.type.value_type) if pa.types.is_dictionary(f.type) else f for f in schema
+        ])
+        writers = {}
+        try:
+            for batch in pf.iter_batches(batch_size=cfg.batch_rows):
+                table = pa.Table.from_batches([batch])
+                keys = key_fn(table)
+                if key_field is not None:
+                    table = table.append_column(key_field, pa.array(keys))
+                table = table.cast(spill_schema)
+                run = np.searchsorted(starts, keys, side="right")
+                order = np.argsort(run, kind="stable")
+                bounds = np.flatnonzero(np.r_[True, np.diff(run[order]) != 0, True])
+                for a, b in zip(bounds[:-1], bounds[1:]):
+                    k = int(run[order[a]])
+                    if k not in writers:
+                        sink = pa.OSFile(str(Path(run_dir) / f"run_{k:05d}.arrow"), "wb")
+                        writers[k] = (sink, pa.ipc.new_file(sink, spill_schema))
+                    writers[k][1].write_table(table.take(order[a:b]))
+        finally:
+            for sink, writer in writers.values():
+                writer.close()
+                sink.close()
+
+        rows = 0
+        with pq.ParquetWriter(
+            tmp,
+            schema,
+            compression="zstd",
+            compression_level=ZSTD_LEVEL,
+            use_dictionary=["vessel_id"],
+            write_statistics=True,
+            write_page_index=True,
+            data_page_size=DATA_PAGE_SIZE,
+        ) as writer:
+            for k in sorted(writers):
+                table = pa.ipc.open_file(pa.memory_map(str(Path(run_dir) / f"run_{k:05d}.arrow"))).read_all()
+                table = table.sort_by(sort_keys)
+                writer.write_table(table.cast(schema), row_group_size=row_group_rows)
+                rows += table.num_rows
+
+    tmp.replace(out_path)
+    st = out_path.stat()
+    return {
+        "num_rows": rows,
+        "num_row_groups": pq.read_metadata(out_path).num_row_groups,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+    }
+
+
+def _table_cells(table: pa.Table) -> np.ndarray:
+    return cell_ids(table.column("lat").to_numpy(), table.column("lon").to_numpy())
+
+
+def _table_minutes(table: pa.Table) -> np.ndarray:
+    return table.column("t").to_numpy() // TIME_RANGE_MS
+
+
+def write_spatial(src_path, out_path, cfg: IngestConfig, row_group_rows=SPATIAL_ROW_GROUP_ROWS) -> dict:
+    """
+    Write the (cell, t)-sorted copy of a month file; returns its metadata.
+    """
+    return _write_clustered(
+        src_path, out_path, cfg, _table_cells, ["lat", "lon"],
+        [("cell", "ascending"), ("t", "ascending")], row_group_rows, key_field="cell",
+    )
+
+
+def write_time_sorted(src_path, out_path, cfg: IngestConfig, row_group_rows=TIME_ROW_GROUP_ROWS) -> dict:
+    """
+    Write the (t, vessel_id)-sorted copy of a month file; returns its metadata.
+    """
+    return _write_clustered(
+        src_path, out_path, cfg, _table_minutes, ["t"],
+        [("t", "ascending"), ("vessel_id", "ascending")], row_group_rows,
+    )
+
+
+def is_current(entry, csv_path, out_path, copies=None) -> bool:
+    """
+    True if the output and every copy in ``copies`` (entry key -> path)
+    are unchanged since ``entry`` was recorded for this CSV.
+    """
+    if not entry or not Path(out_path).exists():
+        return False
+    src, out = os.stat(csv_path), os.stat(out_path)
+    for key, path in (copies or {}).items():
+        copy = entry.get(key) or {}
+        if not Path(path).exists() or copy.get("mtime_ns") != os.stat(path).st_mtime_ns:
+            return False
+    return (
+        entry.get("source", {}).get("size") == src.st_size
+        and entry.get("source", {}).get("mtime_ns") == src.st_mtime_ns
+        and entry.get("size") == out.st_size
+        and entry.get("mtime_ns") == out.st_mtime_ns
+    )
+
+
+def convert_all(root, out_dir, cfg: IngestConfig, row_group_rows=ROW_GROUP_ROWS,
+                months=None, force=False, spatial=True, time_sorted=True) -> list:
+    """
+    Convert every (selected) month under ``root``; returns the names written.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    data = load_dataset_meta(out_dir)
+    written = []
+
+    for year, month, csv_path in find_month_csvs(root):
+        if months and (year, month) not in months:
+            continue
+        name = partition_name(year, month)
+        out_path = out_dir / name
+        copies = {}
+        if spatial:
+            copies["spatial"] = out_dir / SPATIAL_DIR / name
+        if time_sorted:
+            copies["time"] = out_dir / TIME_DIR / name
+        if not force and is_current(data["files"].get(name), csv_path, out_path, copies):
+            print(f"{name}: up to date")
+            continue
+
+        print(f"{csv_path.name} -> {name}")
+        entry = convert_month(csv_path, out_path, cfg, row_group_rows)
+        if spatial:
+            entry["spatial"] = write_spatial(out_path, copies["spatial"], cfg)
+        if time_sorted:
+            entry["time"] = write_time_sorted(out_path, copies["time"], cfg)
+        data["files"][name] = entry
+        save_dataset_meta(out_dir, data)
+        written.append(name)
+
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert monthly AIS CSVs to partitioned Parquet.")
+    parser.add_argument("--root", default=r"/mnt/c/Users/BBBS-AI-01/d/anomaly/dataset/piraeus")
+    parser.add_argument("--out", default=str(Path(__file__).parent / "app" / "marine_backend" / "parquet"))
+    parser.add_argument("--months", nargs="*", default=None, help="YYYY-MM to convert (default: all)")
+    parser.add_argument("--row-group-rows", type=int, default=ROW_GROUP_ROWS)
+    parser.add_argument("--chunk-rows", type=int, default=IngestConfig.chunk_rows)
+    parser.add_argument("--spill-dir", default=None)
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--no-spatial", action="store_true", help="skip the cell-clustered copies")
+    parser.add_argument("--no-time", action="store_true", help="skip the time-sorted copies")
+    args = parser.parse_args()
+
+    selected = None
+    if args.months:
+        selected = {tuple(int(x) for x in m.split("-")) for m in args.months}
+
+    convert_all(
+        args.root,
+        args.out,
+        IngestConfig(chunk_rows=args.chunk_rows, spill_dir=args.spill_dir),
+        row_group_rows=args.row_group_rows,
+        months=selected,
+        force=args.force,
+        spatial=not args.no_spatial,
+        time_sorted=not args.no_time,
+    )
@@ -0,0 +1,414 @@
+"""
+Streaming AIS reporting-gap statistics over every month of the dataset.
+
+A gap is the time between two consecutive reports of the same vessel. Each
+month is streamed in (vessel_id, t) order, either from the partitioned
+Parquet dataset written by csv_to_parquet.py or straight from the raw CSV
+through the out-of-core sort of ingest.py, and folded into a ``GapStats``:
+
+- count, mean and variance (Welford / Chan), min and max, per vessel
+- a fixed log-spaced histogram per vessel, for quantiles and distributions
+- the number and total duration of blackouts, gaps longer than each of
+  ``blackout_thresholds`` seconds
+- zero gaps (repeated timestamps), counted apart and left out of the rest
+
+Everything but the quantiles is exact; a quantile is interpolated inside
+one histogram bin (``bins_per_decade`` bins per factor of 10). Every part
+is mergeable, so months run on a process pool and only the per-vessel
+totals plus one summary row per month are kept in the parent: memory is
+bounded by the number of vessels, not by the number of reports.
+
+    python gap_stats.py --dataset app/marine_backend/parquet --out gap_stats --jobs 4
+    python gap_stats.py --root /data/piraeus --out gap_stats --blackout 600 3600 86400
+"""
+import argparse
+import json
+import multiprocessing as mp
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from csv_to_parquet import find_month_csvs
+from ingest import IngestConfig, merge_runs, spill_sorted_runs
+
+_PARTITION = re.compile(r"year=(\d{4})/month=(\d{2})/ais\.parquet$")
+
+
+@dataclass
+class GapStatsConfig:
+    min_gap: float = 0.1                # s, lower edge of the first regular bin
+    max_gap: float = 1e7                # s, lower edge of the overflow bin (~116 days)
+    bins_per_decade: int = 32           # ~7.5% wide bins
+    blackout_thresholds: Tuple[float, ...] = (600.0, 3600.0, 21600.0)  # s
+    batch_rows: int = 131_072           # Parquet rows per batch
+
+    def edges(self) -> np.ndarray:
+        decades = np.log10(self.max_gap / self.min_gap)
+        n = int(round(decades * self.bins_per_decade))
+        return np.geomspace(self.min_gap, self.max_gap, n + 1)
+
+
+class GapStats:
+    """
+    Mergeable gap statistics, one row per vessel.
+
+    ``hist`` has ``len(edges) + 1`` columns: bin 0 holds gaps in
+    (0, edges[0]), bin i gaps in [edges[i-1], edges[i]), the last bin gaps
+    of at least edges[-1].
+    """
+
+    def __init__(self, cfg: GapStatsConfig, vessels=()):
+        self.cfg = cfg
+        self.edges = cfg.edges()
+        self.thresholds = np.asarray(cfg.blackout_thresholds, dtype=np.float64)
+        self.vessels = list(vessels)
+        self._codes = {v: i for i, v in enumerate(self.vessels)}
+
+        n = len(self.vessels)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.mean = np.zeros(n, dtype=np.float64)
+        self.m2 = np.zeros(n, dtype=np.float64)
+        self.min = np.full(n, np.inf)
+        self.max = np.full(n, -np.inf)
+        self.zeros = np.zeros(n, dtype=np.int64)
+        self.hist = np.zeros((n, len(self.edges) + 1), dtype=np.int64)
+        self.blackouts = np.zeros((n, len(self.thresholds)), dtype=np.int64)
+        self.blackout_seconds = np.zeros((n, len(self.thresholds)), dtype=np.float64)
+
+    def __len__(self):
+        return len(self.vessels)
+
+    def codes_of(self, vessels) -> np.ndarray:
+        """
+        Row of each vessel id, adding rows for vessels not seen yet.
+        """
+        codes = np.fromiter(
+            (self._codes.setdefault(v, len(self._codes)) for v in vessels),
+            dtype=np.int64,
+            count=len(vessels),
+        )
+        new = len(self._codes) - len(self.vessels)
+        if new:
+            self.vessels.extend(list(self._codes)[len(self.vessels):])
+            self._grow(new)
+        return codes
+
+    def _grow(self, n):
+        self.count = np.concatenate([self.count, np.zeros(n, dtype=np.int64)])
+        self.mean = np.concatenate([self.mean, np.zeros(n)])
+        self.m2 = np.concatenate([self.m2, np.zeros(n)])
+        self.min = np.concatenate([self.min, np.full(n, np.inf)])
+        self.max = np.concatenate([self.max, np.full(n, -np.inf)])
+        self.zeros = np.concatenate([self.zeros, np.zeros(n, dtype=np.int64)])
+        self.hist = np.vstack([self.hist, np.zeros((n, self.hist.shape[1]), dtype=np.int64)])
+        self.blackouts = np.vstack([self.blackouts, np.zeros((n, len(self.thresholds)), dtype=np.int64)])
+        self.blackout_seconds = np.vstack([self.blackout_seconds, np.zeros((n, len(self.thresholds)))])
+
+    def _merge_moments(self, rows, count, mean, m2):
+        # Chan et al.: combine (count, mean, M2) of two disjoint samples
+        n_a, mean_a = self.count[rows], self.mean[rows]
+        n = n_a + count
+        safe = np.maximum(n, 1)
+        delta = mean - mean_a
+        self.mean[rows] = mean_a + delta * count / safe
+        self.m2[rows] += m2 + delta ** 2 * n_a * count / safe
+        self.count[rows] = n
+
+    def add(self, codes: np.ndarray, gaps: np.ndarray):
+        """
+        Fold in gaps (seconds) of the vessels at rows ``codes``.
+        """
+        n_rows = len(self.vessels)
+        zero = gaps <= 0
+        self.zeros += np.bincount(codes[zero], minlength=n_rows)
+
+        codes, gaps = codes[~zero], gaps[~zero]
+        if not len(gaps):
+            return
+        rows = np.unique(codes)
+        count = np.bincount(codes, minlength=n_rows)
+        mean = np.bincount(codes, gaps, minlength=n_rows) / np.maximum(count, 1)
+        m2 = np.bincount(codes, (gaps - mean[codes]) ** 2, minlength=n_rows)
+        self._merge_moments(rows, count[rows], mean[rows], m2[rows])
+
+        np.minimum.at(self.min, codes, gaps)
+        np.maximum.at(self.max, codes, gaps)
+
+        n_bins = self.hist.shape[1]
+        bins = np.searchsorted(self.edges, gaps, side="right")
+        self.hist += np.bincount(codes * n_bins + bins, minlength=n_rows * n_bins).reshape(n_rows, n_bins)
+
+        for k, threshold in enumerate(self.thresholds):
+            over = gaps > threshold
+            self.blackouts[:, k] += np.bincount(codes[over], minlength=n_rows)
+            self.blackout_seconds[:, k] += np.bincount(codes[over], gaps[over], minlength=n_rows)
+
+    def merge(self, other: "GapStats") -> "GapStats":
+        """
+        Add another partial result in place, matching rows by vessel id.
+        """
+        if not np.array_equal(self.edges, other.edges) or not np.array_equal(self.thresholds, other.thresholds):
+            raise ValueError("cannot merge gap statistics with different bins or thresholds")
+        rows = self.codes_of(other.vessels)
+
+        self._merge_moments(rows, other.count, other.mean, other.m2)
+        self.min[rows] = np.minimum(self.min[rows], other.min)
+        self.max[rows] = np.maximum(self.max[rows], other.max)
+        self.zeros[rows] += other.zeros
+        self.hist[rows] += other.hist
+        self.blackouts[rows] += other.blackouts
+        self.blackout_seconds[rows] += other.blackout_seconds
+        return self
+
+    def total(self, name="all") -> "GapStats":
+        """
+        All vessels collapsed into a single row.
+        """
+        out = GapStats(self.cfg, [name])
+        n = self.count.sum()
+        out.count[0] = n
+        if n:
+            out.mean[0] = (self.count * self.mean).sum() / n
+            out.m2[0] = (self.m2 + self.count * (self.mean - out.mean[0]) ** 2).sum()
+            out.min[0] = self.min.min()
+            out.max[0] = self.max.max()
+        out.zeros[0] = self.zeros.sum()
+        out.hist[0] = self.hist.sum(axis=0)
+        out.blackouts[0] = self.blackouts.sum(axis=0)
+        out.blackout_seconds[0] = self.blackout_seconds.sum(axis=0)
+        return out
+
+    def quantiles(self, qs) -> np.ndarray:
+        """
+        Quantiles per vessel, shape (vessels, len(qs)); NaN without gaps.
+
+        Interpolated geometrically inside the bin holding the rank and
+        clamped to the exact min and max.
+        """
+        qs = np.asarray(qs, dtype=np.float64)
+        lower = np.concatenate([[self.edges[0] / 10 ** (1 / self.cfg.bins_per_decade)], self.edges])
+        upper = np.concatenate([self.edges, [self.edges[-1] * 10 ** (1 / self.cfg.bins_per_decade)]])
+
+        out = np.full((len(self.vessels), len(qs)), np.nan)
+        cum = np.cumsum(self.hist, axis=1)
+        for r in np.flatnonzero(self.count):
+            rank = qs * (self.count[r] - 1) + 0.5
+            b = np.searchsorted(cum[r], rank, side="right").clip(max=len(lower) - 1)
+            before = np.where(b > 0, cum[r][b - 1], 0)
+            frac = (rank - before) / np.maximum(self.hist[r][b], 1)
+            est = lower[b] * (upper[b] / lower[b]) ** frac
+            out[r] = np.clip(est, self.min[r], self.max[r])
+        return out
+
+    def summary(self, qs=(0.5, 0.9, 0.99)) -> pd.DataFrame:
+        """
+        One row per vessel: counts, moments, quantiles and blackouts.
+        """
+        has = self.count > 0
+        frame = pd.DataFrame({
+            "vessel_id": self.vessels,
+            "gaps": self.count,
+            "zero_gaps": self.zeros,
+            "mean_s": np.where(has, self.mean, np.nan),
+            "std_s": np.where(self.count > 1, np.sqrt(self.m2 / np.maximum(self.count - 1, 1)), np.nan),
+            "min_s": np.where(has, self.min, np.nan),
+            "max_s": np.where(has, self.max, np.nan),
+        })
+        for q, col in zip(qs, self.quantiles(qs).T):
+            frame[f"p{q * 100:g}_s"] = col
+        for k, threshold in enumerate(self.thresholds):
+            frame[f"blackouts_{threshold:g}s"] = self.blackouts[:, k]
+            frame[f"blackout_hours_{threshold:g}s"] = self.blackout_seconds[:, k] / 3600
+        return frame
+
+    def histogram(self, row=0) -> dict:
+        return {
+            "edges": self.edges.tolist(),
+            "counts": self.hist[row].tolist(),
+        }
+
+
+# ------------------------------
+# Month readers
+# ------------------------------
+def iter_parquet_month(path, cfg: GapStatsConfig) -> Iterator[Tuple[list, np.ndarray, np.ndarray]]:
+    """
+    (vessel ids, codes into them, t) batches of a sorted dataset file.
+    """
+    pf = pq.ParquetFile(path)
+    for batch in pf.iter_batches(batch_size=cfg.batch_rows, columns=["vessel_id", "t"]):
+        col = batch.column(0)
+        if hasattr(col, "dictionary"):
+            yield col.dictionary.to_pylist(), col.indices.to_numpy(zero_copy_only=False), \
+                batch.column(1).to_numpy(zero_copy_only=False)
+        else:
+            codes, vessels = pd.factorize(col.to_numpy(zero_copy_only=False))
+            yield list(vessels), codes, batch.column(1).to_numpy(zero_copy_only=False)
+
+
+def iter_csv_month(csv_path, ingest: IngestConfig) -> Iterator[Tuple[list, np.ndarray, np.ndarray]]:
+    """
+    The same batches from a raw monthly CSV, sorted out of core.
+    """
+    with tempfile.TemporaryDirectory(prefix="ais_runs_", dir=ingest.spill_dir) as run_dir:
+        runs, vocab, t_min, t_max = spill_sorted_runs(csv_path, run_dir, ingest)
+        vessels = vocab.tolist()
+        for frame in merge_runs(runs, vocab, t_min, t_max, ingest):
+            yield vessels, frame["vessel_id"].to_numpy(), frame["t"].to_numpy(np.int64)
+
+
+def month_gap_stats(batches, cfg: GapStatsConfig) -> GapStats:
+    """
+    Gap statistics of one month from (vessel ids, codes, t) batches in
+    (vessel, t) order; t in ms.
+    """
+    stats = GapStats(cfg)
+    last_row, last_t = -1, 0
+    rows_of = None
+    prev_vessels = None
+
+    for vessels, codes, t in batches:
+        if not len(t):
+            continue
+        if vessels is not prev_vessels:
+            rows_of = stats.codes_of(vessels)
+            prev_vessels = vessels
+        rows = rows_of[codes]
+        t = t.astype(np.int64, copy=False)
+
+        # carry the last report of the previous batch across the boundary
+        rows = np.concatenate([[last_row], rows])
+        t = np.concatenate([[last_t], t])
+        same = rows[1:] == rows[:-1]
+        stats.add(rows[1:][same], np.diff(t)[same] / 1000.0)
+        last_row, last_t = rows[-1], t[-1]
+
+    return stats
+
+
+def find_parquet_months(dataset_dir) -> list:
+    """
+    (year, month, path) of every file of the partitioned dataset, sorted.
+    """
+    found = []
+    for path in Path(dataset_dir).glob("year=*/month=*/ais.parquet"):
+        m = _PARTITION.search(path.as_posix())
+        if m:
+            found.append((int(m.group(1)), int(m.group(2)), path))
+    return sorted(found)
+
+
+def _month_worker(source, path, cfg: GapStatsConfig, ingest: IngestConfig) -> GapStats:
+    if source == "parquet":
+        batches = iter_parquet_month(path, cfg)
+    else:
+        batches = iter_csv_month(path, ingest)
+    return month_gap_stats(batches, cfg)
+
+
+def run_gap_stats(months, cfg: GapStatsConfig, source="parquet", ingest: IngestConfig = None, jobs=1):
+    """
+    Statistics of every (year, month, path), months in parallel.
+
+    Returns (per-vessel GapStats over all months, {"YYYY-MM": one-row
+    GapStats}, per-vessel-per-month summary frame).
+    """
+    ingest = ingest or IngestConfig()
+    vessels = GapStats(cfg)
+    by_month = {}
+    vessel_months = []
+
+    def collect(key, stats):
+        vessels.merge(stats)
+        by_month[key] = stats.total(key)
+        frame = stats.summary()
+        frame.insert(0, "month", key)
+        vessel_months.append(frame)
+        print(f"{key}: {int(by_month[key].count[0])} gaps, {len(stats)} vessels")
+
+    if jobs <= 1:
+        for year, month, path in months:
+            collect(f"{year}-{month:02d}", _month_worker(source, path, cfg, ingest))
+    else:
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+            futures = {
+                pool.submit(_month_worker, source, path, cfg, ingest): f"{year}-{month:02d}"
+                for year, month, path in months
+            }
+            for fut in as_completed(futures):
+                collect(futures[fut], fut.result())
+
+    table = pd.concat(vessel_months, ignore_index=True) if vessel_months else pd.DataFrame()
+    return vessels, dict(sorted(by_month.items())), table.sort_values(["month", "vessel_id"], ignore_index=True) \
+        if len(table) else table
+
+
+def write_gap_stats(out_dir, vessels: GapStats, by_month: dict, vessel_months: pd.DataFrame):
+    """
+    gap_summary.json (per month and overall, with histograms),
+    gap_vessels.parquet and gap_vessel_months.parquet.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    def entry(stats):
+        row = stats.summary().iloc[0].drop("vessel_id")
+        data = {k: (None if pd.isna(v) else v.item() if hasattr(v, "item") else v) for k, v in row.items()}
+        data["histogram"] = stats.histogram()
+        return data
+
+    summary = {
+        "blackout_thresholds_s": vessels.thresholds.tolist(),
+        "all": entry(vessels.total()),
+        "months": {key: entry(stats) for key, stats in by_month.items()},
+    }
+    (out_dir / "gap_summary.json").write_text(json.dumps(summary, indent=2))
+    vessels.summary().to_parquet(out_dir / "gap_vessels.parquet", index=False)
+    vessel_months.to_parquet(out_dir / "gap_vessel_months.parquet", index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming AIS gap and blackout statistics.")
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument("--dataset", default=str(Path(__file__).parent / "app" / "marine_backend" / "parquet"),
+                     help="partitioned Parquet dataset from csv_to_parquet.py")
+    src.add_argument("--root", help="raw CSV root instead of the Parquet dataset")
+    parser.add_argument("--out", default="gap_stats")
+    parser.add_argument("--months", nargs="*", default=None, help="YYYY-MM to include (default: all)")
+    parser.add_argument("--blackout", nargs="*", type=float, default=list(GapStatsConfig.blackout_thresholds),
+                        help="blackout thresholds in seconds")
+    parser.add_argument("--bins-per-decade", type=int, default=GapStatsConfig.bins_per_decade)
+    parser.add_argument("--jobs", type=int, default=1, help="months processed concurrently")
+    parser.add_argument("--chunk-rows", type=int, default=IngestConfig.chunk_rows)
+    parser.add_argument("--spill-dir", default=None)
+    args = parser.parse_args()
+
+    cfg = GapStatsConfig(blackout_thresholds=tuple(args.blackout), bins_per_decade=args.bins_per_decade)
+    if args.root:
+        source, months = "csv", find_month_csvs(args.root)
+    else:
+        source, months = "parquet", find_parquet_months(args.dataset)
+    if args.months:
+        selected = {tuple(int(x) for x in m.split("-")) for m in args.months}
+        months = [m for m in months if m[:2] in selected]
+
+    vessels, by_month, vessel_months = run_gap_stats(
+        months,
+        cfg,
+        source=source,
+        ingest=IngestConfig(chunk_rows=args.chunk_rows, spill_dir=args.spill_dir),
+        jobs=args.jobs,
+    )
+    write_gap_stats(args.out, vessels, by_month, vessel_months)
+
+    overall = vessels.total().summary().iloc[0]
+    print(f"{len(months)} months, {len(vessels)} vessels, {int(overall['gaps'])} gaps: "
+          f"mean={overall['mean_s']:.2f}s median={overall['p50_s']:.2f}s p90={overall['p90_s']:.2f}s")
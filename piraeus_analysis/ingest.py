@@ -0,0 +1,265 @@
+"""
+Out-of-core ingestion of monthly AIS CSVs.
+
+A month is read in chunks of ``chunk_rows`` rows with explicit dtypes; each
+chunk is sorted by (vessel_id, t) and spilled to disk as an Arrow IPC run.
+The runs are then k-way merged, ``batch_rows`` rows per run at a time, into
+one Parquet file sorted by (vessel_id, t), ties kept in file order. Peak
+memory is about ``chunk_rows`` rows while spilling and
+``runs * batch_rows`` rows while merging, whatever the size of the month.
+
+In the sorted file ``vessel_id`` is an int32 code: the position of the
+vessel in the sorted vessel list stored in the schema metadata (the same
+codes as ``factorize(sort=True)``); the metadata also holds the month's
+[t_min, t_max].
+"""
+import json
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+AIS_DTYPES = {
+    "t": "int64",
+    "vessel_id": "str",
+    "lon": "float64",
+    "lat": "float64",
+    "speed": "float64",
+    "course": "float64",
+    "heading": "float64",
+}
+
+VOCAB_KEY = b"vessel_vocab"
+T_RANGE_KEY = b"t_range"
+
+
+@dataclass
+class IngestConfig:
+    chunk_rows: int = 2_000_000     # rows per spilled run
+    batch_rows: int = 65_536        # rows per run buffered during the merge
+    spill_dir: Optional[str] = None  # default: system temp dir
+
+
+def csv_columns(csv_path) -> list:
+    header = pd.read_csv(csv_path, nrows=0).columns
+    return [c for c in AIS_DTYPES if c in header]
+
+
+def read_csv_chunks(csv_path, chunk_rows, columns=None) -> Iterator[pd.DataFrame]:
+    """
+    Read a monthly CSV ``chunk_rows`` rows at a time with AIS dtypes.
+    """
+    columns = columns or csv_columns(csv_path)
+    return pd.read_csv(
+        csv_path,
+        usecols=columns,
+        dtype={c: AIS_DTYPES[c] for c in columns},
+        chunksize=chunk_rows,
+    )
+
+
+def csv_bounds(csv_path, chunk_rows=2_000_000) -> dict:
+    """
+    North, south, east, west bounds of a CSV, read in chunks.
+    """
+    north = east = -np.inf
+    south = west = np.inf
+    for chunk in read_csv_chunks(csv_path, chunk_rows, ["lon", "lat"]):
+        north = max(north, chunk["lat"].max())
+        south = min(south, chunk["lat"].min())
+        east = max(east, chunk["lon"].max())
+        west = min(west, chunk["lon"].min())
+    return {
+        "north": float(north),
+        "south": float(south),
+        "east": float(east),
+        "west": float(west),
+    }
+
+
+def spill_sorted_runs(csv_path, run_dir, cfg: IngestConfig):
+    """
+    Sort each chunk of the CSV and write it to ``run_dir`` as an Arrow IPC
+    file of ``cfg.batch_rows``-row batches.
+
+    Returns (run paths, sorted vessel vocabulary, t_min, t_max).
+    """
+    run_dir = Path(run_dir)
+    runs = []
+    vessels = []
+    t_min, t_max = np.iinfo(np.int64).max, np.iinfo(np.int64).min
+
+    for k, chunk in enumerate(read_csv_chunks(csv_path, cfg.chunk_rows)):
+        # multi-key sort_values is a stable lexsort: ties stay in file order
+        chunk = chunk.sort_values(["vessel_id", "t"], kind="stable", ignore_index=True)
+        vessels.append(chunk["vessel_id"].unique())
+        t_min = min(t_min, int(chunk["t"].min()))
+        t_max = max(t_max, int(chunk["t"].max()))
+
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        path = run_dir / f"run_{k:05d}.arrow"
+        with pa.OSFile(str(path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=cfg.batch_rows)
+        runs.append(path)
+
+    vocab = np.unique(np.concatenate(vessels)) if vessels else np.array([], dtype=object)
+    return runs, vocab, t_min, t_max
+
+
+class _Run:
+    """
+    Read cursor over one spilled run.
+    """
+
+    def __init__(self, path, vocab_index, key_fn):
+        self.reader = pa.ipc.open_file(pa.memory_map(str(path)))
+        self.vocab_index = vocab_index
+        self.key_fn = key_fn
+        self.next_batch = 0
+        self.frame = None
+        self.keys = None
+        self.pos = 0
+        self.load()
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_batch < self.reader.num_record_batches
+
+    @property
+    def active(self) -> bool:
+        return self.frame is not None
+
+    def load(self):
+        batch = None
+        while self.has_more and (batch is None or batch.num_rows == 0):
+            batch = self.reader.get_batch(self.next_batch)
+            self.next_batch += 1
+        if batch is None or batch.num_rows == 0:
+            self.frame = None
+            return
+        frame = batch.to_pandas()
+        frame["vessel_id"] = self.vocab_index.get_indexer(frame["vessel_id"]).astype(np.int32)
+        self.frame = frame
+        self.keys = self.key_fn(frame)
+        self.pos = 0
+
+    def take(self, cutoff, inclusive=True):
+        """
+        Pop buffered rows with key <= cutoff (< cutoff unless ``inclusive``);
+        refills once the buffer is empty.
+        """
+        end = int(np.searchsorted(self.keys, cutoff, side="right" if inclusive else "left"))
+        part = self.frame.iloc[self.pos:end]
+        keys = self.keys[self.pos:end]
+        self.pos = end
+        if self.pos == len(self.keys):
+            self.load()
+        return part, keys
+
+
+def merge_runs(runs, vocab, t_min, t_max, cfg: IngestConfig) -> Iterator[pd.DataFrame]:
+    """
+    K-way merge of sorted runs by (vessel_id, t), yielding sorted frames
+    with vessel codes.
+
+    Each step emits, from every run, the buffered rows up to the smallest
+    last buffered key among runs that still have data on disk; those rows
+    can be ordered without seeing anything else, so a step is one stable
+    argsort of at most ``runs * batch_rows`` keys. Rows equal to the cutoff
+    may continue on disk in the first run whose buffer ends there, so runs
+    after it hold theirs back until that run has moved past the cutoff.
+    """
+    t_bits = max(int(t_max - t_min).bit_length(), 1)
+    code_bits = max(int(len(vocab)).bit_length(), 1)
+    if t_bits + code_bits > 63:
+        raise ValueError(
+            f"time span of {t_max - t_min} ms and {len(vocab)} vessels do not fit a 63-bit sort key"
+        )
+
+    def key_fn(frame):
+        return (frame["vessel_id"].to_numpy(np.int64) << t_bits) | (frame["t"].to_numpy(np.int64) - t_min)
+
+    vocab_index = pd.Index(vocab)
+    cursors = [_Run(path, vocab_index, key_fn) for path in runs]
+
+    while True:
+        live = [c for c in cursors if c.active]
+        if not live:
+            return
+        pending = [c.keys[-1] for c in live if c.has_more]
+        cutoff = min(pending) if pending else np.iinfo(np.int64).max
+        first = next((i for i, c in enumerate(live) if c.has_more and c.keys[-1] == cutoff), len(live))
+
+        # run order = file order, so a stable sort keeps ties in file order
+        parts, keys = zip(*(c.take(cutoff, inclusive=i <= first) for i, c in enumerate(live)))
+        keys = np.concatenate(keys)
+        if not len(keys):
+            continue
+        order = np.argsort(keys, kind="stable")
+        yield pd.concat(parts, ignore_index=True).take(order).reset_index(drop=True)
+
+
+def sort_month_csv(csv_path, out_path, cfg: IngestConfig = None) -> Path:
+    """
+    Write ``csv_path`` to ``out_path`` as Parquet sorted by (vessel_id, t),
+    with row groups of ``cfg.batch_rows`` rows.
+    """
+    cfg = cfg or IngestConfig()
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+
+    with tempfile.TemporaryDirectory(prefix="ais_runs_", dir=cfg.spill_dir) as run_dir:
+        runs, vocab, t_min, t_max = spill_sorted_runs(csv_path, run_dir, cfg)
+        metadata = {
+            VOCAB_KEY: json.dumps(vocab.tolist()),
+            T_RANGE_KEY: json.dumps([int(t_min), int(t_max)]),
+        }
+        writer = None
+
+        def write(frames):
+            nonlocal writer
+            table = pa.Table.from_pandas(pd.concat(frames, ignore_index=True), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema.with_metadata(metadata))
+            writer.write_table(table, row_group_size=cfg.batch_rows)
+
+        pending = []
+        n = 0
+        for frame in merge_runs(runs, vocab, t_min, t_max, cfg):
+            pending.append(frame)
+            n += len(frame)
+            if n >= cfg.batch_rows:
+                write(pending)
+                pending, n = [], 0
+
+        if pending or writer is None:
+            columns = csv_columns(csv_path)
+            write(pending or [pd.DataFrame({
+                c: pd.Series(dtype="int32" if c == "vessel_id" else AIS_DTYPES[c]) for c in columns
+            })])
+        writer.close()
+
+    tmp.replace(out_path)
+    return out_path
+
+
+def read_vocab(path) -> list:
+    """
+    Vessel ids of a sorted file, indexed by vessel code.
+    """
+    return json.loads(pq.read_schema(path).metadata[VOCAB_KEY])
+
+
+def read_time_range(path) -> tuple:
+    """
+    (t_min, t_max) in epoch ms of a sorted file.
+    """
+    t_min, t_max = json.loads(pq.read_schema(path).metadata[T_RANGE_KEY])
+    return t_min, t_max
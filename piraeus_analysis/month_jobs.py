@@ -0,0 +1,183 @@
+"""
+Parallel, resumable runner for preprocess.py.
+
+Months are processed on a pool of worker processes (one per GPU with
+``devices``). Every finished or failed month is recorded in
+``processed/manifest.json`` with its status, input fingerprint and sha256,
+the windowing config, and row / window / valid-window counts. On re-run a
+month is skipped when it is marked done, its CSV is unchanged (same size
+and mtime, or failing that the same checksum), the config matches and its
+outputs exist.
+"""
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from window_store import COMPACT_FORMAT, DENSE_FORMAT
+
+MANIFEST_VERSION = 1
+HASH_BLOCK = 8 * 1024 * 1024
+
+
+def month_key(year, month) -> str:
+    return f"{year}-{month:02d}"
+
+
+def file_checksum(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def config_fingerprint(cfg) -> dict:
+    """
+    Config fields that change the output of a month. The format names
+    the on-disk layout and the encoding of channel 4, so months written by
+    an older version are rebuilt.
+    """
+    return {
+        "window_size": cfg.window_size,
+        "layout": cfg.layout,
+        "format": COMPACT_FORMAT if cfg.layout == "compact" else DENSE_FORMAT,
+    }
+
+
+class Manifest:
+    """
+    Per-month status file, rewritten atomically after every change. Only
+    the parent process writes it.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.months = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            if data.get("version") == MANIFEST_VERSION:
+                self.months = data.get("months", {})
+
+    def get(self, key) -> dict:
+        return self.months.get(key, {})
+
+    def update(self, key, **fields):
+        self.months.setdefault(key, {}).update(fields)
+        self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"version": MANIFEST_VERSION, "months": self.months}, indent=2))
+        tmp.replace(self.path)
+
+
+def input_fingerprint(path, previous: dict = None) -> dict:
+    """
+    Size, mtime and sha256 of a CSV; the checksum is reused from
+    ``previous`` when size and mtime are unchanged.
+    """
+    st = os.stat(path)
+    fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if previous and all(previous.get(k) == v for k, v in fp.items()) and previous.get("sha256"):
+        fp["sha256"] = previous["sha256"]
+    else:
+        fp["sha256"] = file_checksum(path)
+    return fp
+
+
+def needs_run(entry: dict, fingerprint: dict, cfg, outputs) -> bool:
+    return not (
+        entry.get("status") == "done"
+        and entry.get("input", {}).get("sha256") == fingerprint["sha256"]
+        and entry.get("config") == config_fingerprint(cfg)
+        and all(Path(p).exists() for p in outputs)
+    )
+
+
+def _init_worker(devices):
+    # runs before preprocess (and CUDA) is imported in the worker
+    if devices is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(devices.get())
+
+
+def _run_month(year, month, cfg):
+    from preprocess import process_month
+
+    start = time.perf_counter()
+    result = process_month(year, month, cfg)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_months(months, cfg, jobs=1, devices=None, force=False, manifest_path=None):
+    """
+    Process (year, month) pairs that are missing, failed or changed.
+
+    Returns the manifest entries of the months that were run.
+    """
+    from preprocess import month_csv_path, month_outputs, output_root
+
+    manifest = Manifest(manifest_path or output_root(cfg) / "manifest.json")
+
+    todo = []
+    for year, month in months:
+        key = month_key(year, month)
+        csv_path = month_csv_path(year, month, cfg)
+        if not os.path.exists(csv_path):
+            print(f"{key}: missing input {csv_path}")
+            continue
+        entry = manifest.get(key)
+        fingerprint = input_fingerprint(csv_path, entry.get("input"))
+        if not force and not needs_run(entry, fingerprint, cfg, month_outputs(year, month, cfg)):
+            if entry.get("input") != fingerprint:
+                # touched but identical: remember the new mtime
+                manifest.update(key, input=fingerprint)
+            print(f"{key}: up to date")
+            continue
+        todo.append((year, month, fingerprint))
+
+    if not todo:
+        return {}
+
+    jobs = max(1, min(jobs, len(todo)))
+    if jobs > 1 and not devices:
+        # split the cores between the workers
+        cfg.cpu_threads = max(1, (os.cpu_count() or 1) // jobs)
+
+    ctx = mp.get_context("spawn")
+    device_queue = None
+    if devices:
+        device_queue = ctx.Queue()
+        for device in devices[:jobs]:
+            device_queue.put(device)
+
+    ran = {}
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx,
+                             initializer=_init_worker, initargs=(device_queue,)) as pool:
+        futures = {}
+        for year, month, fingerprint in todo:
+            key = month_key(year, month)
+            manifest.update(key, status="running", input=fingerprint, config=config_fingerprint(cfg),
+                            started=time.time(), error=None)
+            futures[pool.submit(_run_month, year, month, cfg)] = key
+
+        for fut in as_completed(futures):
+            key = futures[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                manifest.update(key, status="failed", error="".join(
+                    traceback.format_exception_only(type(e), e)
+                ).strip())
+                print(f"{key}: failed: {e}")
+            else:
+                manifest.update(key, status="done", finished=time.time(), **result)
+            ran[key] = manifest.get(key)
+
+    return ran
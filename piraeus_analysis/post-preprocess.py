@@ -1,32 +1,14 @@
+import argparse
+
 import numpy as np
 import tensorstore as ts
 from pathlib import Path
 from typing import Tuple
 
+from window_store import ValidIndex, WindowSampler, gap_ms, is_compact, open_compact, valid_index_path
 
-from pathlib import Path
-import tensorstore as ts
-
-root = Path(r"/mnt/c/Users/BBBS-AI-01/d/anomaly/dataset/piraeus/processed")
-path = root / "windows_2019_dec.zarr"
 
-# Open TensorStore
-windows = ts.open(
-    {
-        "driver": "zarr",
-        "kvstore": {"driver": "file", "path": str(path)},
-    },
-    open=True,
-).result()
-
-# Inspect
-print("TensorStore shape:", windows.shape)
-print("TensorStore dtype:", windows.dtype)
-
-# Optionally, read the first window to confirm
-first_window = windows[0].read().result()
-print("First window shape:", first_window.shape)
-print("First window data (timestamps in last column):", first_window[:, 4])
+DEFAULT_ROOT = Path(r"/mnt/c/Users/BBBS-AI-01/d/anomaly/dataset/piraeus/processed")
 
 
 def open_windows_store(path: Path) -> ts.TensorStore:
@@ -36,13 +18,17 @@ def open_windows_store(path: Path) -> ts.TensorStore:
     Parameters
     ----------
     path : Path
-        Path to windows_YYYY_mon.zarr
+        Path to windows_YYYY_mon.zarr, or to a compact_YYYY_mon directory
+        (read through window_store.WindowsCompat)
 
     Returns
     -------
     ts.TensorStore
         Opened TensorStore object
     """
+    if is_compact(path):
+        return open_compact(path)[0]
+
     return ts.open(
         {
             "driver": "zarr",
@@ -55,38 +41,78 @@ def open_windows_store(path: Path) -> ts.TensorStore:
     ).result()
 
 
+def open_valid_index(path: Path) -> ValidIndex:
+    """
+    Open the valid-window index of a month.
+
+    Parameters
+    ----------
+    path : Path
+        Path to windows_YYYY_mon.zarr (index in the sibling valid_YYYY_mon)
+        or to a compact_YYYY_mon directory
+
+    Returns
+    -------
+    ValidIndex
+        Valid window ids with per-vessel counts
+    """
+    return ValidIndex.read(valid_index_path(path))
+
+
 def sample_timestamp_gaps(
-    windows: ts.TensorStore,
+    windows,
     max_windows: int = 10_000,
+    index: ValidIndex = None,
+    per_vessel: int = None,
+    mode: str = "uniform",
 ) -> np.ndarray:
     """
     Sample timestamp gaps from AIS windows.
 
     Parameters
     ----------
-    windows : ts.TensorStore
-        AIS windows of shape (N, window_size, 5)
+    windows : WindowSampler or ts.TensorStore
+        Sampler over a processed month (reads only the timestamp channel,
+        chunk by chunk), or AIS windows of shape (N, window_size, 5)
     max_windows : int
         Maximum number of windows to sample
+    index : ValidIndex, optional
+        Valid-window index (a WindowSampler brings its own); without one
+        windows are drawn from all ids, invalid (zero-filled) ones included
+    per_vessel : int, optional
+        Draw up to this many windows from every vessel instead of
+        ``max_windows`` uniformly (requires an index)
+    mode : str
+        "uniform" or "chunk_local" (WindowSampler only)
 
     Returns
     -------
     np.ndarray
         Flattened array of timestamp gaps (seconds)
     """
-    n = windows.shape[0]
-    sample_n = min(n, max_windows)
-
-    idx = np.random.choice(n, size=sample_n, replace=False)
-
-    # Read the full sampled windows
-    sampled_windows = windows[idx, :, :].read().result()  # shape: (sample_n, window_size, 5)
-
-    # Extract the timestamp column (last column)
-    ts_data = sampled_windows[:, :, 4]  # shape: (sample_n, window_size)
-
-    # Compute differences along each window
-    gaps = np.diff(ts_data, axis=1)
+    if isinstance(windows, WindowSampler):
+        index = index if index is not None else windows.index
+        if index is not None and per_vessel is not None:
+            idx = index.sample_stratified(per_vessel)
+        else:
+            idx = windows.sample_ids(max_windows, mode=mode)
+        ts_data = gap_ms(windows.read(idx, channel=4))  # shape: (sample_n, window_size)
+        return ts_data[:, 1:].reshape(-1)
+
+    if index is not None and per_vessel is not None:
+        idx = index.sample_stratified(per_vessel)
+    elif index is not None:
+        idx = index.sample_uniform(max_windows)
+    else:
+        n = windows.shape[0]
+        sample_n = min(n, max_windows)
+        idx = np.sort(np.random.choice(n, size=sample_n, replace=False))
+
+    # Read the time column (last column): gap to the vessel's previous report
+    ts_data = gap_ms(windows[idx, :, 4].read().result())  # shape: (sample_n, window_size)
+
+    # Gaps inside each window (the first one reaches back before the window)
+    gaps = ts_data[:, 1:]
 
     # Flatten to 1D array
     return gaps.reshape(-1)
@@ -115,27 +141,42 @@ def summarize_gaps(gaps: np.ndarray) -> Tuple[float, float, float]:
     )
 
 
-def main():
+def find_month_stores(root: Path) -> list:
     """
-    Entry point: sample timestamp gaps for a single month.
+    Processed month stores under ``root``, compact or dense, sorted.
     """
-    root = Path(
-        r"/mnt/c/Users/BBBS-AI-01/d/anomaly/dataset/piraeus/processed"
-    )
+    stores = [p for p in Path(root).glob("compact_*_*") if is_compact(p)]
+    stores += sorted(Path(root).glob("windows_*_*.zarr"))
+    return sorted(stores, key=lambda p: p.name)
 
-    # Single month
-    path = root / "windows_2019_dec.zarr"
-    windows = open_windows_store(path)
 
-    gaps = sample_timestamp_gaps(windows)
-    mean_g, med_g, p90_g = summarize_gaps(gaps)
+def main(root: Path = DEFAULT_ROOT, months=None, max_windows: int = 10_000):
+    """
+    Entry point: sample timestamp gaps for every processed month (or the
+    ``months`` store names given). Exact statistics over all reports are
+    computed by gap_stats.py.
+    """
+    root = Path(root)
+    paths = [root / m for m in months] if months else find_month_stores(root)
 
-    print(
-        f"{path.name}: mean={mean_g:.2f}s "
-        f"median={med_g:.2f}s p90={p90_g:.2f}s"
-    )
+    for path in paths:
+        windows = WindowSampler(path)
+
+        gaps = sample_timestamp_gaps(windows, max_windows=max_windows)
+        mean_g, med_g, p90_g = summarize_gaps(gaps)
+
+        print(
+            f"{path.name}: mean={mean_g:.2f}s "
+            f"median={med_g:.2f}s p90={p90_g:.2f}s"
+        )
 
 
 if __name__ == "__main__":
-    # main()
-    pass
+    parser = argparse.ArgumentParser(description="Sampled timestamp-gap statistics of processed months.")
+    parser.add_argument("--root", default=str(DEFAULT_ROOT), help="directory of the processed month stores")
+    parser.add_argument("--months", nargs="*", default=None,
+                        help="store names, e.g. compact_2019_dec (default: every store under --root)")
+    parser.add_argument("--max-windows", type=int, default=10_000, help="windows sampled per month")
+    args = parser.parse_args()
+
+    main(Path(args.root), args.months, args.max_windows)
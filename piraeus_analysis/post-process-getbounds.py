@@ -1,4 +1,4 @@
-import cudf
+from ingest import csv_bounds
 
 MONTH_ABBR = {
     1: "jan", 2: "feb", 3: "mar", 4: "apr",
@@ -6,24 +6,18 @@ MONTH_ABBR = {
     9: "sep", 10: "oct", 11: "nov", 12: "dec"
 }
 
-def get_month_bounds(year, month, root):
+def get_month_bounds(year, month, root, chunk_rows=2_000_000):
     """
     Return north, south, east, west bounds
-    from AIS CSV for a given year/month.
+    from AIS CSV for a given year/month,
+    reading chunk_rows rows at a time.
     """
     file_path = (
         f"{root}/unipi_ais_dynamic_{year}/"
         f"unipi_ais_dynamic_{MONTH_ABBR[month]}{year}.csv"
     )
 
-    df = cudf.read_csv(file_path, usecols=["lat", "lon"])
-
-    return {
-        "north": float(df["lat"].max()),
-        "south": float(df["lat"].min()),
-        "east":  float(df["lon"].max()),
-        "west":  float(df["lon"].min()),
-    }
+    return csv_bounds(file_path, chunk_rows)
 
 
 bounds = get_month_bounds(
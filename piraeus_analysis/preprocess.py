@@ -1,12 +1,29 @@
-import cudf
-import rmm
+import argparse
+import os
+import time
 import numpy as np
-import cupy as cp
-from numba import cuda
+import pandas as pd
 import math
 import tensorstore as ts
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pyarrow.parquet as pq
+
+from ingest import AIS_DTYPES, IngestConfig, read_time_range, sort_month_csv
+from window_store import CompactWriter, ValidIndex, report_gaps, write_compact
+
+try:
+    import cudf
+    import rmm
+    import cupy as cp
+    from numba import cuda
+except ImportError:
+    # CPU-only node: only the "cpu" backend is available
+    cudf = rmm = cp = cuda = None
+
+HAS_GPU = cudf is not None
+
 # ------------------------------
 # Config
 # ------------------------------
@@ -21,20 +38,25 @@ DATA_PERIODS = [
     (2019, list(range(1,13)))
 ]
 
-rmm.reinitialize(pool_allocator=True, managed_memory=False)
+BACKENDS = ("auto", "gpu", "cpu")
+LAYOUTS = ("compact", "dense")
 
 class AISConfig:
-    def __init__(self, root, chunk_size, window_size):
+    def __init__(self, root, chunk_size, window_size, backend="auto", cpu_threads=None,
+                 layout="compact", ingest=None):
         self.root = root
         self.chunk_size = chunk_size   # windows per batch
         self.window_size = window_size
+        self.backend = backend         # "auto" | "gpu" | "cpu"
+        self.layout = layout           # "compact" (window_store) | "dense" (windows/vids zarr)
+        self.cpu_threads = cpu_threads or os.cpu_count() or 1
+        self.ingest = ingest           # IngestConfig: external sort instead of one read_csv
 
 # ------------------------------
 # CUDA kernel (batch-local)
 # ------------------------------
-@cuda.jit
 def fused_mask_clamp_window_kernel(
-    vessel_id, lat, lon, speed, course, ts,
+    vessel_id, lat, lon, speed, course, gaps,
     start_idx, N, window_size,
     out_windows, out_vids
 ):
@@ -47,38 +69,55 @@ def fused_mask_clamp_window_kernel(
         return
 
     vid = vessel_id[idx]
-    if vessel_id[idx + window_size - 1] != vid:
+    base = i * window_size * 5
+    valid = vessel_id[idx + window_size - 1] == vid
+
+    if valid:
+        for j in range(window_size):
+            r = idx + j
+            s = speed[r]
+            c = course[r]
+
+            if math.isnan(s) or math.isnan(c):
+                valid = False
+                break
+
+            if s < 0.0:
+                s = 0.0
+            elif s > 100.0:
+                s = 100.0
+
+            if c < 0.0:
+                c = 0.0
+            elif c > 360.0:
+                c = 360.0
+
+            out_windows[base + j*5 + 0] = lat[r]
+            out_windows[base + j*5 + 1] = lon[r]
+            out_windows[base + j*5 + 2] = s
+            out_windows[base + j*5 + 3] = c
+            # uint32 gap bits in a float32 slot: copied, never computed on
+            out_windows[base + j*5 + 4] = gaps[r]
+
+    if not valid:
+        # invalid windows are zero-filled so both backends write identical bytes
+        for k in range(window_size * 5):
+            out_windows[base + k] = 0.0
         out_vids[i] = -1
         return
 
-    base = i * window_size * 5
-
-    for j in range(window_size):
-        r = idx + j
-        s = speed[r]
-        c = course[r]
-
-        if math.isnan(s) or math.isnan(c):
-            out_vids[i] = -1
-            return
-
-        if s < 0.0:
-            s = 0.0
-        elif s > 100.0:
-            s = 100.0
+    out_vids[i] = vid
 
-        if c < 0.0:
-            c = 0.0
-        elif c > 360.0:
-            c = 360.0
+if HAS_GPU:
+    fused_mask_clamp_window_kernel = cuda.jit(fused_mask_clamp_window_kernel)
 
-        out_windows[base + j*5 + 0] = lat[r]
-        out_windows[base + j*5 + 1] = lon[r]
-        out_windows[base + j*5 + 2] = s
-        out_windows[base + j*5 + 3] = c
-        out_windows[base + j*5 + 4] = ts[r]
+_gpu_ready = False
 
-    out_vids[i] = vid
+def init_gpu():
+    global _gpu_ready
+    if not _gpu_ready:
+        rmm.reinitialize(pool_allocator=True, managed_memory=False)
+        _gpu_ready = True
 
 # ------------------------------
 # RMM → CuPy helper
@@ -89,35 +128,47 @@ def rmm_to_memptr(buf):
     )
 
 # ------------------------------
-# Main processing
+# Shared helpers
 # ------------------------------
-def process_month_gpu(year, month, cfg):
-    file_path = (
+def month_csv_path(year, month, cfg):
+    return (
         f"{cfg.root}/unipi_ais_dynamic_{year}/"
         f"unipi_ais_dynamic_{MONTH_ABBR[month]}{year}.csv"
     )
 
-    print(f"Processing {MONTH_ABBR[month]} {year}")
+def prepare_month(df):
+    """
+    Rename, encode and sort a month frame (pandas or cudf).
 
-    df = cudf.read_csv(file_path)
-    df = df.rename(columns={"t": "timestamp"})
-    df["timestamp"] = df["timestamp"].astype("float32")
-    df["vessel_id"], _ = df["vessel_id"].factorize()
+    Vessel codes follow the sorted vessel ids, rows are ordered on the
+    int64 't' and ties keep file order, so every backend and the external
+    sort in ingest.py produce the same row order.
+    """
+    codes, _ = df["vessel_id"].factorize(sort=True)
+    df["vessel_id"] = codes
+    df["vessel_id"] = df["vessel_id"].astype("int32")
+    df["row"] = np.arange(len(df), dtype=np.int64)
 
-    gathered = df[
-        ["vessel_id", "lat", "lon", "speed", "course", "timestamp"]
-    ].sort_values(["vessel_id", "timestamp"])
+    return df[
+        ["vessel_id", "lat", "lon", "speed", "course", "t", "row"]
+    ].sort_values(["vessel_id", "t", "row"])
 
-    N = len(gathered)
-    total_windows = N - cfg.window_size + 1
-    if total_windows <= 0:
-        return
-
-    # ------------------------------
-    # TensorStore (CREATE OUTPUT)
-    # ------------------------------
+def output_root(cfg):
     out_root = Path(cfg.root) / "processed"
     out_root.mkdir(parents=True, exist_ok=True)
+    return out_root
+
+def compact_path(year, month, cfg):
+    return output_root(cfg) / f"compact_{year}_{MONTH_ABBR[month]}"
+
+def valid_index_path(year, month, cfg):
+    return output_root(cfg) / f"valid_{year}_{MONTH_ABBR[month]}"
+
+def t0_path(year, month, cfg):
+    return output_root(cfg) / f"t0_{year}_{MONTH_ABBR[month]}.zarr"
+
+def open_output_stores(year, month, cfg, total_windows):
+    out_root = output_root(cfg)
 
     windows_store = ts.open(
         {
@@ -153,80 +204,568 @@ def process_month_gpu(year, month, cfg):
         ),
     ).result()
 
+    # int64 start time of every window; with the gaps in channel 4 it gives
+    # every report time exactly (window_store.window_times)
+    t0_store = ts.open(
+        {
+            "driver": "zarr",
+            "kvstore": {
+                "driver": "file",
+                "path": str(t0_path(year, month, cfg)),
+            },
+        },
+        create=True,
+        open=True,
+        dtype=ts.int64,
+        shape=[total_windows],
+        chunk_layout=ts.ChunkLayout(
+            chunk_shape=[65536]
+        ),
+    ).result()
+
+    return windows_store, vids_store, t0_store
+
+class StageTimings:
+    """
+    Accumulated seconds per pipeline stage.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def report(self, label):
+        wall = time.perf_counter() - self.started
+        parts = " ".join(f"{k}={v:.2f}s" for k, v in self.seconds.items())
+        print(f"{label} | wall={wall:.2f}s {parts}")
+        return {"wall": round(wall, 3), **{k: round(v, 3) for k, v in self.seconds.items()}}
+
+class PipelinedWriter:
+    """
+    Writes dense window/vid batches to the TensorStores without waiting
+    for them, so batch k is written while batch k + 1 is computed.
+
+    Host buffers belong to ``slots`` slots; ``acquire(slot)`` blocks until
+    TensorStore has copied the last batch submitted from that slot, after
+    which its buffers can be refilled. ``close()`` waits for every write to
+    be committed.
+    """
+
+    def __init__(self, windows_store, vids_store, timings, slots=2):
+        self.windows_store = windows_store
+        self.vids_store = vids_store
+        self.timings = timings
+        self.copies = [[] for _ in range(slots)]
+        self.commits = []
+        self.first_submit = None
+
+    def acquire(self, slot):
+        t0 = time.perf_counter()
+        for fut in self.copies[slot]:
+            fut.result()
+        self.copies[slot] = []
+        self.timings.add("wait_buffer", time.perf_counter() - t0)
+
+    def submit(self, slot, offset, win_host, vid_host):
+        if self.first_submit is None:
+            self.first_submit = time.perf_counter()
+        n = len(vid_host)
+        for store, data in ((self.windows_store, win_host), (self.vids_store, vid_host)):
+            fut = store[offset:offset + n].write(data)
+            self.copies[slot].append(fut.copy)
+            self.commits.append(fut.commit)
+
+    def close(self):
+        t0 = time.perf_counter()
+        for fut in self.commits:
+            fut.result()
+        self.timings.add("drain_writes", time.perf_counter() - t0)
+        if self.first_submit is not None:
+            # first write issued -> last write committed
+            self.timings.add("write_span", time.perf_counter() - self.first_submit)
+
+def resolve_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}")
+    if backend == "auto":
+        return "gpu" if HAS_GPU else "cpu"
+    if backend == "gpu" and not HAS_GPU:
+        raise RuntimeError("gpu backend requested but cudf/rmm/cupy/numba are not importable")
+    return backend
+
+# ------------------------------
+# CPU windowing
+# ------------------------------
+def _clamp(x, lo, hi, xp=np):
+    # same comparisons as the kernel (np.clip may turn -0.0 into 0.0)
+    return xp.where(x < lo, lo, xp.where(x > hi, hi, x))
+
+def compact_columns(vessel_id, lat, lon, speed, course, window_size, xp=np):
+    """
+    Point features and valid window starts for the compact layout.
+
+    Works on NumPy or CuPy arrays (``xp``). Returns (points [N, 4] float32,
+    starts int64) where window i = points[i:i + window_size] is valid when
+    it stays on one vessel and has no NaN speed/course. Times are stored
+    apart, as int64 't'.
+    """
+    points = xp.stack([
+        lat, lon, _clamp(speed, 0.0, 100.0, xp), _clamp(course, 0.0, 360.0, xp),
+    ], axis=1).astype(xp.float32)
+
+    total = len(vessel_id) - window_size + 1
+    if total <= 0:
+        return points, xp.zeros(0, dtype=xp.int64)
+
+    nan = xp.isnan(speed) | xp.isnan(course)
+    nan_prefix = xp.concatenate((xp.zeros(1, dtype=xp.int64), xp.cumsum(nan, dtype=xp.int64)))
+    valid = (
+        (vessel_id[:total] == vessel_id[window_size - 1:])
+        & (nan_prefix[window_size:] == nan_prefix[:total])
+    )
+    return points, xp.flatnonzero(valid).astype(xp.int64)
+
+class CPUWindower:
+    """
+    NumPy counterpart of fused_mask_clamp_window_kernel.
+
+    Features are clamped once per point and laid out as an [N, 5] float32
+    array; windows are strided views over it. Validity uses a vessel-id
+    comparison of each window's first and last point and a prefix count of
+    NaN speed/course, so no window is scanned point by point. Batches are
+    copied out in slices on ``threads`` threads (NumPy releases the GIL).
+    """
+
+    def __init__(self, vessel_id, lat, lon, speed, course, gaps, window_size, threads=1):
+        self.window_size = window_size
+        self.threads = threads
+        self.vessel_id = np.ascontiguousarray(vessel_id, dtype=np.int32)
+
+        nan = np.isnan(speed) | np.isnan(course)
+        self.nan_prefix = np.concatenate(([0], np.cumsum(nan, dtype=np.int64)))
+
+        feats = np.empty((len(self.vessel_id), 5), dtype=np.float32)
+        feats[:, 0] = lat
+        feats[:, 1] = lon
+        feats[:, 2] = _clamp(speed, 0.0, 100.0)
+        feats[:, 3] = _clamp(course, 0.0, 360.0)
+        feats[:, 4] = gaps
+        self.feats = feats
+
+        # [N - window_size + 1, window_size, 5] view, no copy
+        self.view = np.lib.stride_tricks.sliding_window_view(
+            feats, window_size, axis=0
+        ).transpose(0, 2, 1)
+
+        self.pool = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+
+    @property
+    def total_windows(self):
+        return max(len(self.vessel_id) - self.window_size + 1, 0)
+
+    def vids(self, start, batch):
+        w = self.window_size
+        first = self.vessel_id[start:start + batch]
+        last = self.vessel_id[start + w - 1:start + w - 1 + batch]
+        nans = self.nan_prefix[start + w:start + w + batch] - self.nan_prefix[start:start + batch]
+        return np.where((first == last) & (nans == 0), first, -1).astype(np.int32)
+
+    def __call__(self, start, batch, out=None):
+        """
+        Return (windows [batch, window_size, 5] float32, vids [batch] int32)
+        for windows start .. start + batch.
+        """
+        if out is None:
+            out = np.empty((batch, self.window_size, 5), dtype=np.float32)
+        vids = self.vids(start, batch)
+
+        def copy(lo, hi):
+            np.copyto(out[lo:hi], self.view[start + lo:start + hi])
+            out[lo:hi][vids[lo:hi] < 0] = 0.0
+
+        if self.pool is None:
+            copy(0, batch)
+        else:
+            step = -(-batch // self.threads)
+            list(self.pool.map(lambda lo: copy(lo, min(lo + step, batch)), range(0, batch, step)))
+
+        return out[:batch], vids
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+def month_done(year, month, rows, windows, valid):
+    print(
+        f"Done {MONTH_ABBR[month]} {year} | windows={windows} valid={valid}"
+    )
+    return {"rows": int(rows), "windows": int(max(windows, 0)), "valid": int(valid)}
+
+def merge_valid_parts(parts):
+    """
+    Concatenate per-batch valid indexes into the month index.
+    """
+    starts = np.concatenate([p.starts for p in parts]) if parts else np.zeros(0, np.int64)
+    vessels = np.concatenate([
+        np.repeat(p.vessel_codes, p.vessel_counts) for p in parts
+    ]) if parts else np.zeros(0, np.int32)
+    return ValidIndex.from_starts(starts, vessels)
+
+# ------------------------------
+# Main processing
+# ------------------------------
+def process_month_cpu(year, month, cfg):
+    file_path = month_csv_path(year, month, cfg)
+
+    print(f"Processing {MONTH_ABBR[month]} {year} (cpu)")
+
+    columns = ["t", "vessel_id", "lat", "lon", "speed", "course"]
+    df = pd.read_csv(file_path, usecols=columns, dtype={c: AIS_DTYPES[c] for c in columns})
+    gathered = prepare_month(df)
+
+    N = len(gathered)
+    total_windows = N - cfg.window_size + 1
+    if total_windows <= 0:
+        return month_done(year, month, N, 0, 0)
+
+    if cfg.layout == "compact":
+        vessel_id = gathered["vessel_id"].to_numpy()
+        points, starts = compact_columns(
+            vessel_id,
+            *(gathered[c].to_numpy() for c in ("lat", "lon", "speed", "course")),
+            cfg.window_size,
+        )
+        write_compact(
+            compact_path(year, month, cfg), vessel_id, points, gathered["t"].to_numpy(), starts, cfg.window_size,
+        )
+        return month_done(year, month, N, total_windows, len(starts))
+
+    windows_store, vids_store, t0_store = open_output_stores(year, month, cfg, total_windows)
+    t0_write = t0_store.write(gathered["t"].to_numpy()[:total_windows])
+
+    windower = CPUWindower(
+        gathered["vessel_id"].to_numpy(),
+        gathered["lat"].to_numpy(),
+        gathered["lon"].to_numpy(),
+        gathered["speed"].to_numpy(),
+        gathered["course"].to_numpy(),
+        report_gaps(gathered["vessel_id"].to_numpy(), gathered["t"].to_numpy()),
+        cfg.window_size,
+        threads=cfg.cpu_threads,
+    )
+    del df, gathered
+
+    timings = StageTimings()
+    writer = PipelinedWriter(windows_store, vids_store, timings)
+    bufs = [np.empty((min(cfg.chunk_size, total_windows), cfg.window_size, 5), dtype=np.float32)
+            for _ in range(2)]
+    valid_parts = []
+    for k, start in enumerate(range(0, total_windows, cfg.chunk_size)):
+        batch = min(cfg.chunk_size, total_windows - start)
+        writer.acquire(k % 2)
+
+        t0 = time.perf_counter()
+        win_host, vid_host = windower(start, batch, out=bufs[k % 2])
+        timings.add("compute", time.perf_counter() - t0)
+
+        writer.submit(k % 2, start, win_host, vid_host)
+        valid_parts.append(ValidIndex.from_vids(vid_host, offset=start))
+
+    writer.close()
+    windower.close()
+    t0_write.result()
+    index = merge_valid_parts(valid_parts)
+    index.write(valid_index_path(year, month, cfg))
+
+    result = month_done(year, month, N, total_windows, len(index))
+    result["timings"] = timings.report(f"{MONTH_ABBR[month]} {year}")
+    return result
+
+def process_month_gpu(year, month, cfg):
+    init_gpu()
+    file_path = month_csv_path(year, month, cfg)
+
+    print(f"Processing {MONTH_ABBR[month]} {year}")
+
+    df = cudf.read_csv(file_path)
+    gathered = prepare_month(df)
+
+    N = len(gathered)
+    total_windows = N - cfg.window_size + 1
+    if total_windows <= 0:
+        return month_done(year, month, N, 0, 0)
+
+    if cfg.layout == "compact":
+        vessel_id = gathered["vessel_id"].to_cupy()
+        points, starts = compact_columns(
+            vessel_id,
+            *(gathered[c].to_cupy() for c in ("lat", "lon", "speed", "course")),
+            cfg.window_size,
+            xp=cp,
+        )
+        write_compact(
+            compact_path(year, month, cfg),
+            cp.asnumpy(vessel_id), cp.asnumpy(points), gathered["t"].to_numpy(), cp.asnumpy(starts),
+            cfg.window_size,
+        )
+        return month_done(year, month, N, total_windows, len(starts))
+
+    # ------------------------------
+    # TensorStore (CREATE OUTPUT)
+    # ------------------------------
+    windows_store, vids_store, t0_store = open_output_stores(year, month, cfg, total_windows)
+    t0_write = t0_store.write(gathered["t"].to_numpy()[:total_windows])
+
     vessel_id = gathered["vessel_id"].to_cupy()
     lat = gathered["lat"].to_cupy()
     lon = gathered["lon"].to_cupy()
     speed = gathered["speed"].to_cupy()
     course = gathered["course"].to_cupy()
-    ts_col = gathered["timestamp"].to_cupy()
+    gaps = report_gaps(vessel_id, gathered["t"].to_cupy(), xp=cp)
 
     threads = 256
-    write_offset = 0
+    batch_max = min(cfg.chunk_size, total_windows)
+    timings = StageTimings()
+    writer = PipelinedWriter(windows_store, vids_store, timings)
+    valid_parts = []
+
+    # ------------------------------
+    # PREALLOCATED DOUBLE BUFFERS
+    # ------------------------------
+    # one slot per in-flight batch: device output, pinned host copy, stream
+    slots = []
+    for _ in range(2):
+        win_buf = rmm.DeviceBuffer(size=batch_max * cfg.window_size * 5 * 4)
+        vid_buf = rmm.DeviceBuffer(size=batch_max * 4)
+        win_pinned = cp.cuda.alloc_pinned_memory(batch_max * cfg.window_size * 5 * 4)
+        vid_pinned = cp.cuda.alloc_pinned_memory(batch_max * 4)
+        stream = cp.cuda.Stream(non_blocking=True)
+        slots.append({
+            "win_buf": win_buf,
+            "vid_buf": vid_buf,
+            "win_dev": cp.ndarray((batch_max * cfg.window_size * 5,), dtype=cp.float32,
+                                  memptr=rmm_to_memptr(win_buf)),
+            "vid_dev": cp.ndarray((batch_max,), dtype=cp.int32, memptr=rmm_to_memptr(vid_buf)),
+            "win_pinned": win_pinned,
+            "vid_pinned": vid_pinned,
+            "win_host": np.frombuffer(win_pinned, np.float32, batch_max * cfg.window_size * 5)
+                          .reshape(batch_max, cfg.window_size, 5),
+            "vid_host": np.frombuffer(vid_pinned, np.int32, batch_max),
+            "stream": stream,
+            "nb_stream": cuda.external_stream(stream.ptr),
+            "events": [cp.cuda.Event() for _ in range(3)],
+        })
+
+    def finish(k, start, batch):
+        # wait for this slot's kernel + copy, then hand the host buffers to the writer
+        slot = slots[k]
+        t0 = time.perf_counter()
+        slot["stream"].synchronize()
+        timings.add("wait_gpu", time.perf_counter() - t0)
+
+        ev_start, ev_kernel, ev_copy = slot["events"]
+        timings.add("kernel", cp.cuda.get_elapsed_time(ev_start, ev_kernel) / 1000)
+        timings.add("d2h", cp.cuda.get_elapsed_time(ev_kernel, ev_copy) / 1000)
+
+        vid_host = slot["vid_host"][:batch]
+        writer.submit(k, start, slot["win_host"][:batch], vid_host)
+        valid_parts.append(ValidIndex.from_vids(vid_host, offset=start))
 
     # ------------------------------
     # STREAMING LOOP
     # ------------------------------
-    for start in range(0, total_windows, cfg.chunk_size):
+    # batch k is launched and copied on its slot's stream while batch k - 1
+    # is handed to the writer and batch k - 2's writes finish in TensorStore
+    pending = None
+    for k, start in enumerate(range(0, total_windows, cfg.chunk_size)):
         batch = min(cfg.chunk_size, total_windows - start)
+        slot = slots[k % 2]
+        writer.acquire(k % 2)
 
-        win_buf = rmm.DeviceBuffer(
-            size=batch * cfg.window_size * 5 * 4
-        )
-        vid_buf = rmm.DeviceBuffer(size=batch * 4)
-
-        win_dev = cp.ndarray(
-            (batch * cfg.window_size * 5,),
-            dtype=cp.float32,
-            memptr=rmm_to_memptr(win_buf),
-        )
-        vid_dev = cp.ndarray(
-            (batch,),
-            dtype=cp.int32,
-            memptr=rmm_to_memptr(vid_buf),
-        )
-
+        ev_start, ev_kernel, ev_copy = slot["events"]
+        ev_start.record(slot["stream"])
         blocks = (batch + threads - 1) // threads
-
-        fused_mask_clamp_window_kernel[blocks, threads](
-            vessel_id, lat, lon, speed, course, ts_col,
+        fused_mask_clamp_window_kernel[blocks, threads, slot["nb_stream"]](
+            vessel_id, lat, lon, speed, course, gaps,
             start, N, cfg.window_size,
-            win_dev, vid_dev
+            slot["win_dev"], slot["vid_dev"][:batch]
         )
-        cuda.synchronize()
+        ev_kernel.record(slot["stream"])
 
-        win_host = cp.asnumpy(
-            win_dev.reshape(batch, cfg.window_size, 5)
+        cp.cuda.runtime.memcpyAsync(
+            slot["win_host"].ctypes.data, slot["win_dev"].data.ptr,
+            batch * cfg.window_size * 5 * 4, cp.cuda.runtime.memcpyDeviceToHost, slot["stream"].ptr,
         )
-        vid_host = cp.asnumpy(vid_dev)
-
-        windows_store[
-            write_offset:write_offset + batch
-        ].write(win_host).result()
-
-        vids_store[
-            write_offset:write_offset + batch
-        ].write(vid_host).result()
-
-        write_offset += batch
-
-        del win_dev, vid_dev, win_buf, vid_buf
-        cp.get_default_memory_pool().free_all_blocks()
-
-    print(
-        f"Done {MONTH_ABBR[month]} {year} | windows={total_windows}"
+        cp.cuda.runtime.memcpyAsync(
+            slot["vid_host"].ctypes.data, slot["vid_dev"].data.ptr,
+            batch * 4, cp.cuda.runtime.memcpyDeviceToHost, slot["stream"].ptr,
+        )
+        ev_copy.record(slot["stream"])
+
+        if pending is not None:
+            finish(*pending)
+        pending = (k % 2, start, batch)
+
+    if pending is not None:
+        finish(*pending)
+    writer.close()
+    t0_write.result()
+
+    index = merge_valid_parts(valid_parts)
+    index.write(valid_index_path(year, month, cfg))
+
+    result = month_done(year, month, N, total_windows, len(index))
+    result["timings"] = timings.report(f"{MONTH_ABBR[month]} {year}")
+    return result
+
+def process_month_external(year, month, cfg):
+    """
+    Out-of-core variant: external sort of the CSV (ingest.py), then
+    windowing of the sorted file ``cfg.chunk_size`` rows at a time. Each
+    block carries the last window_size - 1 points of the previous one, so
+    every window is produced exactly once. Windowing runs on the host; the
+    per-block work is small next to the sort.
+    """
+    file_path = month_csv_path(year, month, cfg)
+    w = cfg.window_size
+
+    print(f"Processing {MONTH_ABBR[month]} {year} (external sort)")
+
+    sorted_path = sort_month_csv(
+        file_path, output_root(cfg) / f"sorted_{year}_{MONTH_ABBR[month]}.parquet", cfg.ingest
     )
+    pf = pq.ParquetFile(sorted_path)
+    N = pf.metadata.num_rows
+    total_windows = N - w + 1
+    if total_windows <= 0:
+        return month_done(year, month, N, 0, 0)
+
+    if cfg.layout == "compact":
+        t_min, t_max = read_time_range(sorted_path)
+        writer = CompactWriter(compact_path(year, month, cfg), N, w, t_base=t_min, t_max=t_max)
+    else:
+        windows_store, vids_store, t0_store = open_output_stores(year, month, cfg, total_windows)
+        valid_parts = []
+
+    names = ("vessel_id", "lat", "lon", "speed", "course", "t")
+    tail = None
+    prev = None
+    row = 0
+    for batch in pf.iter_batches(batch_size=cfg.chunk_size, columns=list(names)):
+        cols = {name: batch.column(name).to_numpy(zero_copy_only=False) for name in names}
+        n = batch.num_rows
+        # gaps of the new rows, continuing from the previous block's last report
+        if prev is None:
+            cols["gaps"] = report_gaps(cols["vessel_id"], cols["t"])
+        else:
+            cols["gaps"] = report_gaps(
+                np.r_[prev[0], cols["vessel_id"]], np.r_[prev[1], cols["t"]]
+            )[1:]
+        prev = (cols["vessel_id"][-1], cols["t"][-1])
+        if tail is not None:
+            cols = {name: np.concatenate((tail[name], cols[name])) for name in cols}
+        first = row - (len(cols["t"]) - n)   # global id of the block's first row
+        row += n
+        tail = {name: col[-(w - 1):] for name, col in cols.items()} if w > 1 else None
+        if cfg.layout == "compact":
+            points, starts = compact_columns(
+                *(cols[c] for c in ("vessel_id", "lat", "lon", "speed", "course")), w,
+            )
+            writer.append_points(cols["vessel_id"][-n:], points[-n:], cols["t"][-n:])
+            writer.append_starts(starts + first, cols["vessel_id"][starts])
+        elif len(cols["t"]) >= w:
+            windower = CPUWindower(
+                *(cols[c] for c in ("vessel_id", "lat", "lon", "speed", "course", "gaps")), w,
+                threads=cfg.cpu_threads,
+            )
+            win_host, vid_host = windower(0, windower.total_windows)
+            windower.close()
+            windows_store[first:first + len(vid_host)].write(win_host).result()
+            vids_store[first:first + len(vid_host)].write(vid_host).result()
+            t0_store[first:first + len(vid_host)].write(cols["t"][:len(vid_host)]).result()
+            valid_parts.append(ValidIndex.from_vids(vid_host, offset=first))
+
+    if cfg.layout == "compact":
+        writer.close()
+        valid = writer.num_valid
+    else:
+        index = merge_valid_parts(valid_parts)
+        index.write(valid_index_path(year, month, cfg))
+        valid = len(index)
+
+    return month_done(year, month, N, total_windows, valid)
+
+def process_month(year, month, cfg):
+    """
+    Window one month with the backend selected in ``cfg.backend``, writing
+    the layout selected in ``cfg.layout``. With ``cfg.ingest`` set the month
+    is sorted out of core instead of loaded whole.
+    """
+    if cfg.layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of {LAYOUTS}")
+    if cfg.ingest is not None:
+        return process_month_external(year, month, cfg)
+    if resolve_backend(cfg.backend) == "gpu":
+        return process_month_gpu(year, month, cfg)
+    return process_month_cpu(year, month, cfg)
+
+def month_outputs(year, month, cfg):
+    """
+    Paths whose presence marks a month as written in ``cfg.layout``.
+    """
+    if cfg.layout == "compact":
+        return [compact_path(year, month, cfg) / "meta.json"]
+    out_root = output_root(cfg)
+    return [
+        out_root / f"windows_{year}_{MONTH_ABBR[month]}.zarr",
+        out_root / f"vids_{year}_{MONTH_ABBR[month]}.zarr",
+        t0_path(year, month, cfg),
+        valid_index_path(year, month, cfg) / "vessel_offsets.zarr",
+    ]
 
 # ------------------------------
 # Main
 # ------------------------------
-cfg = AISConfig(
-    root=r"/mnt/c/Users/BBBS-AI-01/d/anomaly/dataset/piraeus",
-    chunk_size=500_000,
-    window_size=128,
-)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Window monthly AIS CSVs into Zarr stores.")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto")
+    parser.add_argument("--cpu-threads", type=int, default=None)
+    parser.add_argument("--layout", choices=LAYOUTS, default="compact",
+                        help="compact: points + valid starts; dense: every window materialised")
+    parser.add_argument("--external-sort", action="store_true",
+                        help="sort each month out of core instead of loading the whole CSV")
+    parser.add_argument("--chunk-rows", type=int, default=IngestConfig.chunk_rows,
+                        help="CSV rows per sorted run (bounds memory with --external-sort)")
+    parser.add_argument("--spill-dir", default=None, help="directory for sorted runs")
+    parser.add_argument("--jobs", type=int, default=1, help="months processed concurrently")
+    parser.add_argument("--devices", default=None,
+                        help="comma-separated GPU ids, one worker per device (overrides --jobs)")
+    parser.add_argument("--force", action="store_true", help="reprocess months marked done")
+    args = parser.parse_args()
+
+    cfg = AISConfig(
+        root=r"/mnt/c/Users/BBBS-AI-01/d/anomaly/dataset/piraeus",
+        chunk_size=500_000,
+        window_size=128,
+        backend=args.backend,
+        cpu_threads=args.cpu_threads,
+        layout=args.layout,
+        ingest=IngestConfig(chunk_rows=args.chunk_rows, spill_dir=args.spill_dir)
+        if args.external_sort else None,
+    )
+
+    from month_jobs import run_months
 
-for year, months in DATA_PERIODS:
-    for month in months:
-        process_month_gpu(year, month, cfg)
+    devices = args.devices.split(",") if args.devices else None
+    run_months(
+        [(year, month) for year, months in DATA_PERIODS for month in months],
+        cfg,
+        jobs=len(devices) if devices else args.jobs,
+        devices=devices,
+        force=args.force,
+    )
 
-print("GPU preprocessing completed.")
+    print(f"{resolve_backend(cfg.backend).upper()} preprocessing completed.")
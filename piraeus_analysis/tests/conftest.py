@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# the scripts import each other as top-level modules; the backend runs from app/
+sys.path[:0] = [str(ROOT), str(ROOT / "app")]
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from csv_to_parquet import (
+    TIME_RANGE_MS, _key_ranges, cell_ids, convert_month, write_spatial, write_time_sorted,
+)
+from ingest import IngestConfig
+
+
+def _key_file(path, keys, row_group_rows):
+    pq.write_table(pa.table({"k": keys}), path, row_group_size=row_group_rows)
+    return pq.ParquetFile(path)
+
+
+def _key_fn(table):
+    return table.column("k").to_numpy()
+
+
+@pytest.mark.parametrize("max_rows", [1, 5, 64, 10_000])
+@pytest.mark.parametrize("seed", range(3))
+def test_key_ranges_bound_rows_and_keep_keys_whole(tmp_path, max_rows, seed):
+    rng = np.random.default_rng(seed)
+    # skewed keys: some hold more than max_rows rows on their own
+    keys = rng.zipf(1.5, 3000).clip(max=400).astype(np.int64) * 7
+    pf = _key_file(tmp_path / "keys.parquet", rng.permutation(keys), row_group_rows=97)
+
+    starts = _key_ranges(pf, _key_fn, ["k"], max_rows)
+    assert np.all(np.diff(starts) > 0)
+    assert np.isin(starts, keys).all()
+
+    run = np.searchsorted(starts, keys, side="right")
+    for r in np.unique(run):
+        members = keys[run == r]
+        assert len(members) <= max_rows or len(np.unique(members)) == 1
+    # greedy: a range is only closed when the next key would overflow it
+    counts = np.bincount(run)
+    first_key = {r: keys[run == r].min() for r in np.unique(run)}
+    for r in range(len(counts) - 1):
+        assert counts[r] + np.count_nonzero(keys == first_key[r + 1]) > max_rows
+
+
+def test_key_ranges_of_empty_file(tmp_path):
+    pf = _key_file(tmp_path / "keys.parquet", np.zeros(0, dtype=np.int64), row_group_rows=10)
+    assert len(_key_ranges(pf, _key_fn, ["k"], 10)) == 0
+
+
+@pytest.fixture
+def month(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 2000
+    frame = pd.DataFrame({
+        "t": 1_500_000_000_000 + rng.integers(0, 3_600_000, n),
+        "vessel_id": [f"v{k:02d}" for k in rng.integers(0, 20, n)],
+        "lon": rng.uniform(23.0, 24.0, n),
+        "lat": rng.uniform(37.5, 38.1, n),
+        "speed": rng.uniform(0, 20, n),
+        "course": rng.uniform(0, 360, n),
+    })
+    csv = tmp_path / "unipi_ais_dynamic_jan2020.csv"
+    frame.to_csv(csv, index=False)
+    out = tmp_path / "year=2020" / "month=01" / "ais.parquet"
+    convert_month(csv, out, IngestConfig(chunk_rows=300, batch_rows=64), row_group_rows=256)
+    return out
+
+
+def _rows(table):
+    frame = table.to_pandas()
+    frame["vessel_id"] = frame["vessel_id"].astype(str)
+    return frame.sort_values(["vessel_id", "t", "lat"], ignore_index=True)
+
+
+def test_spatial_copy(tmp_path, month):
+    cfg = IngestConfig(chunk_rows=150, batch_rows=64)
+    meta = write_spatial(month, tmp_path / "spatial.parquet", cfg, row_group_rows=128)
+    table = pq.read_table(tmp_path / "spatial.parquet")
+    assert meta["num_rows"] == table.num_rows == pq.read_metadata(month).num_rows
+
+    cell = table.column("cell").to_numpy()
+    t = table.column("t").to_numpy()
+    np.testing.assert_array_equal(cell, cell_ids(table.column("lat").to_numpy(), table.column("lon").to_numpy()))
+    assert np.all((np.diff(cell) > 0) | ((np.diff(cell) == 0) & (np.diff(t) >= 0)))
+    pd.testing.assert_frame_equal(_rows(table.drop(["cell"])), _rows(pq.read_table(month)))
+
+
+def test_time_sorted_copy(tmp_path, month):
+    cfg = IngestConfig(chunk_rows=150, batch_rows=64)
+    meta = write_time_sorted(month, tmp_path / "time.parquet", cfg, row_group_rows=128)
+    table = pq.read_table(tmp_path / "time.parquet")
+    assert meta["num_rows"] == table.num_rows
+
+    t = table.column("t").to_numpy()
+    assert np.all(np.diff(t) >= 0)
+    assert len(np.unique(t // TIME_RANGE_MS)) > 1
+    pd.testing.assert_frame_equal(_rows(table), _rows(pq.read_table(month)))
+
+    # row-group t statistics are increasing: a time index
+    md = pq.read_metadata(tmp_path / "time.parquet")
+    col = md.schema.to_arrow_schema().get_field_index("t")
+    mins = [md.row_group(g).column(col).statistics.min for g in range(md.num_row_groups)]
+    assert mins == sorted(mins)
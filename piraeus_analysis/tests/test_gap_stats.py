@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from gap_stats import GapStats, GapStatsConfig, month_gap_stats
+
+CFG = GapStatsConfig(blackout_thresholds=(60.0, 3600.0))
+
+
+def _reports(n=4000, vessels=12, seed=0):
+    # (vessel, t) sorted reports with repeated timestamps and long blackouts
+    rng = np.random.default_rng(seed)
+    vessel = np.sort(rng.integers(0, vessels, n))
+    steps = rng.choice([0, 1_000, 10_000, 60_000, 7_200_000], size=n, p=[0.05, 0.4, 0.3, 0.2, 0.05])
+    steps = steps + rng.integers(0, 1_000, n) * (steps > 0)
+    t = 1_500_000_000_000 + np.cumsum(steps)
+    names = [f"v{k:02d}" for k in range(vessels)]
+    return names, vessel, t
+
+
+def _expected(names, vessel, t):
+    # per-vessel statistics computed directly from all gaps
+    same = vessel[1:] == vessel[:-1]
+    codes, gaps = vessel[1:][same], np.diff(t)[same] / 1000.0
+    out = {}
+    for k, name in enumerate(names):
+        g = gaps[codes == k]
+        out[name] = (np.count_nonzero(g <= 0), g[g > 0])
+    return out
+
+
+def _check(stats, expected):
+    edges = CFG.edges()
+    for name, (zeros, g) in expected.items():
+        r = stats.vessels.index(name)
+        assert stats.zeros[r] == zeros
+        assert stats.count[r] == len(g)
+        if not len(g):
+            continue
+        assert stats.mean[r] == pytest.approx(g.mean(), rel=1e-12)
+        assert stats.m2[r] == pytest.approx(((g - g.mean()) ** 2).sum(), rel=1e-9)
+        assert stats.min[r] == g.min()
+        assert stats.max[r] == g.max()
+        hist = np.bincount(np.searchsorted(edges, g, side="right"), minlength=len(edges) + 1)
+        np.testing.assert_array_equal(stats.hist[r], hist)
+        for k, threshold in enumerate(CFG.blackout_thresholds):
+            assert stats.blackouts[r, k] == np.count_nonzero(g > threshold)
+            assert stats.blackout_seconds[r, k] == pytest.approx(g[g > threshold].sum(), rel=1e-12)
+
+
+def _batches(names, vessel, t, size):
+    for lo in range(0, len(t), size):
+        yield names, vessel[lo:lo + size], t[lo:lo + size]
+
+
+@pytest.mark.parametrize("size", [1, 7, 1000, 10_000])
+def test_month_stats_are_exact_across_batches(size):
+    names, vessel, t = _reports()
+    _check(month_gap_stats(_batches(names, vessel, t, size), CFG), _expected(names, vessel, t))
+
+
+def test_merge_equals_single_pass():
+    names, vessel, t = _reports(seed=1)
+    rng = np.random.default_rng(2)
+    merged = GapStats(CFG)
+    single = GapStats(CFG, names)
+    for part in np.array_split(np.arange(len(t)), [1300, 2900]):
+        # each "month" meets the vessels in another order
+        order = rng.permutation(len(names))
+        local = [names[k] for k in order]
+        merged.merge(month_gap_stats([(local, np.argsort(order)[vessel[part]], t[part])], CFG))
+        same = vessel[part][1:] == vessel[part][:-1]
+        single.add(vessel[part][1:][same], np.diff(t[part])[same] / 1000.0)
+
+    rows = [merged.vessels.index(name) for name in names]
+    for field in ("count", "zeros", "min", "max", "hist", "blackouts"):
+        np.testing.assert_array_equal(getattr(merged, field)[rows], getattr(single, field))
+    for field in ("mean", "m2", "blackout_seconds"):
+        np.testing.assert_allclose(getattr(merged, field)[rows], getattr(single, field), rtol=1e-9)
+
+
+def test_total_collapses_vessels():
+    names, vessel, t = _reports(seed=3)
+    stats = month_gap_stats(_batches(names, vessel, t, 256), CFG)
+    everything = GapStats(CFG, ["all"])
+    same = vessel[1:] == vessel[:-1]
+    everything.add(np.zeros(same.sum(), dtype=np.int64), np.diff(t)[same] / 1000.0)
+
+    total = stats.total()
+    np.testing.assert_array_equal(total.count, everything.count)
+    np.testing.assert_array_equal(total.zeros, everything.zeros)
+    np.testing.assert_array_equal(total.hist, everything.hist)
+    np.testing.assert_allclose(total.mean, everything.mean, rtol=1e-12)
+    np.testing.assert_allclose(total.m2, everything.m2, rtol=1e-9)
+    np.testing.assert_array_equal(total.blackouts, everything.blackouts)
+
+
+def test_merge_rejects_other_bins():
+    with pytest.raises(ValueError):
+        GapStats(CFG).merge(GapStats(GapStatsConfig(bins_per_decade=8)))
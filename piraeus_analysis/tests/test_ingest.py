@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from ingest import IngestConfig, merge_runs, read_time_range, read_vocab, sort_month_csv, spill_sorted_runs
+
+
+def _write_csv(path, n, vessels, times, seed):
+    # few vessels and timestamps, so equal (vessel_id, t) keys are common;
+    # "heading" numbers the rows in file order
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        "t": 1_500_000_000_000 + rng.integers(0, times, n) * 1000,
+        "vessel_id": [f"v{k:03d}" for k in rng.integers(0, vessels, n)],
+        "lon": rng.uniform(23.0, 24.0, n),
+        "lat": rng.uniform(37.5, 38.1, n),
+        "speed": rng.uniform(0, 20, n),
+        "course": rng.uniform(0, 360, n),
+        "heading": np.arange(n, dtype=np.float64),
+    })
+    frame.to_csv(path, index=False)
+    return frame
+
+
+def _merged(csv_path, run_dir, cfg):
+    runs, vocab, t_min, t_max = spill_sorted_runs(csv_path, run_dir, cfg)
+    frames = list(merge_runs(runs, vocab, t_min, t_max, cfg))
+    return pd.concat(frames, ignore_index=True), vocab
+
+
+@pytest.mark.parametrize("chunk_rows, batch_rows", [(4, 2), (7, 3), (50, 8), (1000, 1000)])
+@pytest.mark.parametrize("seed", range(5))
+def test_merge_matches_stable_sort(tmp_path, chunk_rows, batch_rows, seed):
+    csv = tmp_path / "month.csv"
+    frame = _write_csv(csv, 300, vessels=4, times=6, seed=seed)
+    merged, vocab = _merged(csv, tmp_path, IngestConfig(chunk_rows=chunk_rows, batch_rows=batch_rows))
+
+    expected = frame.sort_values(["vessel_id", "t"], kind="stable", ignore_index=True)
+    assert len(merged) == len(frame)
+    np.testing.assert_array_equal(merged["heading"], expected["heading"])
+    np.testing.assert_array_equal(vocab[merged["vessel_id"].to_numpy()], expected["vessel_id"])
+    assert merged["vessel_id"].dtype == np.int32
+
+
+def test_merge_ties_across_batches(tmp_path):
+    # one key repeated across every run and batch boundary
+    csv = tmp_path / "month.csv"
+    frame = _write_csv(csv, 64, vessels=1, times=1, seed=0)
+    merged, _ = _merged(csv, tmp_path, IngestConfig(chunk_rows=4, batch_rows=2))
+    np.testing.assert_array_equal(merged["heading"], frame["heading"])
+
+
+def test_sort_month_csv(tmp_path):
+    csv = tmp_path / "month.csv"
+    frame = _write_csv(csv, 500, vessels=10, times=50, seed=1)
+    out = sort_month_csv(csv, tmp_path / "out" / "month.parquet", IngestConfig(chunk_rows=64, batch_rows=16))
+
+    table = pq.read_table(out).to_pandas()
+    expected = frame.sort_values(["vessel_id", "t"], kind="stable", ignore_index=True)
+    np.testing.assert_array_equal(table["heading"], expected["heading"])
+    vocab = read_vocab(out)
+    assert vocab == sorted(frame["vessel_id"].unique())
+    np.testing.assert_array_equal(np.asarray(vocab)[table["vessel_id"]], expected["vessel_id"])
+    assert read_time_range(out) == (frame["t"].min(), frame["t"].max())
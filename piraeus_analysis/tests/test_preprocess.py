@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+import preprocess
+from preprocess import CPUWindower, compact_columns
+from window_store import report_gaps
+
+WINDOW = 6
+
+
+def _month(n=3000, vessels=25, seed=0):
+    rng = np.random.default_rng(seed)
+    vessel_id = np.sort(rng.integers(0, vessels, n)).astype(np.int32)
+    t = 1_500_000_000_000 + np.cumsum(rng.integers(0, 600_000, n))
+    speed = rng.uniform(-5, 120, n)
+    course = rng.uniform(-10, 400, n)
+    speed[rng.random(n) < 0.01] = np.nan
+    course[rng.random(n) < 0.01] = np.nan
+    return {
+        "vessel_id": vessel_id,
+        "lat": rng.uniform(37.5, 38.1, n),
+        "lon": rng.uniform(23.0, 24.0, n),
+        "speed": speed,
+        "course": course,
+        "gaps": report_gaps(vessel_id, t),
+    }
+
+
+def _reference(cols, window):
+    # one window at a time, as the kernel does
+    feats = np.stack([
+        cols["lat"], cols["lon"],
+        np.where(cols["speed"] < 0, 0, np.where(cols["speed"] > 100, 100, cols["speed"])),
+        np.where(cols["course"] < 0, 0, np.where(cols["course"] > 360, 360, cols["course"])),
+    ], axis=1).astype(np.float32)
+    total = len(cols["vessel_id"]) - window + 1
+    windows = np.zeros((total, window, 5), dtype=np.float32)
+    vids = np.full(total, -1, dtype=np.int32)
+    for i in range(total):
+        span = slice(i, i + window)
+        if cols["vessel_id"][i] != cols["vessel_id"][i + window - 1]:
+            continue
+        if np.isnan(cols["speed"][span]).any() or np.isnan(cols["course"][span]).any():
+            continue
+        windows[i, :, :4] = feats[span]
+        windows[i, :, 4] = cols["gaps"][span]
+        vids[i] = cols["vessel_id"][i]
+    return windows, vids
+
+
+def _cpu(cols, window, threads=1, batch=None):
+    windower = CPUWindower(
+        *(cols[c] for c in ("vessel_id", "lat", "lon", "speed", "course", "gaps")), window, threads=threads,
+    )
+    total = windower.total_windows
+    batch = batch or total
+    windows = np.empty((total, window, 5), dtype=np.float32)
+    vids = np.empty(total, dtype=np.int32)
+    for start in range(0, total, batch):
+        n = min(batch, total - start)
+        _, vids[start:start + n] = windower(start, n, out=windows[start:start + n])
+    windower.close()
+    return windows, vids
+
+
+@pytest.mark.parametrize("threads, batch", [(1, None), (4, 257)])
+def test_cpu_windows_match_reference(threads, batch):
+    cols = _month()
+    windows, vids = _cpu(cols, WINDOW, threads, batch)
+    ref_windows, ref_vids = _reference(cols, WINDOW)
+    np.testing.assert_array_equal(vids, ref_vids)
+    assert windows.view(np.uint32).tobytes() == ref_windows.view(np.uint32).tobytes()
+
+
+def test_compact_starts_match_cpu_vids():
+    cols = _month(seed=1)
+    points, starts = compact_columns(*(cols[c] for c in ("vessel_id", "lat", "lon", "speed", "course")), WINDOW)
+    windows, vids = _cpu(cols, WINDOW)
+    np.testing.assert_array_equal(starts, np.flatnonzero(vids >= 0))
+    dense = np.lib.stride_tricks.sliding_window_view(points, WINDOW, axis=0).transpose(0, 2, 1)
+    assert dense[starts].tobytes() == windows[starts, :, :4].tobytes()
+
+
+def test_gpu_windows_match_cpu():
+    if not preprocess.HAS_GPU or not preprocess.cuda.is_available():
+        pytest.skip("needs cudf, CuPy and a CUDA device")
+    cp = preprocess.cp
+    cols = _month(seed=2)
+    windows, vids = _cpu(cols, WINDOW)
+
+    total = len(vids)
+    dev = [cp.asarray(cols[c]) for c in ("vessel_id", "lat", "lon", "speed", "course", "gaps")]
+    win_dev = cp.empty(total * WINDOW * 5, dtype=cp.float32)
+    vid_dev = cp.empty(total, dtype=cp.int32)
+    threads = 256
+    preprocess.fused_mask_clamp_window_kernel[(total + threads - 1) // threads, threads](
+        *dev, 0, len(cols["vessel_id"]), WINDOW, win_dev, vid_dev,
+    )
+    np.testing.assert_array_equal(cp.asnumpy(vid_dev), vids)
+    assert cp.asnumpy(win_dev).view(np.uint32).tobytes() == windows.view(np.uint32).tobytes()
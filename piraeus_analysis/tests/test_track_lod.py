@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from marine_backend.core.track_lod import LOD_TOLERANCES, dp_significance, lod_level
+
+
+def _segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    den = dx * dx + dy * dy
+    u = 0.0 if den == 0 else min(max(((px - ax) * dx + (py - ay) * dy) / den, 0.0), 1.0)
+    return np.hypot(px - ax - u * dx, py - ay - u * dy)
+
+
+def _douglas_peucker(x, y, tol):
+    # textbook recursion: indices kept at tolerance tol
+    keep = {0, len(x) - 1}
+
+    def split(a, b):
+        if b - a < 2:
+            return
+        d = [_segment_distance(x[i], y[i], x[a], y[a], x[b], y[b]) for i in range(a + 1, b)]
+        k = int(np.argmax(d))
+        if d[k] > tol:
+            keep.add(a + 1 + k)
+            split(a, a + 1 + k)
+            split(a + 1 + k, b)
+
+    split(0, len(x) - 1)
+    return sorted(keep)
+
+
+def _tracks(seed):
+    # random walks that double back, plus one- and two-point tracks
+    rng = np.random.default_rng(seed)
+    lengths = np.r_[rng.integers(3, 80, 12), 1, 2]
+    rng.shuffle(lengths)
+    x = np.concatenate([np.cumsum(rng.normal(0, 0.01, n)) for n in lengths])
+    y = np.concatenate([np.cumsum(rng.normal(0, 0.01, n)) for n in lengths])
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    return x, y, starts
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_significance_levels_match_recursive_douglas_peucker(seed):
+    x, y, starts = _tracks(seed)
+    min_tolerance = 1e-4
+    sig = dp_significance(x, y, starts, min_tolerance)
+    ends = np.r_[starts[1:], len(x)]
+
+    for tol in (min_tolerance, 1e-3, 5e-3, 2e-2, 1.0):
+        for a, b in zip(starts, ends):
+            kept = np.flatnonzero(sig[a:b] > tol).tolist()
+            assert kept == _douglas_peucker(x[a:b], y[a:b], tol)
+
+
+def test_significance_of_track_ends_and_small_points():
+    x = np.array([0.0, 1.0, 2.0, 0.0, 0.0, 1.0, 1.0])
+    y = np.array([0.0, 1e-9, 0.0, 0.0, 1.0, 1.0, 1.0])
+    sig = dp_significance(x, y, np.array([0, 3, 6]), 1e-6)
+    assert np.isinf(sig[[0, 2, 3, 5, 6]]).all()
+    assert sig[1] == 0.0
+    assert sig[4] == pytest.approx(np.sqrt(0.5))
+    assert len(dp_significance(np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64), 1e-6)) == 0
+
+
+def test_lod_level_never_exceeds_the_tolerance():
+    for tol in np.geomspace(LOD_TOLERANCES[-1] / 10, LOD_TOLERANCES[0] * 10, 50):
+        level = lod_level(tol)
+        assert level == len(LOD_TOLERANCES) or LOD_TOLERANCES[level] <= tol
+        assert level == 0 or LOD_TOLERANCES[level - 1] > tol
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from window_store import GAP_MAX, ValidIndex, WindowSampler, gap_ms, report_gaps, window_times, write_compact
+
+
+def _vids(n=5000, vessels=30, seed=0):
+    rng = np.random.default_rng(seed)
+    vids = np.sort(rng.integers(0, vessels, n)).astype(np.int32)
+    vids[rng.random(n) < 0.3] = -1
+    return vids
+
+
+@pytest.fixture
+def index():
+    return ValidIndex.from_vids(_vids())
+
+
+def _owner(index, ids):
+    # vessel code of every id, through the per-vessel slices
+    k = np.searchsorted(index.vessel_offsets, np.searchsorted(index.starts, ids), side="right") - 1
+    return index.vessel_codes[k]
+
+
+def test_from_vids_groups_by_vessel(index):
+    vids = _vids()
+    np.testing.assert_array_equal(index.starts, np.flatnonzero(vids >= 0))
+    np.testing.assert_array_equal(index.vessel_codes, np.unique(vids[vids >= 0]))
+    for code in index.vessel_codes:
+        np.testing.assert_array_equal(index.vessel_windows(code), np.flatnonzero(vids == code))
+    assert len(index.vessel_windows(10_000)) == 0
+
+
+def test_from_vids_offset_and_write_read(tmp_path, index):
+    shifted = ValidIndex.from_vids(_vids(), offset=100)
+    np.testing.assert_array_equal(shifted.starts, index.starts + 100)
+
+    index.write(tmp_path)
+    back = ValidIndex.read(tmp_path)
+    np.testing.assert_array_equal(back.starts, index.starts)
+    np.testing.assert_array_equal(back.vessel_codes, index.vessel_codes)
+    np.testing.assert_array_equal(back.vessel_offsets, index.vessel_offsets)
+
+
+def test_sample_uniform_draws_distinct_valid_ids(index):
+    ids = index.sample_uniform(500, rng=1)
+    assert len(ids) == 500
+    assert np.all(np.diff(ids) > 0)
+    assert np.isin(ids, index.starts).all()
+
+    everything = index.sample_uniform(len(index) * 2, rng=1)
+    np.testing.assert_array_equal(everything, index.starts)
+
+    with_replacement = index.sample_uniform(len(index) * 2, replace=True, rng=1)
+    assert len(with_replacement) == len(index) * 2
+    assert np.isin(with_replacement, index.starts).all()
+
+
+def test_sample_stratified_takes_per_vessel(index):
+    per_vessel = 40
+    ids = index.sample_stratified(per_vessel, rng=2)
+    assert np.all(np.diff(ids) > 0)
+    assert np.isin(ids, index.starts).all()
+    taken = np.bincount(np.searchsorted(index.vessel_codes, _owner(index, ids)), minlength=len(index.vessel_codes))
+    np.testing.assert_array_equal(taken, np.minimum(index.vessel_counts, per_vessel))
+
+    ids = index.sample_stratified(per_vessel, replace=True, rng=2)
+    assert len(ids) == per_vessel * len(index.vessel_codes)
+    assert np.isin(ids, index.starts).all()
+    taken = np.bincount(np.searchsorted(index.vessel_codes, _owner(index, ids)), minlength=len(index.vessel_codes))
+    assert (taken == per_vessel).all()
+
+
+def test_empty_index_samples_nothing():
+    empty = ValidIndex.from_vids(np.full(10, -1, dtype=np.int32))
+    assert len(empty) == 0
+    assert len(empty.sample_uniform(5)) == 0
+    assert len(empty.sample_stratified(5)) == 0
+    assert len(empty.sample_stratified(5, replace=True)) == 0
+
+
+@pytest.mark.parametrize("mode", ["uniform", "chunk_local"])
+def test_sampler_draws_only_valid_windows(tmp_path, mode):
+    rng = np.random.default_rng(3)
+    n, window = 200_000, 4
+    vessel_id = np.sort(rng.integers(0, 50, n)).astype(np.int32)
+    points = rng.random((n, 4)).astype(np.float32)
+    t = 1_500_000_000_000 + np.arange(n, dtype=np.int64) * 1000
+    valid = np.flatnonzero(vessel_id[:-window + 1] == vessel_id[window - 1:])
+    starts = valid[rng.random(len(valid)) < 0.5]
+    write_compact(tmp_path / "compact_2020_jan", vessel_id, points, t, starts, window)
+
+    sampler = WindowSampler(tmp_path / "compact_2020_jan")
+    ids, windows = sampler.sample(3000, mode=mode, rng=4)
+    assert len(ids) == 3000
+    assert np.all(np.diff(ids) > 0)
+    assert np.isin(ids, starts).all()
+    dense = np.lib.stride_tricks.sliding_window_view(points, window, axis=0).transpose(0, 2, 1)
+    np.testing.assert_array_equal(windows[..., :4], dense[ids])
+
+
+def _tracks(n=3000, vessels=8, seed=5):
+    # report gaps from seconds to weeks: beyond float32 (2**24 ms) and int32 (2**31 ms)
+    rng = np.random.default_rng(seed)
+    vessel_id = np.sort(rng.integers(0, vessels, n)).astype(np.int32)
+    steps = rng.integers(1, 30_000, n)
+    long = rng.random(n) < 0.05
+    steps[long] = rng.integers(2**24, 40 * 86_400_000, long.sum())
+    return vessel_id, 1_500_000_000_000 + np.cumsum(steps)
+
+
+def test_report_gaps_are_exact():
+    vessel_id, t = _tracks()
+    gaps = report_gaps(vessel_id, t)
+    assert gaps.dtype == np.float32
+    expected = np.r_[0, np.where(vessel_id[1:] == vessel_id[:-1], np.diff(t), 0)]
+    assert expected.max() > 2**31
+    np.testing.assert_array_equal(gap_ms(gaps), expected)
+
+    capped = report_gaps(np.zeros(2, dtype=np.int32), np.array([0, GAP_MAX + 10**6]))
+    np.testing.assert_array_equal(gap_ms(capped), [0, GAP_MAX])
+
+
+def test_window_times_round_trip(tmp_path):
+    window = 5
+    vessel_id, t = _tracks(seed=6)
+    points = np.zeros((len(t), 4), dtype=np.float32)
+    starts = np.flatnonzero(vessel_id[:-window + 1] == vessel_id[window - 1:])
+    write_compact(tmp_path / "compact_2020_jan", vessel_id, points, t, starts, window)
+
+    sampler = WindowSampler(tmp_path / "compact_2020_jan")
+    ids = starts[::3]
+    times = window_times(sampler.read_t0(ids), sampler.read(ids, channel=4))
+    np.testing.assert_array_equal(times, np.lib.stride_tricks.sliding_window_view(t, window)[ids])
+    np.testing.assert_array_equal(sampler.read(ids)[..., 4].view(np.uint32), sampler.read(ids, channel=4).view(np.uint32))
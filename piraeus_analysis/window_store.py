@@ -0,0 +1,698 @@
+"""
+Compact storage for AIS sliding windows.
+
+Instead of materialising every overlapping window (each point stored
+``window_size`` times), a month is stored as a directory holding:
+
+    points.zarr     [N, 4] float32   lat, lon, speed, course
+                                     (sorted by vessel then time, clamped)
+    t.zarr          [N]    uint32    report time, ms after meta["t_base"]
+                                     (int64 if the store spans > ~49.7 days)
+    vessel_id.zarr  [N]    int32     vessel code of every point
+    starts.zarr     [M]    int64     start offset of every valid window
+    vessel_codes.zarr   [V]   int32  vessels with at least one valid window
+    vessel_offsets.zarr [V+1] int64  their slice of starts.zarr
+    meta.json                        format, window_size, t_base, counts
+
+Window ``i`` is ``points[i:i + window_size]``; it is valid when ``i`` is in
+``starts``. CompactWindows serves windows as zero-copy strided views over
+the points, and WindowsCompat / VidsCompat expose the old
+``windows_*.zarr`` / ``vids_*.zarr`` layout for TensorStore consumers.
+
+In both layouts channel 4 is the time since the vessel's previous report
+in ms (0 at its first report), as a uint32 stored bit for bit in the
+float32 slot: exact for gaps up to ~49.7 days (longer ones saturate), 4
+bytes like the other channels, and the same in every window holding the
+point, so overlapping dense windows still compress as well as before.
+``gap_ms`` reads the channel back as uint32. Absolute times are int64:
+window ``i`` starts at ``t_base + t[i]`` here and at ``t0_YYYY_mon.zarr[i]``
+next to a dense ``windows_YYYY_mon.zarr``; ``window_times`` rebuilds every
+report time from the start and the gaps. Format 1 stores (float32 epoch ms
+in channel 4, rounded to ~2 minutes) are still read, converted to gaps.
+Dense format 2 held float32 gaps (exact only under ~4.6 h); format 3 is
+the uint32 encoding, and months written before it are rebuilt.
+
+The three index arrays form a ValidIndex, which the dense layout also
+writes (as ``valid_YYYY_mon``) so samplers never touch invalid windows.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import tensorstore as ts
+
+COMPACT_FORMAT = "ais-compact-windows/2"
+DENSE_FORMAT = "ais-dense-windows/3"
+_LEGACY_COMPACT_FORMAT = "ais-compact-windows/1"
+POINT_CHUNK = 65536
+T_OFFSET_MAX = np.iinfo(np.uint32).max   # ms, ~49.7 days of data per store
+GAP_MAX = np.iinfo(np.uint32).max        # ms, longest exact report gap
+
+
+def _zarr_spec(path):
+    return {
+        "driver": "zarr",
+        "kvstore": {"driver": "file", "path": str(path)},
+    }
+
+
+def _write_array(path, array, chunk):
+    _create_array(path, array.dtype, array.shape, chunk).write(array).result()
+
+
+def _read_array(path):
+    return ts.open(_zarr_spec(path), open=True).result().read().result()
+
+
+def _try_read_array(path):
+    return _read_array(path) if Path(path).exists() else None
+
+
+class ValidIndex:
+    """
+    Dense index of valid window ids for one month, grouped by vessel.
+
+    ``starts`` holds the valid window ids in ascending order; the ids of
+    vessel ``vessel_codes[k]`` are ``starts[vessel_offsets[k]:vessel_offsets[k + 1]]``
+    (windows are ordered by vessel, so each vessel is one slice).
+    """
+
+    def __init__(self, starts, vessel_codes, vessel_offsets):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.vessel_codes = np.asarray(vessel_codes, dtype=np.int32)
+        self.vessel_offsets = np.asarray(vessel_offsets, dtype=np.int64)
+
+    @classmethod
+    def from_starts(cls, starts, start_vessels):
+        """
+        Build from ascending valid window ids and the vessel code of each.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        start_vessels = np.asarray(start_vessels, dtype=np.int32)
+        if len(start_vessels):
+            first = np.flatnonzero(np.r_[True, start_vessels[1:] != start_vessels[:-1]])
+        else:
+            first = np.zeros(0, dtype=np.int64)
+        offsets = np.append(first, len(starts))
+        return cls(starts, start_vessels[first], offsets)
+
+    @classmethod
+    def from_vids(cls, vids, offset=0):
+        """
+        Build from a dense vids array (-1 for invalid windows).
+        """
+        vids = np.asarray(vids)
+        valid = np.flatnonzero(vids >= 0)
+        return cls.from_starts(valid + offset, vids[valid])
+
+    @classmethod
+    def read(cls, path):
+        """
+        Read the index arrays from ``path``. Compact directories written
+        before the per-vessel arrays existed are indexed from vessel_id.zarr.
+        """
+        path = Path(path)
+        starts = _read_array(path / "starts.zarr")
+        codes = _try_read_array(path / "vessel_codes.zarr")
+        offsets = _try_read_array(path / "vessel_offsets.zarr")
+        if codes is None or offsets is None:
+            vessel_id = _try_read_array(path / "vessel_id.zarr")
+            if vessel_id is None:
+                raise FileNotFoundError(f"{path}: no per-vessel index")
+            return cls.from_starts(starts, vessel_id[starts])
+        return cls(starts, codes, offsets)
+
+    def write(self, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        _write_array(path / "starts.zarr", self.starts, POINT_CHUNK)
+        _write_array(path / "vessel_codes.zarr", self.vessel_codes, POINT_CHUNK)
+        _write_array(path / "vessel_offsets.zarr", self.vessel_offsets, POINT_CHUNK)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def vessel_counts(self) -> np.ndarray:
+        """
+        Number of valid windows per vessel, aligned with ``vessel_codes``.
+        """
+        return np.diff(self.vessel_offsets)
+
+    def vessel_windows(self, code: int) -> np.ndarray:
+        k = np.searchsorted(self.vessel_codes, code)
+        if k == len(self.vessel_codes) or self.vessel_codes[k] != code:
+            return self.starts[:0]
+        return self.starts[self.vessel_offsets[k]:self.vessel_offsets[k + 1]]
+
+    def sample_uniform(self, n: int, replace: bool = False, rng=None) -> np.ndarray:
+        """
+        ``n`` valid window ids drawn uniformly (at most len(self) without
+        replacement), sorted ascending for chunk-friendly reads.
+        """
+        rng = np.random.default_rng(rng)
+        m = len(self.starts)
+        if not replace:
+            n = min(n, m)
+        if n <= 0 or m == 0:
+            return self.starts[:0]
+        if replace:
+            pos = rng.integers(0, m, size=n)
+        else:
+            pos = rng.choice(m, size=n, replace=False)
+        return np.sort(self.starts[pos])
+
+    def sample_stratified(self, per_vessel: int, replace: bool = False, rng=None) -> np.ndarray:
+        """
+        Up to ``per_vessel`` valid window ids from every vessel (with
+        ``replace``, exactly ``per_vessel``), sorted ascending.
+        """
+        rng = np.random.default_rng(rng)
+        counts = self.vessel_counts
+        if replace:
+            take = np.full(len(counts), per_vessel, dtype=np.int64)
+        else:
+            take = np.minimum(counts, per_vessel)
+        owner = np.repeat(np.arange(len(counts)), take)
+        if not len(owner):
+            return self.starts[:0]
+
+        if replace:
+            local = (rng.random(len(owner)) * counts[owner]).astype(np.int64)
+        else:
+            # one draw without replacement per vessel
+            local = np.empty(len(owner), dtype=np.int64)
+            out = 0
+            for k in np.flatnonzero(take):
+                c, t = counts[k], take[k]
+                local[out:out + t] = rng.choice(c, size=t, replace=False)
+                out += t
+        return np.sort(self.starts[self.vessel_offsets[owner] + local])
+
+
+def is_compact(path) -> bool:
+    return (Path(path) / "meta.json").exists()
+
+
+def valid_index_path(path) -> Path:
+    """
+    Index directory of a month: the compact directory itself, or
+    valid_YYYY_mon next to windows_YYYY_mon.zarr.
+    """
+    path = Path(path)
+    if is_compact(path):
+        return path
+    return path.with_name(path.name.replace("windows_", "valid_", 1).removesuffix(".zarr"))
+
+
+def t0_path(path) -> Path:
+    """
+    Window start times of a dense month: t0_YYYY_mon.zarr next to
+    windows_YYYY_mon.zarr.
+    """
+    path = Path(path)
+    return path.with_name(path.name.replace("windows_", "t0_", 1))
+
+
+def report_gaps(vessel_id, t, xp=np):
+    """
+    Channel 4 of each point: ms since the same vessel's previous report, 0
+    at its first report, as uint32 (capped at GAP_MAX) viewed as float32.
+    NumPy or CuPy (``xp``). Copy it into windows as is; ``gap_ms`` decodes.
+    """
+    gaps = xp.zeros(len(t), dtype=xp.uint32)
+    if len(t) > 1:
+        same = vessel_id[1:] == vessel_id[:-1]
+        steps = xp.where(same, t[1:] - t[:-1], 0)
+        gaps[1:] = xp.minimum(steps, GAP_MAX).astype(xp.uint32)
+    return gaps.view(xp.float32)
+
+
+def gap_ms(channel) -> np.ndarray:
+    """
+    uint32 report gaps in ms from channel 4 values (any shape), as written
+    by ``report_gaps``.
+    """
+    return np.asarray(channel, dtype=np.float32).view(np.uint32)
+
+
+def window_times(t0, windows_time) -> np.ndarray:
+    """
+    int64 epoch-ms time of every report of windows, from their start times
+    ``t0`` [n] and time channel ``windows_time`` [n, window_size].
+    """
+    steps = gap_ms(windows_time)[..., 1:].astype(np.int64)
+    out = np.empty(steps.shape[:-1] + (steps.shape[-1] + 1,), dtype=np.int64)
+    out[..., 0] = t0
+    out[..., 1:] = np.asarray(t0, dtype=np.int64)[..., None] + np.cumsum(steps, axis=-1)
+    return out
+
+
+def _create_array(path, dtype, shape, chunk):
+    # chunk: rows per chunk (trailing dims whole) or a full chunk shape
+    chunk_shape = list(chunk) if isinstance(chunk, (list, tuple)) else [chunk] + list(shape[1:])
+    return ts.open(
+        _zarr_spec(path),
+        create=True,
+        delete_existing=True,
+        dtype=ts.dtype(np.dtype(dtype).name),
+        shape=list(shape),
+        chunk_layout=ts.ChunkLayout(
+            chunk_shape=chunk_shape
+        ),
+    ).result()
+
+
+class CompactWriter:
+    """
+    Incremental writer for the compact layout, for months processed in
+    blocks: points are appended in order and valid window starts as they
+    are found. ``close()`` writes the per-vessel index and meta.json.
+    """
+
+    def __init__(self, path, num_points, window_size, t_base=0, t_max=None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        # a directory without meta.json is an incomplete write
+        (self.path / "meta.json").unlink(missing_ok=True)
+
+        self.num_points = num_points
+        self.window_size = window_size
+        self.t_base = int(t_base)
+        fits = t_max is not None and int(t_max) - self.t_base <= T_OFFSET_MAX
+        self.t_dtype = np.dtype(np.uint32 if fits else np.int64)
+        # one chunk per channel, so a sampler reading one feature skips the rest
+        self.points = _create_array(self.path / "points.zarr", np.float32, [num_points, 4], [POINT_CHUNK, 1])
+        self.t = _create_array(self.path / "t.zarr", self.t_dtype, [num_points], POINT_CHUNK)
+        self.vessel_id = _create_array(self.path / "vessel_id.zarr", np.int32, [num_points], POINT_CHUNK)
+        self.starts = _create_array(
+            self.path / "starts.zarr", np.int64, [max(num_points - window_size + 1, 0)], POINT_CHUNK
+        )
+        self.written = 0
+        self.num_valid = 0
+        self.vessel_codes = []
+        self.vessel_counts = []
+
+    def append_points(self, vessel_id, points, t):
+        """
+        Append [n, 4] point features and their int64 epoch-ms times.
+        """
+        n = len(vessel_id)
+        offset = np.asarray(t, dtype=np.int64) - self.t_base
+        if n and (offset.min() < 0 or offset.max() > np.iinfo(self.t_dtype).max):
+            raise ValueError(f"{self.path}: times outside the range given at creation")
+        self.points[self.written:self.written + n].write(np.ascontiguousarray(points, dtype=np.float32)).result()
+        self.t[self.written:self.written + n].write(offset.astype(self.t_dtype)).result()
+        self.vessel_id[self.written:self.written + n].write(np.ascontiguousarray(vessel_id, dtype=np.int32)).result()
+        self.written += n
+
+    def append_starts(self, starts, start_vessels):
+        """
+        Append ascending valid window starts and the vessel code of each.
+        """
+        n = len(starts)
+        if not n:
+            return
+        self.starts[self.num_valid:self.num_valid + n].write(np.asarray(starts, dtype=np.int64)).result()
+        self.num_valid += n
+
+        part = ValidIndex.from_starts(starts, start_vessels)
+        codes, counts = part.vessel_codes.tolist(), part.vessel_counts.tolist()
+        if self.vessel_codes and codes[0] == self.vessel_codes[-1]:
+            self.vessel_counts[-1] += counts.pop(0)
+            codes.pop(0)
+        self.vessel_codes.extend(codes)
+        self.vessel_counts.extend(counts)
+
+    def close(self):
+        if self.written != self.num_points:
+            raise ValueError(f"{self.path}: wrote {self.written} of {self.num_points} points")
+        self.starts.resize(exclusive_max=[self.num_valid], shrink_only=True).result()
+        _write_array(self.path / "vessel_codes.zarr", np.asarray(self.vessel_codes, dtype=np.int32), POINT_CHUNK)
+        _write_array(
+            self.path / "vessel_offsets.zarr",
+            np.concatenate(([0], np.cumsum(self.vessel_counts, dtype=np.int64))).astype(np.int64),
+            POINT_CHUNK,
+        )
+
+        meta = {
+            "format": COMPACT_FORMAT,
+            "window_size": int(self.window_size),
+            "t_base": self.t_base,
+            "num_points": int(self.num_points),
+            "num_windows": max(self.num_points - self.window_size + 1, 0),
+            "num_valid": int(self.num_valid),
+            "num_vessels": len(self.vessel_codes),
+        }
+        (self.path / "meta.json").write_text(json.dumps(meta, indent=2))
+
+
+def write_compact(path, vessel_id, points, t, starts, window_size):
+    """
+    Write one month in the compact layout.
+
+    Parameters
+    ----------
+    path : Path
+        Output directory (created; existing arrays are replaced)
+    vessel_id : np.ndarray
+        int32 vessel code per point, sorted by vessel then time
+    points : np.ndarray
+        float32 [N, 4] point features in the same order
+    t : np.ndarray
+        int64 epoch-ms time of every point
+    starts : np.ndarray
+        int64 start offsets of the valid windows, ascending
+    window_size : int
+        Points per window
+    """
+    vessel_id = np.asarray(vessel_id)
+    t = np.asarray(t, dtype=np.int64)
+    writer = CompactWriter(
+        path, len(vessel_id), window_size,
+        t_base=t.min() if len(t) else 0, t_max=t.max() if len(t) else 0,
+    )
+    writer.append_points(vessel_id, points, t)
+    writer.append_starts(starts, vessel_id[starts])
+    writer.close()
+
+
+class CompactWindows:
+    """
+    Read side of the compact layout.
+
+    ``windows[i]`` is window ``i`` of the dense layout, valid or not, as a
+    [window_size, 5] view; ``valid_starts`` lists the valid ones. Nothing is
+    copied unless a gather (fancy index) is requested.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+        fmt = self.meta.get("format")
+        if fmt not in (COMPACT_FORMAT, _LEGACY_COMPACT_FORMAT):
+            raise ValueError(f"{self.path}: unsupported format {fmt!r}")
+
+        self.window_size = self.meta["window_size"]
+        self.vessel_id = _read_array(self.path / "vessel_id.zarr")
+        points = _read_array(self.path / "points.zarr")
+        if fmt == COMPACT_FORMAT:
+            self.t_base = int(self.meta["t_base"])
+            self.t = _read_array(self.path / "t.zarr")
+        else:
+            # format 1: float32 epoch ms in channel 4
+            self.t_base = 0
+            self.t = points[:, 4].astype(np.int64)
+        self.points = np.empty((len(points), 5), dtype=np.float32)
+        self.points[:, :4] = points[:, :4]
+        self.points[:, 4] = report_gaps(self.vessel_id, self.t.astype(np.int64))
+        self.index = ValidIndex.read(self.path)
+        self.valid_starts = self.index.starts
+
+        # [N - window_size + 1, window_size, 5] strided view
+        self.windows = np.lib.stride_tricks.sliding_window_view(
+            self.points, self.window_size, axis=0
+        ).transpose(0, 2, 1)
+
+        self._valid_mask = None
+
+    @property
+    def num_windows(self) -> int:
+        return self.windows.shape[0]
+
+    @property
+    def num_valid(self) -> int:
+        return len(self.valid_starts)
+
+    @property
+    def valid_mask(self) -> np.ndarray:
+        if self._valid_mask is None:
+            mask = np.zeros(self.num_windows, dtype=bool)
+            mask[self.valid_starts] = True
+            self._valid_mask = mask
+        return self._valid_mask
+
+    def window_t0(self, index=slice(None)) -> np.ndarray:
+        """
+        Epoch-ms start time (int64) of windows ``index``.
+        """
+        return self.t_base + self.t[:self.num_windows][index].astype(np.int64)
+
+    def vids(self, index=slice(None)) -> np.ndarray:
+        """
+        Dense-layout vids for ``index``: vessel code, or -1 when invalid.
+        """
+        vid = self.vessel_id[:self.num_windows][index]
+        return np.where(self.valid_mask[index], vid, -1).astype(np.int32)
+
+    def valid_batch(self, first: int, count: int) -> np.ndarray:
+        """
+        Valid windows ``first .. first + count`` (in valid order), gathered
+        into a new [count, window_size, 5] array.
+        """
+        return self.windows[self.valid_starts[first:first + count]]
+
+    def iter_valid_runs(self, max_batch: int = 65536):
+        """
+        Yield (start, view) for runs of consecutive valid windows, at most
+        ``max_batch`` windows each. Views are zero-copy.
+        """
+        starts = self.valid_starts
+        if not len(starts):
+            return
+        breaks = np.flatnonzero(np.diff(starts) != 1) + 1
+        for run in np.split(starts, breaks):
+            for lo in range(0, len(run), max_batch):
+                first = int(run[lo])
+                n = min(max_batch, len(run) - lo)
+                yield first, self.windows[first:first + n]
+
+
+class _Ready:
+    """
+    Stand-in for a TensorStore future/read result.
+    """
+
+    def __init__(self, value):
+        self._value = value
+
+    def read(self):
+        return self
+
+    def result(self):
+        return self._value
+
+
+class WindowsCompat:
+    """
+    Dense ``windows_*.zarr`` view over a compact store for code written
+    against TensorStore: ``shape``, ``dtype`` and ``store[idx].read().result()``.
+    Invalid windows read as zeros, as the kernel writes them.
+    """
+
+    def __init__(self, compact: CompactWindows):
+        self.compact = compact
+        self.shape = compact.windows.shape
+        self.dtype = compact.points.dtype
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        first, rest = index[0], index[1:]
+        if isinstance(first, (int, np.integer)):
+            out = np.array(self.compact.windows[first])
+            if not self.compact.valid_mask[first]:
+                out[...] = 0
+        else:
+            out = np.array(self.compact.windows[first])
+            out[~self.compact.valid_mask[first]] = 0
+            rest = (slice(None),) + rest
+        return _Ready(out[rest] if rest else out)
+
+
+class VidsCompat:
+    """
+    Dense ``vids_*.zarr`` view over a compact store.
+    """
+
+    def __init__(self, compact: CompactWindows):
+        self.compact = compact
+        self.shape = (compact.num_windows,)
+        self.dtype = np.dtype(np.int32)
+
+    def __getitem__(self, index):
+        return _Ready(self.compact.vids(index))
+
+
+def open_compact(path):
+    """
+    Open a compact month directory as (windows, vids) compatibility stores.
+    """
+    compact = CompactWindows(path)
+    return WindowsCompat(compact), VidsCompat(compact)
+
+
+class WindowSampler:
+    """
+    Chunk-aligned, batched window reads from one processed month (dense
+    ``windows_*.zarr`` or a compact directory).
+
+    Requested ids are sorted and grouped by storage chunk (1024 windows in
+    the dense layout, POINT_CHUNK points in the compact one); each group is
+    one read of the span it covers, restricted to ``channel`` when given.
+    At most ``max_in_flight`` reads are outstanding at a time.
+    """
+
+    def __init__(self, path, max_in_flight: int = 16):
+        self.path = Path(path)
+        self.max_in_flight = max_in_flight
+        self.compact = is_compact(self.path)
+
+        if self.compact:
+            self.meta = json.loads((self.path / "meta.json").read_text())
+            self.window_size = self.meta["window_size"]
+            self.num_windows = self.meta["num_windows"]
+            self.store = ts.open(_zarr_spec(self.path / "points.zarr"), open=True).result()
+            self.vid_store = ts.open(_zarr_spec(self.path / "vessel_id.zarr"), open=True).result()
+            if self.meta.get("format") == COMPACT_FORMAT:
+                self.t_base = int(self.meta["t_base"])
+                self.t_store = ts.open(_zarr_spec(self.path / "t.zarr"), open=True).result()
+            else:
+                # format 1: float32 epoch ms in channel 4 of the points
+                self.t_base = 0
+                self.t_store = self.store[..., 4]
+        else:
+            self.store = ts.open(_zarr_spec(self.path), open=True).result()
+            self.window_size = self.store.shape[1]
+            self.num_windows = self.store.shape[0]
+        self.chunk = self.store.chunk_layout.read_chunk.shape[0]
+
+        index_dir = valid_index_path(self.path)
+        self.index = ValidIndex.read(index_dir) if (index_dir / "starts.zarr").exists() else None
+
+    def _read_group(self, lo, hi, channel):
+        # futures (features, times, vessels) for windows lo .. hi - 1 (hi exclusive)
+        if not self.compact:
+            span = self.store[lo:hi]
+            return (span if channel is None else span[..., channel]).read(), None, None
+
+        end = hi + self.window_size - 1
+        features = None
+        if channel is None:
+            features = self.store[lo:end, :4].read()
+        elif channel != 4:
+            features = self.store[lo:end, channel].read()
+        if channel not in (None, 4):
+            return features, None, None
+        # gaps need the report before the span
+        first = max(lo - 1, 0)
+        return features, self.t_store[first:end].read(), self.vid_store[first:end].read()
+
+    def _windows(self, features, times, vessels, ids, lo, channel):
+        if not self.compact:
+            return features[ids - lo]
+        if times is not None:
+            gaps = report_gaps(vessels, times.astype(np.int64))
+            gaps = gaps[1:] if lo > 0 else gaps
+            if channel == 4:
+                features = gaps
+            elif features is not None:
+                features = np.concatenate([features, gaps[:, None]], axis=1)
+        # points span -> [n, window_size(, channels)] rows of the requested windows
+        view = np.lib.stride_tricks.sliding_window_view(features, self.window_size, axis=0)
+        if view.ndim == 3:
+            view = view.transpose(0, 2, 1)
+        return view[ids - lo]
+
+    def read(self, ids, channel: int = None) -> np.ndarray:
+        """
+        Windows ``ids`` (any order, duplicates allowed) as
+        [len(ids), window_size] for one channel or [len(ids), window_size, 5].
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+        shape = (len(ids), self.window_size) + (() if channel is not None else (5,))
+        out = np.empty(shape, dtype=np.float32)
+        if not len(ids):
+            return out
+
+        chunks = sorted_ids // self.chunk
+        bounds = np.flatnonzero(np.r_[True, chunks[1:] != chunks[:-1], True])
+        groups = [(bounds[g], bounds[g + 1]) for g in range(len(bounds) - 1)]
+
+        in_flight = []
+
+        def collect(item):
+            a, b, lo, futures = item
+            out[order[a:b]] = self._windows(
+                *(None if f is None else f.result() for f in futures), sorted_ids[a:b], lo, channel
+            )
+
+        for a, b in groups:
+            lo, hi = int(sorted_ids[a]), int(sorted_ids[b - 1]) + 1
+            in_flight.append((a, b, lo, self._read_group(lo, hi, channel)))
+            if len(in_flight) >= self.max_in_flight:
+                collect(in_flight.pop(0))
+        for item in in_flight:
+            collect(item)
+        return out
+
+    def read_t0(self, ids) -> np.ndarray:
+        """
+        Epoch-ms start time (int64) of windows ``ids``; channel 4 of a
+        window is relative to it.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not self.compact:
+            store = ts.open(_zarr_spec(t0_path(self.path)), open=True).result()
+            return store[ids].read().result()
+        return self.t_base + self.t_store[ids].read().result().astype(np.int64)
+
+    def _candidates(self):
+        if self.index is not None:
+            return self.index.starts
+        return np.arange(self.num_windows, dtype=np.int64)
+
+    def sample_ids(self, n: int, mode: str = "uniform", per_chunk: int = None, rng=None) -> np.ndarray:
+        """
+        Sorted ids of ``n`` valid windows (all windows when the month has
+        no index).
+
+        ``uniform`` draws them independently. ``chunk_local`` draws whole
+        storage chunks at random and up to ``per_chunk`` windows inside
+        each (default 1/16 of a chunk), so the reads are few and sequential
+        at the cost of samples clustered in time.
+        """
+        rng = np.random.default_rng(rng)
+        per_chunk = per_chunk or max(1, self.chunk // 16)
+        if mode == "uniform":
+            if self.index is not None:
+                return self.index.sample_uniform(n, rng=rng)
+            n = min(n, self.num_windows)
+            return np.sort(rng.choice(self.num_windows, size=n, replace=False))
+        if mode != "chunk_local":
+            raise ValueError("mode must be 'uniform' or 'chunk_local'")
+
+        ids = self._candidates()
+        chunks = ids // self.chunk
+        starts = np.flatnonzero(np.r_[True, chunks[1:] != chunks[:-1]])
+        ends = np.r_[starts[1:], len(ids)]
+
+        picked = []
+        total = 0
+        for g in rng.permutation(len(starts)):
+            members = ids[starts[g]:ends[g]]
+            take = min(per_chunk, len(members), n - total)
+            picked.append(rng.choice(members, size=take, replace=False))
+            total += take
+            if total >= n:
+                break
+        return np.sort(np.concatenate(picked)) if picked else ids[:0]
+
+    def sample(self, n: int, channel: int = None, mode: str = "uniform", per_chunk: int = None, rng=None):
+        """
+        (ids, windows) for ``n`` sampled valid windows; see sample_ids.
+        """
+        ids = self.sample_ids(n, mode, per_chunk, rng)
+        return ids, self.read(ids, channel)